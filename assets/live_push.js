@@ -0,0 +1,38 @@
+// Browser half of the dashboard's push mode (PUSH_UPDATES in dashboard.py).
+// Frames from /api/live go straight into telemetry-store, where the
+// client-side rendering callback draws them; no callback round trip per sample.
+window.livePush = (function () {
+    let source = null;
+
+    function setProps(id, props) {
+        window.dash_clientside.set_props(id, props);
+    }
+
+    function connect(drone, rate) {
+        if (source !== null) {
+            source.close();
+        }
+        const params = new URLSearchParams({rate: rate});
+        if (drone) {
+            params.set("drone", drone);
+        }
+        source = new EventSource("/api/live?" + params.toString());
+        source.onopen = function () {
+            setProps("live-push-status", {children: "Live"});
+        };
+        source.onmessage = function (event) {
+            const frame = JSON.parse(event.data);
+            if (frame.sample) {
+                setProps("telemetry-store", {data: frame.sample});
+            }
+            setProps("live-update-text", {children: frame.text});
+        };
+        source.onerror = function () {
+            // EventSource reconnects by itself and resumes from the last frame it got
+            setProps("live-push-status", {children: "Reconnecting..."});
+        };
+        return "Connecting...";
+    }
+
+    return {connect: connect};
+})();
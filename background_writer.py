@@ -0,0 +1,151 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from metrics import NULL_HISTOGRAM, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FSYNC_NONE = 'none'
+FSYNC_PERIODIC = 'periodic'
+FSYNC_BATCH = 'batch'
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_PERIODIC, FSYNC_BATCH)
+
+_STOP = object()
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of latency samples in milliseconds, or None"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+class BackgroundWriter(threading.Thread):
+    """Moves telemetry persistence off the receive thread.
+
+    The receive loop hands decoded records to ``submit``, which never blocks:
+    when the bounded queue is full the record is dropped and counted as an
+    overflow. The writer thread drains the queue into ``sink`` in batches of
+    up to ``batch_size`` records, or whatever arrived within
+    ``batch_interval`` seconds, and flushes once per batch.
+
+    ``sink`` is any object with ``append(record, timestamp)``, ``flush()``,
+    ``fsync()`` and ``close()``, such as TelemetryLogWriter. The ``fsync``
+    policy controls durability: ``none`` leaves it to the OS, ``periodic``
+    syncs at most every ``fsync_interval`` seconds and ``batch`` syncs after
+    every batch.
+
+    With ``latency_metric`` the receive-to-persist latency of every record is
+    also recorded in a histogram of that name in the metrics REGISTRY; each
+    writer needs its own name.
+    """
+
+    def __init__(self, sink, queue_size=10000, batch_size=256, batch_interval=0.05,
+                 fsync=FSYNC_PERIODIC, fsync_interval=1.0, latency_metric=None):
+        super().__init__(name='telemetry-writer', daemon=True)
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}, expected one of {FSYNC_POLICIES}")
+        self.sink = sink
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.overflows = 0
+        self.records_written = 0
+        self.batches_written = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.write_errors = 0
+        # Receive-to-persist latency of the oldest record in each recent batch
+        self.persist_latencies = deque(maxlen=1000)
+        self.persist_histogram = NULL_HISTOGRAM
+        if latency_metric is not None:
+            self.persist_histogram = REGISTRY.histogram(
+                latency_metric, 'Time from receiving a record to flushing it to the sink')
+        self._last_fsync = time.monotonic()
+
+    def submit(self, record, timestamp):
+        """Queue a record for writing. Returns False if it was dropped."""
+        try:
+            self.queue.put_nowait((record, timestamp))
+            return True
+        except queue.Full:
+            self.overflows += 1
+            if self.overflows == 1 or self.overflows % 1000 == 0:
+                logger.warning(f"Writer queue full, {self.overflows} records dropped so far")
+            return False
+
+    def stop(self, timeout=5.0):
+        """Write out everything still queued, then close the sink"""
+        # Blocking put: the stop marker must not be lost to a full queue
+        self.queue.put(_STOP)
+        self.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'overflows': self.overflows,
+            'records_written': self.records_written,
+            'batches_written': self.batches_written,
+            'bytes_written': self.bytes_written,
+            'fsyncs': self.fsyncs,
+            'write_errors': self.write_errors,
+            'persist_latency_ms_p50': percentile(self.persist_latencies, 50),
+            'persist_latency_ms_p95': percentile(self.persist_latencies, 95),
+        }
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=max(remaining, 0)) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+
+        try:
+            self.sink.close()
+        except Exception as e:
+            logger.error(f"Error closing telemetry sink: {e}")
+        logger.info(f"Telemetry writer stopped: {self.stats()}")
+
+    def _write_batch(self, batch):
+        try:
+            for record, timestamp in batch:
+                self.bytes_written += self.sink.append(record, timestamp) or 0
+            self.sink.flush()
+            flushed_at = time.time()
+            self.persist_latencies.append(flushed_at - batch[0][1])
+            if self.persist_histogram is not NULL_HISTOGRAM:
+                for _, timestamp in batch:
+                    self.persist_histogram.observe(flushed_at - timestamp)
+            self.records_written += len(batch)
+            self.batches_written += 1
+
+            now = time.monotonic()
+            if self.fsync == FSYNC_BATCH or (
+                    self.fsync == FSYNC_PERIODIC and now - self._last_fsync >= self.fsync_interval):
+                self.sink.fsync()
+                self.fsyncs += 1
+                self._last_fsync = now
+        except Exception as e:
+            self.write_errors += 1
+            logger.error(f"Error writing telemetry batch of {len(batch)} records: {e}")
@@ -0,0 +1,279 @@
+"""End-to-end throughput and latency benchmark against the simulated drone.
+
+For every telemetry rate the recorder from main.py is started against a
+DroneSimulator on localhost and measured for receive rate, drop rate,
+receive-to-disk latency and command round-trip time, once per wire
+protocol (JSON and binary) and, with ``--analytics off,on``, once without
+and once with the analysis stages, whose heavy stages run on threads that
+share the GIL with the receive loop. Encoding and decoding a packet in each protocol
+is also timed on its own, and a recorded flight is replayed at maximum
+speed straight into the ingest path (flush_to_file and the sink). The dashboard callback is then timed on logs of
+increasing flight length. Results are written as JSON so runs can be
+compared.
+
+Usage: python benchmark.py --rates 100,500,2000 --protocols json,binary --analytics off,on --duration 5 --output benchmark_results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import main
+from background_writer import percentile
+from replay import FlightReplay, ingest_emitter
+from simulator import make_sample, start_simulator
+from snapshot import SnapshotPublisher, SnapshotStore
+from tail_reader import TailReader
+from telemetry_log import TelemetryLogReader, TelemetryLogWriter
+import wire_protocol
+
+logger = logging.getLogger(__name__)
+
+
+async def bench_pipeline(rate, duration, workdir, burst=1, loss=0.0, reorder=0.0, command_rate=5.0,
+                         protocol='json', analytics=False):
+    simulator = await start_simulator('127.0.0.1', 0, rate=rate, burst=burst, loss=loss, reorder=reorder,
+                                      protocol='json' if protocol == 'json' else 'auto')
+    port = simulator.transport.get_extra_info('sockname')[1]
+    name = f"bench_{rate:g}hz_{protocol}{'_analytics' if analytics else ''}"
+    log_path = os.path.join(workdir, f'{name}.txt')
+    config = {
+        'host': '127.0.0.1',
+        'port': port,
+        'path_to_save': log_path,
+        'protocol': 'json' if protocol == 'json' else 'auto',
+        'command_socket': os.path.join(workdir, 'commands.sock'),
+        'writer': {'fsync': 'none'},
+    }
+    if analytics:
+        config['analytics'] = {
+            'enabled': True,
+            'path': os.path.join(workdir, f'{name}.analytics.jsonl'),
+            'snapshot_path': os.path.join(workdir, f'{name}.analytics.json'),
+            'writer': {'fsync': 'none'},
+        }
+    main.config = config
+    recorder = await main.start_recorder(config, watch_commands_file=False)
+
+    started = time.monotonic()
+    commands = 0
+    while time.monotonic() - started < duration:
+        commands += 1
+        recorder.command_handler.submit({"pid_values": {"P": {"roll": float(commands)}}})
+        await asyncio.sleep(1.0 / command_rate)
+    elapsed = time.monotonic() - started
+    # Give in-flight packets and confirmations a moment to arrive
+    await asyncio.sleep(0.2)
+    simulator.transport.close()
+    recorder.close()
+    stats = recorder.stats()
+
+    latencies = []
+    seqs = set()
+    for record in TelemetryLogReader(log_path):
+        if 'sent_at' in record:
+            latencies.append(record['timestamp'] - record['sent_at'])
+            seqs.add(record['seq'])
+    generated = simulator.telemetry_seq
+    analytics_stats = stats.get('analytics', {})
+
+    return {
+        'rate_hz': rate,
+        'protocol': protocol,
+        'analytics': analytics,
+        'binary_commands': recorder.command_channel.protocol is not None,
+        'duration_s': elapsed,
+        'burst': burst,
+        'injected_loss': loss,
+        'injected_reorder': reorder,
+        'generated': generated,
+        'received': stats['receiver']['datagrams'],
+        'recorded': len(seqs),
+        'receive_packets_per_s': stats['receiver']['datagrams'] / elapsed,
+        'drop_rate': 1 - len(seqs) / generated if generated else None,
+        'writer_overflows': stats['writer']['overflows'],
+        'receive_latency_ms_p50': percentile(latencies, 50),
+        'receive_latency_ms_p95': percentile(latencies, 95),
+        'persist_latency_ms_p50': stats['writer']['persist_latency_ms_p50'],
+        'persist_latency_ms_p95': stats['writer']['persist_latency_ms_p95'],
+        'commands_submitted': commands,
+        'command_rtt_ms_p50': stats['commands']['rtt_ms_p50'],
+        'command_rtt_ms_p95': stats['commands']['rtt_ms_p95'],
+        'command_retransmits': stats['commands']['retransmits'],
+        'command_timeouts': stats['commands']['timeouts'],
+        # Samples the heavy stages skipped because their worker fell behind
+        'analytics_dropped': analytics_stats.get('dropped'),
+        # Commands from another socket than telemetry would move the drone's stream
+        'stream_redirects': simulator.redirects,
+    }
+
+
+def bench_codec(count=100000):
+    """Time encoding and decoding one telemetry packet in each wire protocol"""
+    sample = {**make_sample(1.0), 'seq': 1, 'sent_at': 1000.0}
+    codecs = {
+        'json': (lambda: json.dumps(sample).encode(), lambda data: json.loads(data.decode())),
+        'binary': (lambda: wire_protocol.encode_telemetry(sample, 1, 1000.0), wire_protocol.decode_telemetry),
+    }
+    results = []
+    for protocol, (encode, decode) in codecs.items():
+        started = time.perf_counter()
+        for _ in range(count):
+            data = encode()
+        encoded = time.perf_counter()
+        for _ in range(count):
+            decode(data)
+        decoded = time.perf_counter()
+        results.append({
+            'protocol': protocol,
+            'packet_bytes': len(data),
+            'encode_us': (encoded - started) / count * 1e6,
+            'decode_us': (decoded - encoded) / count * 1e6,
+        })
+    return results
+
+
+async def bench_replay(records, workdir, protocol='json'):
+    """Replay a flight of ``records`` samples into main.py's ingest path as fast as possible"""
+    flight_path = os.path.join(workdir, f'flight_{records}.txt')
+    if not os.path.exists(flight_path):
+        writer = TelemetryLogWriter(flight_path)
+        for i in range(records):
+            writer.append(make_sample(i * 0.005), 1000.0 + i * 0.005)
+        writer.close()
+    config = {
+        'path_to_save': os.path.join(workdir, f'replayed_{records}_{protocol}.txt'),
+        'writer': {'fsync': 'none'},
+    }
+    main.config = config
+    ingest = main.start_ingest(config)
+    replay = FlightReplay(flight_path, ingest_emitter(main.handle_telemetry, protocol), speed=None)
+    await replay.run()
+    started = time.monotonic()
+    main.stop_ingest(*ingest)
+    drained = time.monotonic() - started
+    writer_stats = ingest[0].stats()
+    return {
+        'records': records,
+        'protocol': protocol,
+        'replay_records_per_s': replay.stats()['records_per_s'],
+        'end_to_end_records_per_s': records / (replay.elapsed + drained),
+        'records_written': writer_stats['records_written'],
+        'writer_overflows': writer_stats['overflows'],
+        'persist_latency_ms_p95': writer_stats['persist_latency_ms_p95'],
+    }
+
+
+def bench_dashboard(flight_lengths, workdir, ticks=50, records_per_tick=10):
+    """Time snapshot ingest plus update_dashboard on logs holding ``flight_lengths`` records"""
+    import dashboard
+    from plotly.io.json import to_json_plotly
+
+    results = []
+    for length in flight_lengths:
+        path = os.path.join(workdir, f'dashboard_{length}.txt')
+        writer = TelemetryLogWriter(path)
+        t = 0.0
+        for _ in range(length):
+            t += 0.005
+            writer.append(make_sample(t), 1000.0 + t)
+        writer.flush()
+
+        reader = TailReader(path, max_records=200)
+        store = SnapshotStore(os.path.join(workdir, f'snapshot_{length}.json'))
+        publisher = SnapshotPublisher(store, reader, dashboard.build_snapshot)
+        dashboard.snapshot_store = store
+        dashboard.BACKGROUND_INGEST = False
+        last_tick = None
+        timings = []
+        payload_bytes = []
+        for tick in range(ticks):
+            for _ in range(records_per_tick):
+                t += 0.005
+                writer.append(make_sample(t), 1000.0 + t)
+            writer.flush()
+            started = time.perf_counter()
+            publisher.publish_once()
+            response = dashboard.update_dashboard(tick, last_tick)
+            last_tick = response[-1]
+            timings.append(time.perf_counter() - started)
+            payload_bytes.append(len(to_json_plotly(response)))
+        writer.close()
+
+        results.append({
+            'flight_records': length,
+            'file_bytes': os.path.getsize(path),
+            'callback_ms_mean': statistics.mean(timings) * 1000,
+            'callback_ms_p95': percentile(timings, 95),
+            'response_bytes_mean': statistics.mean(payload_bytes),
+        })
+    return results
+
+
+def main_cli():
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Benchmark the recorder and dashboard against a simulated drone")
+    parser.add_argument('--rates', default='100,500,2000', help="comma separated telemetry rates in Hz")
+    parser.add_argument('--protocols', default='json,binary', help="comma separated wire protocols to compare")
+    parser.add_argument('--analytics', default='off',
+                        help="comma separated off/on, e.g. off,on to compare the receive loop with analytics")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per rate")
+    parser.add_argument('--burst', type=int, default=1)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--reorder', type=float, default=0.0)
+    parser.add_argument('--flight-lengths', default='1000,10000,100000',
+                        help="comma separated record counts for the dashboard benchmark")
+    parser.add_argument('--replay-records', type=int, default=100000,
+                        help="samples in the flight replayed into the ingest path, 0 to skip")
+    parser.add_argument('--skip-dashboard', action='store_true')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    results = {
+        'created': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'codec': bench_codec(),
+        'pipeline': [],
+        'replay': [],
+        'dashboard': [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for result in results['codec']:
+            print(json.dumps(result))
+        for rate in [float(r) for r in args.rates.split(',')]:
+            for protocol in args.protocols.split(','):
+                for analytics in args.analytics.split(','):
+                    result = asyncio.run(bench_pipeline(
+                        rate, args.duration, workdir, burst=args.burst, loss=args.loss, reorder=args.reorder,
+                        protocol=protocol, analytics=analytics == 'on'))
+                    print(json.dumps(result))
+                    results['pipeline'].append(result)
+
+        if args.replay_records:
+            for protocol in args.protocols.split(','):
+                result = asyncio.run(bench_replay(args.replay_records, workdir, protocol))
+                print(json.dumps(result))
+                results['replay'].append(result)
+
+        if not args.skip_dashboard:
+            lengths = [int(n) for n in args.flight_lengths.split(',')]
+            for result in bench_dashboard(lengths, workdir):
+                print(json.dumps(result))
+                results['dashboard'].append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
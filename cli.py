@@ -0,0 +1,154 @@
+"""Single entry point for the ground station.
+
+Each subcommand imports only what it needs: ``record`` starts receiving
+without loading Dash, NumPy or watchdog (unless commands.txt is watched or
+config.json enables analytics or the shared memory ring), so telemetry is
+recorded within milliseconds of start. Import and start-up timings are
+logged, and appended as one JSON line to ``--timings`` to track them
+across versions.
+
+Usage: python cli.py record --config config.json --no-watch --timings startup.jsonl
+       python cli.py command
+       python cli.py dashboard --port 8050
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import importlib
+import json
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimings:
+    """Milliseconds from the start of cli.py to each import and start-up milestone"""
+
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.imports = {}
+        self.marks = {}
+
+    def load(self, module):
+        """Import a module and time it; modules it shares with earlier imports are not counted again"""
+        started = time.perf_counter()
+        loaded = importlib.import_module(module)
+        self.imports[module] = (time.perf_counter() - started) * 1000
+        return loaded
+
+    def mark(self, name, at=None):
+        """Record a milestone, now or at an earlier perf_counter() time ``at``"""
+        self.marks[name] = ((time.perf_counter() if at is None else at) - self.started) * 1000
+
+    def report(self):
+        return {
+            'created': time.time(),
+            'python': sys.version.split()[0],
+            'command': sys.argv[1] if len(sys.argv) > 1 else None,
+            'imports_ms': self.imports,
+            'marks_ms': self.marks,
+            'modules_loaded': len(sys.modules),
+        }
+
+    def log(self, path=None):
+        report = self.report()
+        marks = ', '.join(f"{name} {ms:.1f} ms" for name, ms in self.marks.items())
+        imports = ', '.join(f"{name} {ms:.1f} ms" for name, ms in self.imports.items())
+        logger.info(f"Start-up: {marks} (imports: {imports}; {report['modules_loaded']} modules)")
+        if path:
+            with open(path, 'a') as f:
+                f.write(json.dumps(report) + '\n')
+
+
+async def record(main, config, timings, args):
+    import asyncio
+    recorder = await main.start_recorder(config, watch_commands_file=not args.no_watch)
+    timings.mark('receiving')
+    try:
+        try:
+            received_at = await asyncio.wait_for(asyncio.shield(recorder.receiver.first_received),
+                                                 args.first_packet_timeout)
+            # When the packet arrived, not when this task got to run
+            timings.mark('first_packet', time.perf_counter() - (time.time() - received_at))
+        except asyncio.TimeoutError:
+            pass
+        timings.log(args.timings)
+        await asyncio.Event().wait()
+    finally:
+        recorder.close()
+
+
+def configure_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+
+def record_command(args, timings):
+    asyncio = timings.load('asyncio')
+    main = timings.load('main')
+    timings.mark('imported')
+    with open(args.config) as f:
+        config = json.load(f)
+    main.config = config
+    timings.mark('configured')
+    try:
+        asyncio.run(record(main, config, timings, args))
+    except KeyboardInterrupt:
+        logger.info("Shutting down recorder...")
+
+
+def command_command(args, timings):
+    command_sender = timings.load('command_sender')
+    timings.mark('imported')
+    timings.log(args.timings)
+    command_sender.main()
+
+
+def dashboard_command(args, timings):
+    dashboard = timings.load('dashboard')
+    dashboard.enable_profiling()
+    timings.mark('imported')
+    timings.log(args.timings)
+    dashboard.app.run(debug=args.debug, host=args.host, port=args.port)
+
+
+def main_cli():
+    timings = StartupTimings()
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--timings', help="append start-up timings to this file as a JSON line")
+    parser = argparse.ArgumentParser(description="Drone ground station")
+    subcommands = parser.add_subparsers(dest='subcommand', required=True)
+
+    record_parser = subcommands.add_parser('record', parents=[common],
+                                           help="record telemetry and send commands (main.py)")
+    record_parser.add_argument('--config', default='config.json')
+    record_parser.add_argument('--no-watch', action='store_true',
+                               help="do not watch commands.txt; commands still arrive from the dashboard")
+    record_parser.add_argument('--first-packet-timeout', type=float, default=60.0,
+                               help="seconds to wait for the first packet before reporting timings")
+    record_parser.set_defaults(run=record_command)
+
+    command_parser = subcommands.add_parser('command', parents=[common],
+                                            help="send commands.txt edits to the drone (command_sender.py)")
+    command_parser.set_defaults(run=command_command)
+
+    dashboard_parser = subcommands.add_parser('dashboard', parents=[common], help="serve the dashboard (dashboard.py)")
+    dashboard_parser.add_argument('--host', default='0.0.0.0')
+    dashboard_parser.add_argument('--port', type=int, default=8050)
+    dashboard_parser.add_argument('--debug', action='store_true')
+    dashboard_parser.set_defaults(run=dashboard_command)
+
+    args = parser.parse_args()
+    # Same format as main.py, which also calls basicConfig
+    configure_logging()
+    timings.mark('parsed')
+    args.run(args, timings)
+
+
+if __name__ == "__main__":
+    main_cli()
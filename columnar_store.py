@@ -0,0 +1,315 @@
+import json
+import logging
+import os
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = 'schema.json'
+CHUNKS_FILE = 'chunks.u64'
+COLUMN_SUFFIX = '.col'
+
+# Telemetry fields and the column dtype used to store them. The optional
+# position and orientation arrays are flattened into one column per axis and
+# hold NaN for samples that did not include them.
+TELEMETRY_COLUMNS = [
+    ('timestamp', '<f8'),
+    ('roll', '<f4'),
+    ('pitch', '<f4'),
+    ('throttle', '<f4'),
+    ('yaw', '<f4'),
+    ('pid_x', '<f8'),
+    ('pid_y', '<f8'),
+    ('pid_z', '<f8'),
+    ('pid_yaw', '<f8'),
+    ('position_x', '<f8'),
+    ('position_y', '<f8'),
+    ('position_z', '<f8'),
+    ('orientation_x', '<f8'),
+    ('orientation_y', '<f8'),
+    ('orientation_z', '<f8'),
+    ('orientation_w', '<f8'),
+]
+
+VECTOR_FIELDS = {
+    'position': ('position_x', 'position_y', 'position_z'),
+    'orientation': ('orientation_x', 'orientation_y', 'orientation_z', 'orientation_w'),
+}
+
+
+def flatten_record(record, timestamp):
+    """Map a telemetry dict onto flat column names; ``timestamp`` overrides the record's own"""
+    row = {'timestamp': timestamp}
+    for key, value in record.items():
+        if key == 'timestamp':
+            continue
+        if key in VECTOR_FIELDS:
+            row.update(zip(VECTOR_FIELDS[key], value))
+        else:
+            row[key] = value
+    return row
+
+
+def unflatten_row(row):
+    """Inverse of flatten_record, dropping vector fields that were not recorded"""
+    record = {}
+    for key, value in row.items():
+        if not key.startswith(('position_', 'orientation_')):
+            record[key] = value
+    for key, names in VECTOR_FIELDS.items():
+        values = [row[name] for name in names if name in row]
+        if values and not any(np.isnan(v) for v in values):
+            record[key] = values
+    return record
+
+
+def _bits_dtype(dtype):
+    """Unsigned integer dtype with the same width, used for lossless delta encoding"""
+    return np.dtype(f'<u{np.dtype(dtype).itemsize}')
+
+
+def delta_encode(values):
+    """Encode a chunk as differences of the raw bit patterns.
+
+    Working on the integer view keeps the encoding exact for floats: repeated
+    values become zero and slowly changing values become small integers.
+    """
+    bits = values.view(_bits_dtype(values.dtype))
+    return np.diff(bits, prepend=bits.dtype.type(0))
+
+
+def delta_decode(deltas, chunk_starts, dtype):
+    """Decode a column of delta-encoded chunks starting at ``chunk_starts``"""
+    total = np.cumsum(deltas, dtype=deltas.dtype)
+    # Each chunk restarts from zero, so subtract the running sum reached
+    # just before the chunk began. Unsigned arithmetic wraps, which is
+    # exactly what the encoder relied on.
+    base = np.zeros(len(chunk_starts), dtype=deltas.dtype)
+    nonzero = chunk_starts > 0
+    base[nonzero] = total[chunk_starts[nonzero] - 1]
+    lengths = np.diff(np.append(chunk_starts, len(deltas)))
+    return (total - np.repeat(base, lengths)).view(dtype)
+
+
+class ColumnarWriter:
+    """Stores telemetry as fixed-width binary columns in a directory.
+
+    Each column lives in its own ``<name>.col`` file so that a reader can map
+    it straight into a NumPy array. Rows are buffered in memory and written as
+    a chunk of at most ``chunk_rows`` rows whenever the buffer fills up or
+    ``flush`` is called; ``chunks.u64`` records the cumulative row count after
+    every chunk. Columns listed in ``delta_columns`` are delta encoded within
+    each chunk.
+
+    The writer implements the same sink interface as TelemetryLogWriter, so
+    it can be plugged into BackgroundWriter.
+    """
+
+    def __init__(self, path, columns=TELEMETRY_COLUMNS, chunk_rows=4096, delta_columns=()):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        schema_path = os.path.join(path, SCHEMA_FILE)
+
+        if os.path.exists(schema_path):
+            with open(schema_path) as f:
+                schema = json.load(f)
+            logger.info(f"Appending to existing columnar store {path}")
+        else:
+            schema = {
+                'version': 1,
+                'chunk_rows': chunk_rows,
+                'columns': [
+                    {'name': name, 'dtype': dtype, 'delta': name in delta_columns}
+                    for name, dtype in columns
+                ],
+            }
+            with open(schema_path, 'w') as f:
+                json.dump(schema, f, indent=2)
+
+        self.chunk_rows = schema['chunk_rows']
+        self.columns = schema['columns']
+        self.names = [c['name'] for c in self.columns]
+        self.row_bytes = sum(np.dtype(c['dtype']).itemsize for c in self.columns)
+        self._buffers = {c['name']: np.full(self.chunk_rows, np.nan, dtype=c['dtype'])
+                         for c in self.columns}
+        reader = ColumnarReader(path)
+        self.rows = reader.rows
+        # A crash between writing a chunk's columns and recording its row count leaves
+        # rows behind that no reader sees; cut them off so the columns stay aligned
+        dropped = self._truncate(os.path.join(path, CHUNKS_FILE), reader._chunks_read * 8)
+        for c in self.columns:
+            dropped += self._truncate(os.path.join(path, c['name'] + COLUMN_SUFFIX),
+                                      self.rows * np.dtype(c['dtype']).itemsize)
+        if dropped:
+            logger.warning(f"Dropped {dropped} bytes of unrecorded rows from {path}")
+        self._files = {c['name']: open(os.path.join(path, c['name'] + COLUMN_SUFFIX), 'ab')
+                       for c in self.columns}
+        self._chunks = open(os.path.join(path, CHUNKS_FILE), 'ab')
+        self._buffered = 0
+        self.unknown_fields = set()
+
+    def append(self, record, timestamp):
+        """Buffer one record and return the number of bytes it occupies on disk"""
+        row = flatten_record(record, timestamp)
+        i = self._buffered
+        for name, value in row.items():
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                if name not in self.unknown_fields:
+                    self.unknown_fields.add(name)
+                    logger.warning(f"Field {name} is not part of the columnar schema, ignoring it")
+                continue
+            try:
+                buffer[i] = value
+            except (TypeError, ValueError):
+                buffer[i] = np.nan
+        self._buffered += 1
+        if self._buffered == self.chunk_rows:
+            self._write_chunk()
+        return self.row_bytes
+
+    def flush(self):
+        if self._buffered:
+            self._write_chunk()
+
+    def fsync(self):
+        for f in self._files.values():
+            os.fsync(f.fileno())
+        os.fsync(self._chunks.fileno())
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._chunks.close()
+
+    @staticmethod
+    def _truncate(path, size):
+        """Cut a file down to ``size`` bytes; returns the number of bytes removed"""
+        if not os.path.exists(path) or os.path.getsize(path) <= size:
+            return 0
+        extra = os.path.getsize(path) - size
+        os.truncate(path, size)
+        return extra
+
+    def _write_chunk(self):
+        n = self._buffered
+        for column in self.columns:
+            values = self._buffers[column['name']][:n]
+            if column['delta']:
+                values = delta_encode(values)
+            f = self._files[column['name']]
+            f.write(values.tobytes())
+            f.flush()
+        # The chunk only becomes visible to readers once its row count is recorded
+        self.rows += n
+        self._chunks.write(np.uint64(self.rows).tobytes())
+        self._chunks.flush()
+        for buffer in self._buffers.values():
+            buffer.fill(np.nan)
+        self._buffered = 0
+
+
+class ColumnarReader:
+    """Exposes a store written by ColumnarWriter as NumPy arrays.
+
+    Plain columns are returned as read-only ``np.memmap`` views, so slicing
+    hours of telemetry reads only the pages that are touched. Delta encoded
+    columns have to be decoded and are returned as regular arrays.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.chunk_starts = np.zeros(0, dtype=np.int64)
+        self.columns = {}
+        self._chunks_read = 0
+        schema_path = os.path.join(path, SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            with open(schema_path) as f:
+                schema = json.load(f)
+            self.columns = {c['name']: c for c in schema['columns']}
+            self.refresh()
+
+    def __len__(self):
+        return self.rows
+
+    def refresh(self):
+        """Pick up chunks written since the last refresh. Returns the row count."""
+        chunks_path = os.path.join(self.path, CHUNKS_FILE)
+        if not os.path.exists(chunks_path):
+            return self.rows
+        # Only the entries appended since the previous refresh are read
+        with open(chunks_path, 'rb') as f:
+            f.seek(self._chunks_read * 8)
+            data = f.read()
+        count = len(data) // 8
+        if count:
+            ends = np.frombuffer(data[:count * 8], dtype='<u8').astype(np.int64)
+            starts = np.concatenate(([self.rows], ends[:-1]))
+            self.chunk_starts = np.concatenate((self.chunk_starts, starts))
+            self.rows = int(ends[-1])
+            self._chunks_read += count
+        return self.rows
+
+    def column(self, name, start=0, stop=None):
+        """Return rows [start, stop) of a column.
+
+        Plain columns come back as a zero-copy memmap slice. For delta encoded
+        columns only the chunks overlapping the range are decoded.
+        """
+        spec = self.columns[name]
+        dtype = np.dtype(spec['dtype'])
+        stop = self.rows if stop is None else min(stop, self.rows)
+        if stop <= start:
+            return np.empty(0, dtype=dtype)
+        path = os.path.join(self.path, name + COLUMN_SUFFIX)
+        if not spec['delta']:
+            return np.memmap(path, dtype=dtype, mode='r', shape=(self.rows,))[start:stop]
+
+        first = int(np.searchsorted(self.chunk_starts, start, side='right')) - 1
+        base = int(self.chunk_starts[first])
+        deltas = np.memmap(path, dtype=_bits_dtype(dtype), mode='r', shape=(self.rows,))[base:stop]
+        starts = self.chunk_starts[first:]
+        starts = starts[starts < stop] - base
+        return delta_decode(deltas, starts, dtype)[start - base:]
+
+    def time_slice(self, t0=None, t1=None, names=None):
+        """Return {column: array} for rows with t0 <= timestamp <= t1"""
+        timestamps = self.column('timestamp')
+        start = 0 if t0 is None else int(np.searchsorted(timestamps, t0, side='left'))
+        stop = self.rows if t1 is None else int(np.searchsorted(timestamps, t1, side='right'))
+        return {name: self.column(name, start, stop) for name in (names or self.columns)}
+
+    def rows_as_records(self, start, stop=None):
+        """Convert a row range back into telemetry dicts"""
+        stop = self.rows if stop is None else stop
+        data = {name: self.column(name, start, stop) for name in self.columns}
+        return [unflatten_row({name: values[i].item() for name, values in data.items()})
+                for i in range(stop - start)]
+
+
+class ColumnarTail:
+    """Polls a columnar store for new rows; a drop-in for TailReader"""
+
+    def __init__(self, path, max_records=200):
+        self.path = path
+        self.records = deque(maxlen=max_records)
+        self.reader = ColumnarReader(path)
+        self.offset = max(0, self.reader.rows - max_records)
+
+    def latest(self):
+        return self.records[-1] if self.records else None
+
+    def poll(self):
+        if not self.reader.columns:
+            self.reader = ColumnarReader(self.path)
+        rows = self.reader.refresh()
+        if rows <= self.offset:
+            return []
+        new_records = self.reader.rows_as_records(self.offset, rows)
+        self.offset = rows
+        self.records.extend(new_records)
+        return new_records
@@ -0,0 +1,216 @@
+import json
+import logging
+import time
+from collections import deque
+
+from background_writer import percentile
+from metrics import REGISTRY
+import wire_protocol
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightCommand:
+    """A command that was sent and has not been confirmed yet"""
+
+    def __init__(self, seq, payload, timeout):
+        self.seq = seq
+        self.payload = payload
+        self.timeout = timeout
+        self.first_sent = None
+        self.last_sent = None
+        self.attempts = 0
+        self.timer = None
+
+
+def decode_confirmation(data):
+    """Return the confirmation carried by a datagram from the drone, or None for telemetry and anything else.
+
+    Confirmations are binary ACKs or JSON objects with a ``status``;
+    telemetry never has one. Raises ValueError for a malformed binary ACK.
+    """
+    if wire_protocol.message_type(data) == wire_protocol.ACK:
+        return wire_protocol.decode_ack(data)
+    # Most datagrams are telemetry, which is not parsed twice
+    if b'"status"' not in data:
+        return None
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return None
+    if isinstance(message, dict) and 'status' in message:
+        return message
+    return None
+
+
+class SocketTransport:
+    """Sends to the drone from a socket owned by someone else, e.g. the telemetry receiver"""
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self._closing = False
+
+    def sendto(self, data, address=None):
+        self.sock.sendto(data, address or self.address)
+
+    def is_closing(self):
+        return self._closing or self.sock.fileno() == -1
+
+    def close(self):
+        # The socket itself is closed by its owner
+        self._closing = True
+
+
+class CommandChannel:
+    """Sends commands to the drone and matches their confirmations.
+
+    Every command is stamped with a sequence number (``seq``) and kept in an
+    in-flight table until a confirmation carrying the same ``seq`` arrives.
+    Unconfirmed commands are retransmitted after ``retransmit_timeout``
+    seconds, backing off by ``backoff`` up to ``max_retransmit_timeout``, and
+    given up after ``max_attempts`` transmissions. Sending a new command
+    supersedes anything still in flight, since only the latest setpoint
+    matters to the drone.
+
+    Commands are JSON until ``protocol`` is set to the binary protocol
+    version the drone agreed to (see wire_protocol); confirmations are
+    accepted in either encoding.
+
+    The drone streams telemetry to whichever address it last heard from,
+    so commands are sent from the telemetry socket and the receiver hands
+    confirmations to ``confirm`` (see decode_confirmation).
+    ``send_command`` may be called from any thread, e.g. the watchdog
+    observer, and never blocks.
+    """
+
+    def __init__(self, loop, retransmit_timeout=0.1, backoff=2.0,
+                 max_retransmit_timeout=1.0, max_attempts=10, rtt_samples=1000):
+        self.loop = loop
+        self.transport = None
+        self.retransmit_timeout = retransmit_timeout
+        self.backoff = backoff
+        self.max_retransmit_timeout = max_retransmit_timeout
+        self.max_attempts = max_attempts
+        self.in_flight = {}
+        self.next_seq = 1
+        # Binary protocol version negotiated with the drone, None for JSON
+        self.protocol = None
+        # Round-trip times of commands confirmed after their first transmission.
+        # Retransmitted commands are left out since the ack is ambiguous.
+        self.rtts = deque(maxlen=rtt_samples)
+        self.rtt_histogram = REGISTRY.histogram(
+            'command_rtt_seconds', 'Round-trip time of commands confirmed on the first attempt')
+
+        self.sent = 0
+        self.retransmits = 0
+        self.acks = 0
+        self.late_acks = 0
+        self.superseded = 0
+        self.timeouts = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def confirm(self, response_data, addr):
+        """Match a confirmation from decode_confirmation to the command in flight"""
+        seq = response_data.get('seq')
+        if seq is None and self.in_flight:
+            # Firmware that does not echo sequence numbers confirms the latest command
+            seq = max(self.in_flight)
+        command = self.in_flight.pop(seq, None)
+        if command is None:
+            self.late_acks += 1
+            logger.debug(f"Confirmation for command {seq} that is no longer in flight")
+            return
+
+        if command.timer is not None:
+            command.timer.cancel()
+        now = time.monotonic()
+        self.acks += 1
+        if command.attempts == 1:
+            self.rtts.append(now - command.first_sent)
+            self.rtt_histogram.observe(now - command.first_sent)
+        logger.info(f"Command {seq} confirmed by {addr} after {(now - command.first_sent) * 1000:.1f} ms "
+                    f"({command.attempts} attempt(s)): {response_data}")
+
+    def send_command(self, command):
+        """Send a command dict to the drone, superseding any unconfirmed one"""
+        self.loop.call_soon_threadsafe(self._start_command, command)
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'retransmits': self.retransmits,
+            'acks': self.acks,
+            'late_acks': self.late_acks,
+            'superseded': self.superseded,
+            'timeouts': self.timeouts,
+            'in_flight': len(self.in_flight),
+            'rtt_ms_p50': percentile(self.rtts, 50),
+            'rtt_ms_p95': percentile(self.rtts, 95),
+        }
+
+    def close(self):
+        for command in self.in_flight.values():
+            if command.timer is not None:
+                command.timer.cancel()
+        self.in_flight.clear()
+        if self.transport is not None:
+            self.transport.close()
+
+    def _start_command(self, command):
+        for old in self.in_flight.values():
+            if old.timer is not None:
+                old.timer.cancel()
+            self.superseded += 1
+            logger.debug(f"Command {old.seq} superseded before confirmation")
+        self.in_flight.clear()
+
+        seq = self.next_seq
+        self.next_seq += 1
+        if self.protocol is not None:
+            payload = wire_protocol.encode_command(command, seq, time.time())
+        else:
+            payload = json.dumps({**command, 'seq': seq}).encode()
+        in_flight = InFlightCommand(seq, payload, self.retransmit_timeout)
+        self.in_flight[seq] = in_flight
+        self._transmit(in_flight)
+
+    def _transmit(self, command):
+        if self.transport is None or self.transport.is_closing():
+            logger.warning(f"Command channel is closed, dropping command {command.seq}")
+            self.in_flight.pop(command.seq, None)
+            return
+        now = time.monotonic()
+        if command.first_sent is None:
+            command.first_sent = now
+        else:
+            self.retransmits += 1
+        command.last_sent = now
+        command.attempts += 1
+        try:
+            self.transport.sendto(command.payload)
+            self.sent += 1
+        except OSError as e:
+            # The retransmit timer tries again
+            logger.warning(f"Could not send command {command.seq}: {e}")
+        command.timer = self.loop.call_later(command.timeout, self._on_timeout, command)
+
+    def _on_timeout(self, command):
+        if self.in_flight.get(command.seq) is not command:
+            return
+        if command.attempts >= self.max_attempts:
+            self.in_flight.pop(command.seq)
+            self.timeouts += 1
+            logger.warning(f"No confirmation for command {command.seq} after {command.attempts} attempts")
+            return
+        command.timeout = min(command.timeout * self.backoff, self.max_retransmit_timeout)
+        self._transmit(command)
+
+
+def open_command_channel(loop, sock, host, port, **options):
+    """Create a CommandChannel that sends to the drone's command port from ``sock``"""
+    channel = CommandChannel(loop, **options)
+    channel.connection_made(SocketTransport(sock, (host, port)))
+    return channel
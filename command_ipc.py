@@ -0,0 +1,88 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Unix datagram socket the recorder listens on for commands from the dashboard
+COMMAND_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'drone-commands.sock')
+
+
+def drone_socket_path(drone_id):
+    """Command socket of one drone's session in the fleet recorder (fleet.py)"""
+    return os.path.join(tempfile.gettempdir(), f'drone-commands-{drone_id}.sock')
+
+
+class CommandJournal:
+    """Append-only history of commands, one JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, command, timestamp=None):
+        entry = {'timestamp': time.time() if timestamp is None else timestamp, 'command': command}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        return entry
+
+    def tail(self, n, block_size=8192):
+        """Return the last ``n`` journal entries, oldest first, reading only the end of the file"""
+        if n <= 0 or not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            data = b''
+            while end > 0 and data.count(b'\n') <= n:
+                start = max(0, end - block_size)
+                f.seek(start)
+                data = f.read(end - start) + data
+                end = start
+        lines = data.splitlines()
+        if end > 0:
+            # The first line is only partially read
+            lines = lines[1:]
+        entries = []
+        for line in lines[-n:]:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return entries
+
+
+def send_command(command, path=COMMAND_SOCKET_PATH):
+    """Hand a command to the running recorder. Raises OSError if nobody is listening."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.sendto(json.dumps(command).encode(), path)
+
+
+class CommandListener(asyncio.DatagramProtocol):
+    """Receives commands sent with send_command and passes them to ``on_command``"""
+
+    def __init__(self, on_command):
+        self.on_command = on_command
+        self.received = 0
+
+    def datagram_received(self, data, addr):
+        try:
+            command = json.loads(data.decode())
+        except Exception as e:
+            logger.warning(f"Ignoring malformed command on the command socket: {e}")
+            return
+        self.received += 1
+        self.on_command(command)
+
+
+async def open_command_listener(loop, on_command, path=COMMAND_SOCKET_PATH):
+    """Listen for local commands on a Unix datagram socket at ``path``"""
+    # A socket file left behind by a previous run would make bind fail
+    if os.path.exists(path):
+        os.unlink(path)
+    transport, listener = await loop.create_datagram_endpoint(
+        lambda: CommandListener(on_command), local_addr=path, family=socket.AF_UNIX)
+    return transport, listener
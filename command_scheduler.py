@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CommandScheduler:
+    """Coalesces bursts of command changes without ever losing the last one.
+
+    ``request()`` marks that the command changed. The scheduler thread then
+    calls ``deliver(changed=True)`` once the changes have been quiet for
+    ``debounce`` seconds (trailing edge), but no later than ``max_latency``
+    after the first undelivered change and never more often than every
+    ``min_interval`` seconds. Changes that arrive while a delivery is due are
+    folded into it and counted as coalesced.
+
+    With ``stream_rate`` set, ``deliver`` is instead called at that fixed
+    rate, with ``changed`` telling whether anything changed since the
+    previous call, so the latest setpoint is streamed continuously.
+    """
+
+    def __init__(self, deliver, debounce=0.02, min_interval=0.05, max_latency=0.1, stream_rate=None):
+        self.deliver = deliver
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.max_latency = max_latency
+        self.stream_period = 1.0 / stream_rate if stream_rate else None
+
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._first_request = 0.0
+        self._last_request = 0.0
+        self._last_delivery = float('-inf')
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='command-scheduler', daemon=True)
+
+        self.requests = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.stream_repeats = 0
+        self.worst_latency = 0.0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def request(self):
+        """Note that the command changed; safe to call from any thread"""
+        now = time.monotonic()
+        with self._cond:
+            if not self._pending:
+                self._first_request = now
+            self._pending += 1
+            self._last_request = now
+            self.requests += 1
+            self._cond.notify()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'delivered': self.delivered,
+            'coalesced': self.coalesced,
+            'stream_repeats': self.stream_repeats,
+            'worst_latency_ms': self.worst_latency * 1000,
+        }
+
+    def _due(self):
+        if self.stream_period is not None:
+            return self._last_delivery + self.stream_period
+        if not self._pending:
+            return None
+        quiet = min(self._last_request + self.debounce, self._first_request + self.max_latency)
+        return max(quiet, self._last_delivery + self.min_interval)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    due = self._due()
+                    now = time.monotonic()
+                    if due is None:
+                        self._cond.wait()
+                    elif now < due:
+                        self._cond.wait(due - now)
+                    else:
+                        break
+
+                changed = self._pending > 0
+                if changed:
+                    self.coalesced += self._pending - 1
+                    self.worst_latency = max(self.worst_latency, now - self._first_request)
+                    self.delivered += 1
+                else:
+                    self.stream_repeats += 1
+                self._pending = 0
+                self._last_delivery = now
+
+            try:
+                self.deliver(changed)
+            except Exception as e:
+                logger.error(f"Error delivering command: {e}")
@@ -6,13 +6,15 @@ from socket import socket, AF_INET, SOCK_DGRAM
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from command_scheduler import CommandScheduler
+
 class CommandHandler(FileSystemEventHandler):
-    def __init__(self, host, port):
+    def __init__(self, host, port, scheduler_options=None):
         self.host = host
         self.port = port
         self.sock = socket(AF_INET, SOCK_DGRAM)
-        self.last_modified = 0
-        self.cooldown = 0.1
+        # Edits made while a send is in progress are coalesced, never dropped
+        self.scheduler = CommandScheduler(self.deliver, **(scheduler_options or {}))
         self.last_sent_command = None
         
         # Enable receiving responses
@@ -20,10 +22,10 @@ class CommandHandler(FileSystemEventHandler):
         
     def on_modified(self, event):
         if not event.is_directory and event.src_path.endswith('commands.txt'):
-            current_time = time.time()
-            if current_time - self.last_modified < self.cooldown:
-                return
-            self.last_modified = current_time
+            self.scheduler.request()
+
+    def deliver(self, changed):
+        if changed:
             self.send_latest_command()
 
     def send_latest_command(self):
@@ -84,7 +86,8 @@ def main():
         logging.error(f"Error loading config: {e}")
         return
 
-    command_handler = CommandHandler(config['host'], config['port'])
+    command_handler = CommandHandler(config['host'], config['port'], config.get('scheduler'))
+    command_handler.scheduler.start()
     observer = Observer()
     observer.schedule(command_handler, path='.', recursive=False)
     observer.start()
@@ -97,6 +100,7 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
+        command_handler.scheduler.stop()
         command_handler.sock.close()
         logging.info("Shutting down command sender...")
 
@@ -0,0 +1,397 @@
+"""Convert legacy measurement logs into a compressed columnar archive.
+
+Each input file is one flight. Files are split into byte ranges that are
+parsed in parallel by a process pool, streaming each range in blocks. Both
+concatenated JSON records and CSV rows written by ``use_json=False`` runs
+are understood, in any mix. Records are normalised to the columnar schema
+(position and orientation become one column per axis, NaN when missing) and
+written per range as a Parquet file when pyarrow is installed, otherwise as
+a compressed NumPy ``.npz`` file with the same columns.
+
+Archive layout::
+
+    <output>/catalog.json              one metadata entry per flight
+    <output>/<flight>/metadata.json
+    <output>/<flight>/part-00000.parquet (or .npz)
+
+Usage: python convert_logs.py old_logs/ --output archive --workers 8
+"""
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from columnar_store import TELEMETRY_COLUMNS, flatten_record
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = 'catalog.json'
+METADATA_FILE = 'metadata.json'
+COLUMN_NAMES = [name for name, _ in TELEMETRY_COLUMNS]
+
+# Where a record may start: a JSON object or CSV header right after a closing
+# brace, or a line holding a JSON object, CSV row or CSV header
+RECORD_START = re.compile(rb'}\s*(?={|timestamp,)|\n(?=[-\d{]|timestamp,)')
+RECORD_START_TEXT = re.compile(RECORD_START.pattern.decode())
+CSV_HEADER = re.compile(rb'(?:^|(?<=[}\n]))timestamp,[^\n]*')
+
+
+def have_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def find_record_start(f, offset, size, block_size=1 << 20):
+    """Return the first record start at or after ``offset``.
+
+    Every worker uses the same rule, so ranges split at arbitrary offsets
+    neither overlap nor leave records out.
+    """
+    if offset <= 0:
+        return 0
+    position = offset - 1
+    while position < size:
+        f.seek(position)
+        block = f.read(block_size)
+        match = RECORD_START.search(block)
+        if match is not None:
+            return position + match.end()
+        # Overlap blocks a little so a brace followed by whitespace is not cut
+        position += max(1, len(block) - 64)
+    return size
+
+
+def scan_csv_headers(path, block_size=1 << 20, max_header=4096):
+    """Return [(offset, header line)] for every CSV header in the file"""
+    headers = []
+    with open(path, 'rb') as f:
+        base = 0
+        text = b''
+        while True:
+            block = f.read(block_size)
+            text += block
+            # Headers end with a newline, so only scan up to the last one until EOF
+            limit = len(text) if not block else text.rfind(b'\n') + 1
+            # After the first block, text[0] is context for the lookbehind only
+            for match in CSV_HEADER.finditer(text, 0 if base == 0 else 1, max(limit, 1)):
+                headers.append((base + match.start(), match.group().decode('utf-8', 'replace')))
+            if not block:
+                return headers
+            # A header cannot start more than max_header bytes before a newline
+            keep = max(limit, len(text) - max_header, 1) - 1
+            base += keep
+            text = text[keep:]
+
+
+def parse_csv_header(line):
+    # Rows line up with the header as written, including the duplicated
+    # timestamp and trailing newline of logs resumed by old recorders
+    return [name.strip() for name in line.split(',')]
+
+
+def split_csv_row(line):
+    """Split a CSV row on commas outside the brackets of list values"""
+    fields = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(line):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            fields.append(line[start:i])
+            start = i + 1
+    fields.append(line[start:])
+    return fields
+
+
+def parse_csv_value(text):
+    text = text.strip()
+    if not text or text == 'None':
+        return None
+    if text.startswith('['):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def csv_record(header, line):
+    record = {}
+    for name, text in zip(header, split_csv_row(line)):
+        if name and name not in record:
+            value = parse_csv_value(text)
+            if value is not None:
+                record[name] = value
+    return record
+
+
+def iter_range_records(f, start, end, header, stats, block_size=1 << 20):
+    """Yield records starting in the byte range start..end of a mixed JSON/CSV log"""
+    decoder = json.JSONDecoder()
+    f.seek(start)
+    remaining = end - start
+    pending = ''
+    while True:
+        block = f.read(min(block_size, remaining))
+        remaining -= len(block)
+        final = remaining <= 0 or not block
+        text = pending + block.decode('utf-8', 'replace')
+        pos = 0
+        length = len(text)
+        while True:
+            while pos < length and text[pos].isspace():
+                pos += 1
+            if pos >= length:
+                break
+            if text[pos] == '{':
+                try:
+                    record, pos = decoder.raw_decode(text, pos)
+                except json.JSONDecodeError:
+                    match = RECORD_START_TEXT.search(text, pos)
+                    if match is None and not final:
+                        # Record continues in the next block
+                        break
+                    stats['malformed'] += 1
+                    pos = length if match is None else match.end()
+                    continue
+                if isinstance(record, dict):
+                    stats['json_records'] += 1
+                    yield record
+                continue
+            newline = text.find('\n', pos)
+            if newline < 0 and not final:
+                break
+            line_end = length if newline < 0 else newline
+            line = text[pos:line_end]
+            pos = line_end + 1
+            if line.startswith('timestamp,'):
+                header = parse_csv_header(line)
+            elif header is None:
+                stats['malformed'] += 1
+            else:
+                stats['csv_records'] += 1
+                yield csv_record(header, line)
+        pending = text[pos:]
+        if final:
+            if pending.strip():
+                stats['malformed'] += 1
+            return
+
+
+def convert_range(path, start, end, header, part_path, file_format, block_size=1 << 20):
+    """Worker: convert one byte range of a log into one part file and return its stats"""
+    started = time.perf_counter()
+    stats = {'json_records': 0, 'csv_records': 0, 'malformed': 0}
+    columns = {name: [] for name in COLUMN_NAMES}
+    extra_fields = set()
+    nan = float('nan')
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = find_record_start(f, start, size)
+        end = find_record_start(f, end, size)
+        for record in iter_range_records(f, start, end, header, stats, block_size):
+            try:
+                row = flatten_record(record, record.get('timestamp', nan))
+            except (TypeError, ValueError):
+                stats['malformed'] += 1
+                continue
+            for name, values in columns.items():
+                value = row.get(name, nan)
+                values.append(value if isinstance(value, (int, float)) else nan)
+            extra_fields.update(name for name in row if name not in columns)
+
+    arrays = {name: np.array(values, dtype=dtype) for (name, dtype), values
+              in zip(TELEMETRY_COLUMNS, columns.values())}
+    rows = len(arrays['timestamp'])
+    if rows:
+        write_part(part_path, arrays, file_format)
+    timestamps = arrays['timestamp'][~np.isnan(arrays['timestamp'])]
+    return dict(
+        stats,
+        part=os.path.basename(part_path) if rows else None,
+        rows=rows,
+        bytes=end - start,
+        seconds=time.perf_counter() - started,
+        first_timestamp=float(timestamps.min()) if len(timestamps) else None,
+        last_timestamp=float(timestamps.max()) if len(timestamps) else None,
+        present={name: int(np.count_nonzero(~np.isnan(values))) for name, values in arrays.items()},
+        extra_fields=sorted(extra_fields),
+    )
+
+
+def write_part(part_path, arrays, file_format):
+    if file_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table(arrays), part_path, compression='zstd')
+    else:
+        np.savez_compressed(part_path, **arrays)
+
+
+def flight_name(path, root):
+    relative = os.path.relpath(path, root) if root else os.path.basename(path)
+    return os.path.splitext(relative)[0].replace(os.sep, '__')
+
+
+def plan_ranges(path, chunk_bytes):
+    size = os.path.getsize(path)
+    count = max(1, math.ceil(size / chunk_bytes))
+    return [(i * chunk_bytes, min(size, (i + 1) * chunk_bytes)) for i in range(count)]
+
+
+def header_at(headers, offset):
+    """The CSV header in effect for records starting at ``offset``"""
+    current = None
+    for header_offset, line in headers:
+        if header_offset >= offset:
+            break
+        current = parse_csv_header(line)
+    return current
+
+
+def merge_flight(name, path, results, file_format):
+    present = {}
+    for result in results:
+        for column, count in result['present'].items():
+            present[column] = present.get(column, 0) + count
+    firsts = [r['first_timestamp'] for r in results if r['first_timestamp'] is not None]
+    lasts = [r['last_timestamp'] for r in results if r['last_timestamp'] is not None]
+    return {
+        'flight': name,
+        'source': os.path.abspath(path),
+        'source_bytes': os.path.getsize(path),
+        'source_mtime': os.path.getmtime(path),
+        'format': file_format,
+        'parts': [r['part'] for r in results if r['part']],
+        'rows': sum(r['rows'] for r in results),
+        'json_records': sum(r['json_records'] for r in results),
+        'csv_records': sum(r['csv_records'] for r in results),
+        'malformed': sum(r['malformed'] for r in results),
+        'start': min(firsts) if firsts else None,
+        'end': max(lasts) if lasts else None,
+        'duration': max(lasts) - min(firsts) if firsts else None,
+        'columns': {name: {'dtype': dtype, 'present': present.get(name, 0)} for name, dtype in TELEMETRY_COLUMNS},
+        'extra_fields': sorted({field for r in results for field in r['extra_fields']}),
+        'converted': time.time(),
+    }
+
+
+def convert(paths, output, workers=None, chunk_bytes=64 << 20, file_format='auto', root=None):
+    """Convert ``paths`` into an archive under ``output`` and return the catalog"""
+    if file_format == 'auto':
+        file_format = 'parquet' if have_pyarrow() else 'npz'
+    suffix = '.parquet' if file_format == 'parquet' else '.npz'
+    os.makedirs(output, exist_ok=True)
+
+    started = time.perf_counter()
+    catalog = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        all_headers = list(pool.map(scan_csv_headers, paths))
+        jobs = []
+        for path, headers in zip(paths, all_headers):
+            name = flight_name(path, root)
+            os.makedirs(os.path.join(output, name), exist_ok=True)
+            futures = [
+                pool.submit(convert_range, path, start, end, header_at(headers, start),
+                            os.path.join(output, name, f'part-{i:05d}{suffix}'), file_format)
+                for i, (start, end) in enumerate(plan_ranges(path, chunk_bytes))
+            ]
+            jobs.append((name, path, futures))
+
+        for name, path, futures in jobs:
+            results = [future.result() for future in futures]
+            metadata = merge_flight(name, path, results, file_format)
+            with open(os.path.join(output, name, METADATA_FILE), 'w') as f:
+                json.dump(metadata, f, indent=2)
+            catalog.append(metadata)
+            logger.info(f"{name}: {metadata['rows']} records ({metadata['csv_records']} CSV, "
+                        f"{metadata['malformed']} malformed) from {metadata['source_bytes'] / 1e6:.1f} MB")
+
+    elapsed = time.perf_counter() - started
+    with open(os.path.join(output, CATALOG_FILE), 'w') as f:
+        json.dump(catalog, f, indent=2)
+    total_bytes = sum(entry['source_bytes'] for entry in catalog)
+    total_rows = sum(entry['rows'] for entry in catalog)
+    return catalog, {
+        'flights': len(catalog),
+        'rows': total_rows,
+        'source_bytes': total_bytes,
+        'seconds': elapsed,
+        'mb_per_s': total_bytes / 1e6 / elapsed if elapsed else None,
+        'rows_per_s': total_rows / elapsed if elapsed else None,
+        'format': file_format,
+    }
+
+
+def load_flight(archive, name):
+    """Read a converted flight back as {column: array}"""
+    with open(os.path.join(archive, name, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    parts = []
+    for part in metadata['parts']:
+        part_path = os.path.join(archive, name, part)
+        if metadata['format'] == 'parquet':
+            import pyarrow.parquet as pq
+            table = pq.read_table(part_path)
+            parts.append({column: table.column(column).to_numpy() for column in table.column_names})
+        else:
+            with np.load(part_path) as data:
+                parts.append({column: data[column] for column in data.files})
+    if not parts:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in TELEMETRY_COLUMNS}
+    return {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+
+
+def main_cli():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Convert legacy telemetry logs into a columnar archive")
+    parser.add_argument('inputs', nargs='+', help="log files or directories of logs")
+    parser.add_argument('--output', default='archive')
+    parser.add_argument('--pattern', default='*.txt', help="file pattern used inside input directories")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-mb', type=float, default=64.0, help="split files into ranges of this size")
+    parser.add_argument('--format', choices=('auto', 'parquet', 'npz'), default='auto')
+    args = parser.parse_args()
+
+    paths = []
+    root = None
+    for item in args.inputs:
+        if os.path.isdir(item):
+            root = item
+            paths.extend(sorted(glob.glob(os.path.join(item, '**', args.pattern), recursive=True)))
+        else:
+            paths.append(item)
+    if not paths:
+        parser.error("no input files found")
+    if len(args.inputs) > 1:
+        # Flight names must stay unique across several inputs
+        root = os.path.commonpath([os.path.abspath(p) for p in paths])
+        paths = [os.path.abspath(p) for p in paths]
+
+    _, summary = convert(paths, args.output, args.workers, int(args.chunk_mb * (1 << 20)), args.format, root)
+    print(f"Converted {summary['flights']} flights, {summary['rows']} records, "
+          f"{summary['source_bytes'] / 1e6:.1f} MB in {summary['seconds']:.2f} s: "
+          f"{summary['mb_per_s']:.1f} MB/s, {summary['rows_per_s']:.0f} records/s ({summary['format']})")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,200 @@
+import logging
+import operator
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RowEncoder:
+    """Formats the records of one schema as CSV rows.
+
+    The format string and the item getter are built once per schema, so
+    encoding a record is a single ``str.format`` call. Values are written
+    with ``str()``, as the recorder always has; list values keep their
+    brackets, which convert_logs.py relies on to split rows.
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.header = ','.join(('timestamp',) + self.columns) + '\n'
+        self.template = ','.join(['{}'] * (len(self.columns) + 1)) + '\n'
+        if len(self.columns) > 1:
+            self.getter = operator.itemgetter(*self.columns)
+        elif self.columns:
+            # itemgetter returns a bare value instead of a tuple for one key
+            getter = operator.itemgetter(*self.columns)
+            self.getter = lambda record: (getter(record),)
+        else:
+            self.getter = lambda record: ()
+
+    def encode(self, record, timestamp):
+        """Encode a record that has every column"""
+        return self.template.format(timestamp, *self.getter(record))
+
+    def encode_partial(self, record, timestamp):
+        """Encode a record with missing columns, leaving their cells empty"""
+        return self.template.format(timestamp, *[record.get(name, '') for name in self.columns])
+
+
+class SchemaRegistry:
+    """Compiled RowEncoders per schema, and how each record layout fits them.
+
+    A layout is the sequence of keys of a record. Firmware sends the same
+    layout in every packet, so checking a record against the file's schema
+    is one dict lookup after the first packet.
+    """
+
+    def __init__(self):
+        self._encoders = {}
+        self._fits = {}
+
+    def encoder(self, columns):
+        columns = tuple(columns)
+        encoder = self._encoders.get(columns)
+        if encoder is None:
+            encoder = self._encoders[columns] = RowEncoder(columns)
+        return encoder
+
+    def fit(self, columns, keys):
+        """Return (unknown keys, number of missing columns) of a record layout"""
+        fit = self._fits.get((columns, keys))
+        if fit is None:
+            known = set(columns)
+            # The receive time always goes in the leading timestamp column
+            unknown = tuple(key for key in keys if key not in known and key != 'timestamp')
+            missing = len(known.difference(keys))
+            fit = self._fits[(columns, keys)] = (unknown, missing)
+        return fit
+
+
+def series_path(path, index):
+    """Path of file ``index`` of a CSV series: measurements.txt, measurements.1.txt, ..."""
+    if index == 0:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+def read_header(path):
+    """Return the columns of a CSV log's header, or None if it has no usable header"""
+    with open(path) as f:
+        line = f.readline()
+    names = [name.strip() for name in line.rstrip('\n').split(',')]
+    # Logs resumed by older recorders repeat timestamp or end a name with the newline
+    if not line.endswith('\n') or names[0] != 'timestamp' or len(set(names)) != len(names) or '' in names:
+        return None
+    return names[1:]
+
+
+class CsvLogWriter:
+    """Writes telemetry as CSV with one fixed schema per file.
+
+    The first record fixes the columns. Records missing some of them get
+    empty cells. A record with keys the schema does not have starts the
+    next file of the series (see series_path) with the extended schema, so
+    rows never shift under the wrong header. Both kinds of drift are
+    counted, and warned about at most once every ``warn_interval`` seconds.
+
+    On start the writer appends to the last file of the series if its
+    header is intact, and otherwise starts a new file. It implements the
+    sink interface of BackgroundWriter.
+    """
+
+    def __init__(self, path, warn_interval=60.0, registry=None):
+        self.path = path
+        self.warn_interval = warn_interval
+        self.registry = registry or SchemaRegistry()
+        self.columns = None
+        self.encoder = None
+        self._file = None
+        self._last_warning = {}
+
+        self.missing_fields = 0
+        self.records_with_missing_fields = 0
+        self.unknown_fields = 0
+        self.schema_changes = 0
+
+        self.index = 0
+        while os.path.exists(series_path(path, self.index + 1)):
+            self.index += 1
+        self.current_path = series_path(path, self.index)
+        if os.path.exists(self.current_path) and os.path.getsize(self.current_path) > 0:
+            columns = read_header(self.current_path)
+            if columns is not None:
+                self._use_schema(columns)
+                self._file = open(self.current_path, 'a')
+                logger.info(f"Appending to {self.current_path} with columns {columns}")
+            else:
+                logger.warning(f"{self.current_path} has no usable CSV header, starting a new file")
+                self.index += 1
+                self.current_path = series_path(path, self.index)
+
+    def append(self, record, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        keys = tuple(record)
+        if self.columns is None:
+            self._start_file(tuple(key for key in keys if key != 'timestamp'))
+        unknown, missing = self.registry.fit(self.columns, keys)
+        if unknown:
+            self.unknown_fields += len(unknown)
+            self.schema_changes += 1
+            self._warn('unknown', f"New fields {list(unknown)} in telemetry, starting a new CSV file "
+                                  f"({self.schema_changes} schema changes so far)")
+            self.index += 1
+            self.current_path = series_path(self.path, self.index)
+            self._start_file(self.columns + unknown)
+            missing = self.registry.fit(self.columns, keys)[1]
+        if missing:
+            self.missing_fields += missing
+            self.records_with_missing_fields += 1
+            self._warn('missing', f"{self.records_with_missing_fields} records with missing fields so far "
+                                  f"({self.missing_fields} empty cells)")
+            line = self.encoder.encode_partial(record, timestamp)
+        else:
+            line = self.encoder.encode(record, timestamp)
+        self._file.write(line)
+        return len(line)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def fsync(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        logger.info(f"CSV log closed: {self.stats()}")
+
+    def stats(self):
+        return {
+            'path': self.current_path,
+            'columns': len(self.columns or ()),
+            'missing_fields': self.missing_fields,
+            'records_with_missing_fields': self.records_with_missing_fields,
+            'unknown_fields': self.unknown_fields,
+            'schema_changes': self.schema_changes,
+        }
+
+    def _use_schema(self, columns):
+        self.encoder = self.registry.encoder(columns)
+        self.columns = self.encoder.columns
+
+    def _start_file(self, columns):
+        if self._file is not None:
+            self._file.close()
+        self._use_schema(columns)
+        self._file = open(self.current_path, 'a')
+        self._file.write(self.encoder.header)
+
+    def _warn(self, kind, message):
+        now = time.monotonic()
+        last = self._last_warning.get(kind)
+        if last is None or now - last >= self.warn_interval:
+            self._last_warning[kind] = now
+            logger.warning(message)
@@ -1,325 +1,788 @@
 import dash
-from dash import dcc, html
+from dash import Patch, dcc, html, no_update
 from dash.dependencies import Input, Output, State
-import pandas as pd
+import numpy as np
 import os
 import json
+import threading
 import time
+import urllib.request
+
+from columnar_store import ColumnarTail
+from live_push import register_push_routes
+from command_ipc import COMMAND_SOCKET_PATH, CommandJournal, drone_socket_path, send_command
+from metrics import histogram_quantile
+from profiling import make_profiler, register_profile_routes
+from query_service import register_query_routes
+from shm_ring import SHM_NAME, ShmRingTail
+from snapshot import SNAPSHOT_DIR, SnapshotPublisher, SnapshotStore
+from tail_reader import TailReader
+from telemetry_pipeline import ANALYTICS_SNAPSHOT_PATH
+from timeseries_store import TimeSeriesStore
+from wire_protocol import PID_AXES, PID_TERMS
 
 # Paths to the telemetry and command text files
 FILE_PATH = os.path.join(os.path.dirname(__file__), "measurements.txt")
 COMMAND_FILE_PATH = os.path.join(os.path.dirname(__file__), "commands.txt")
+# Append-only command history; commands.txt is only rewritten when mirroring is enabled
+COMMAND_JOURNAL_PATH = os.path.join(os.path.dirname(__file__), "commands.jsonl")
+MIRROR_COMMANDS_TXT = False
+COMMAND_HISTORY_SIZE = 100
+# JSON view of the recorder's metrics endpoint (config['metrics'] in main.py)
+METRICS_URL = "http://127.0.0.1:9108/metrics.json"
+# Directory written by main.py when config['sink'] is "columnar"
+COLUMNAR_PATH = os.path.join(os.path.dirname(__file__), "measurements.cols")
+
+# Per-drone recordings written by fleet.py (config['fleet']['directory']), one directory per drone
+FLEET_DIR = os.path.join(os.path.dirname(__file__), "fleet")
+
+# Recorder configuration; the dashboard only uses its 'profiling' block
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
+
+# Shared memory ring written by main.py when config['shared_memory'] is enabled
+SHM_RING_NAME = SHM_NAME
+
+def make_reader(log_path, columnar_path):
+    """Incremental reader that keeps the most recent telemetry records in memory"""
+    if os.path.isdir(columnar_path):
+        return ColumnarTail(columnar_path, max_records=200)
+    return TailReader(log_path, max_records=200)
 
-# Store trajectory data for 3D path visualization
-trajectory_data = {
-    "x": [],
-    "y": [],
-    "z": []
+# Live samples come from the recorder's shared memory ring; the log is read
+# until the ring exists, or for good if the recorder does not publish one
+telemetry_reader = ShmRingTail(SHM_RING_NAME, max_records=200, fallback=make_reader(FILE_PATH, COLUMNAR_PATH))
+
+def fleet_drones():
+    """Ids of the drones recorded by fleet.py"""
+    try:
+        return sorted(name for name in os.listdir(FLEET_DIR) if os.path.isdir(os.path.join(FLEET_DIR, name)))
+    except FileNotFoundError:
+        return []
+
+# Whole-flight history behind the history charts, written by the snapshot leader
+HISTORY_PATH = os.path.join(SNAPSHOT_DIR, "drone-dashboard-history")
+# Upper bound on points per trace sent for any time range or zoom level
+HISTORY_MAX_POINTS = 500
+HISTORY_RANGES = {"10 s": 10, "1 min": 60, "10 min": 600, "Whole flight": None}
+# Channels drawn by each history chart
+HISTORY_GRAPHS = {
+    "rc-history-graph": ("RC Commands", ["roll", "pitch", "throttle", "yaw"]),
+    "pid-history-graph": ("PID Outputs", ["pid_x", "pid_y", "pid_z", "pid_yaw"]),
+    "position-history-graph": ("Position", ["position_x", "position_y", "position_z"]),
+    "orientation-history-graph": ("Orientation", ["orientation_x", "orientation_y", "orientation_z", "orientation_w"]),
 }
 
+# Gain inputs of the command form, by (term, axis)
+GAIN_INPUTS = {(term, axis): f"{axis}-{term.lower()}-input" for term in PID_TERMS for axis in PID_AXES}
 
-# Initialize Dash app
-app = dash.Dash(__name__)
+# Number of trajectory points kept by the browser
+MAX_TRAJECTORY_POINTS = 200
+# Render figure updates in the browser; the server then only sends the new sample
+CLIENTSIDE_RENDERING = False
+# Push new samples to the browser over Server-Sent Events (/api/live) as they
+# arrive instead of polling every 100 ms; implies client-side rendering
+PUSH_UPDATES = False
+# Most frames per second pushed to one browser; snapshots in between are merged
+PUSH_MAX_RATE = 20.0
 
-# Layout of the dashboard
-app.layout = html.Div([
-    html.H1("Drone Telemetry and Command Dashboard"),
-    dcc.Interval(
-        id="interval-component",
-        interval=100,  # Refresh every 100 milliseconds
-        n_intervals=0
-    ),
-    html.Div([
-        # 3D Position visualization
-        html.Div([
-            html.H2("Drone Position (3D Path)"),
-            dcc.Graph(id="position-3d-graph"),
-        ], style={"width": "48%", "display": "inline-block"}),
+# Figures are sent to the browser once with the layout. Every tick afterwards
+# only appends new trajectory points (extendData) or patches the bar values.
+POSITION_FIGURE = {
+    "data": [
+        {
+            "x": [],
+            "y": [],
+            "z": [],
+            "type": "scatter3d",
+            "mode": "lines+markers",
+            "line": {"color": "blue", "width": 2},
+            "marker": {"size": 5, "color": "blue", "opacity": 0.8},
+        }
+    ],
+    "layout": {
+        "title": "Drone 3D Path",
+        "uirevision": "position",
+        "scene": {
+            "xaxis": {"title": "X Position", "range": [-50, 50]},  # Zoom out x-axis
+            "yaxis": {"title": "Y Position", "range": [-50, 50]},  # Zoom out y-axis
+            "zaxis": {"title": "Z Position", "range": [-50, 50]},  # Zoom out z-axis
+        }
+    }
+}
 
-        # Orientation visualization
-        html.Div([
-            html.H2("Drone Orientation"),
-            dcc.Graph(id="orientation-graph"),
-        ], style={"width": "48%", "display": "inline-block"}),
-    ]),
-    html.Div([
-        # RC Commands visualization
-        html.Div([
-            html.H2("RC Commands"),
-            dcc.Graph(id="rc-commands-graph"),
-        ], style={"width": "48%", "display": "inline-block"}),
+ORIENTATION_FIGURE = {
+    "data": [
+        {"x": ["QX", "QY", "QZ", "QW"],
+         "y": [0, 0, 0, 0],
+         "type": "bar"}
+    ],
+    "layout": {
+        "title": "Orientation Quaternion",
+        "xaxis": {"title": "Components"},
+        "yaxis": {"title": "Value"}
+    }
+}
 
-        # PID Outputs visualization
-        html.Div([
-            html.H2("PID Outputs"),
-            dcc.Graph(id="pid-graph"),
-        ], style={"width": "48%", "display": "inline-block"}),
-    ]),
-    html.Div([
-        # Live Text Display
-        html.Div([
-            html.H2("Latest Telemetry Data"),
-            html.Div(id="live-update-text"),
-        ], style={"width": "100%", "display": "inline-block", "verticalAlign": "top"}),
-    ]),
-    html.Div([
-        html.H2("Send Commands to Drone"),
-        # Flight Controls
+RC_COMMANDS_FIGURE = {
+    "data": [
+        {"x": ["Roll", "Pitch", "Throttle", "Yaw"],
+         "y": [0, 0, 0, 0],
+         "type": "bar"}
+    ],
+    "layout": {
+        "title": "RC Commands",
+        "xaxis": {"title": "Control"},
+        "yaxis": {"title": "Value", "range": [800, 2200]}  # Locked range
+    }
+}
+
+PID_FIGURE = {
+    "data": [
+        {"x": ["PID X", "PID Y", "PID Z", "PID Yaw"],
+         "y": [0, 0, 0, 0],
+         "type": "bar"}
+    ],
+    "layout": {
+        "title": "PID Outputs",
+        "xaxis": {"title": "Control"},
+        "yaxis": {"title": "Value", "range": [-100, 100]}  # Locked range
+    }
+}
+
+
+# Initialize Dash app
+app = dash.Dash(__name__)
+# Aggregated queries over the whole recording on /api/query (see query_service.py)
+register_query_routes(app.server, COLUMNAR_PATH if os.path.isdir(COLUMNAR_PATH) else FILE_PATH)
+
+def build_layout():
+    """Layout of the dashboard, built when a page is served rather than at import"""
+    return html.Div([
+        html.H1("Drone Telemetry and Command Dashboard"),
+        # Drone of the fleet recorder to show and command; empty for the single-drone recorder
+        dcc.Dropdown(id="drone-select", options=[], value=None,
+                     placeholder="Single drone recorder (measurements.txt)"),
+        dcc.Interval(
+            id="interval-component",
+            interval=100,  # Refresh every 100 milliseconds
+            n_intervals=0,
+            disabled=PUSH_UPDATES
+        ),
+        # State of the push connection (assets/live_push.js)
+        html.Div(id="live-push-status", style={"display": "block" if PUSH_UPDATES else "none"}),
+        # Latest sample, consumed by the browser when CLIENTSIDE_RENDERING is on
+        dcc.Store(id="telemetry-store"),
+        # Snapshot tick this browser session has already rendered
+        dcc.Store(id="session-tick"),
         html.Div([
-            html.H3("Flight Controls", style={"color": "#2196F3"}),
-            html.Div([
-                html.Label("Roll:"),
-                dcc.Input(id="roll-input", type="number", value=1500, placeholder="Enter Roll (1000-2000)", 
-                         min=1000, max=2000, step=1),
-            ], style={"marginBottom": "10px"}),
+            # 3D Position visualization
             html.Div([
-                html.Label("Pitch:"),
-                dcc.Input(id="pitch-input", type="number", value=1500, placeholder="Enter Pitch (1000-2000)", 
-                         min=1000, max=2000, step=1),
-            ], style={"marginBottom": "10px"}),
-            html.Div([
-                html.Label("Throttle:"),
-                dcc.Input(id="throttle-input", type="number", value=1000, placeholder="Enter Throttle (1000-2000)", 
-                         min=1000, max=2000, step=1),
-            ], style={"marginBottom": "10px"}),
+                html.H2("Drone Position (3D Path)"),
+                dcc.Graph(id="position-3d-graph", figure=POSITION_FIGURE),
+            ], style={"width": "48%", "display": "inline-block"}),
+
+            # Orientation visualization
             html.Div([
-                html.Label("Yaw:"),
-                dcc.Input(id="yaw-input", type="number", value=1500, placeholder="Enter Yaw (1000-2000)", 
-                         min=1000, max=2000, step=1),
-            ], style={"marginBottom": "20px"}),
+                html.H2("Drone Orientation"),
+                dcc.Graph(id="orientation-graph", figure=ORIENTATION_FIGURE),
+            ], style={"width": "48%", "display": "inline-block"}),
         ]),
-        
-        # PID Controls
         html.Div([
-            html.H3("PID Values", style={"color": "#4CAF50"}),
+            # RC Commands visualization
             html.Div([
-                html.Label("PID X:"),
-                dcc.Input(id="pid-x-input", type="number", value=0, placeholder="Enter PID X", step=0.1),
-            ], style={"marginBottom": "10px"}),
+                html.H2("RC Commands"),
+                dcc.Graph(id="rc-commands-graph", figure=RC_COMMANDS_FIGURE),
+            ], style={"width": "48%", "display": "inline-block"}),
+
+            # PID Outputs visualization
             html.Div([
-                html.Label("PID Y:"),
-                dcc.Input(id="pid-y-input", type="number", value=0, placeholder="Enter PID Y", step=0.1),
-            ], style={"marginBottom": "10px"}),
+                html.H2("PID Outputs"),
+                dcc.Graph(id="pid-graph", figure=PID_FIGURE),
+            ], style={"width": "48%", "display": "inline-block"}),
+        ]),
+        html.Div([
+            # Live Text Display
             html.Div([
-                html.Label("PID Z:"),
-                dcc.Input(id="pid-z-input", type="number", value=0, placeholder="Enter PID Z", step=0.1),
-            ], style={"marginBottom": "10px"}),
+                html.H2("Latest Telemetry Data"),
+                html.Div(id="live-update-text"),
+            ], style={"width": "100%", "display": "inline-block", "verticalAlign": "top"}),
+        ]),
+        html.Div([
+            # Downsampled history from the multi-resolution store
+            html.H2("Flight History"),
+            dcc.RadioItems(
+                id="history-range",
+                options=[{"label": label, "value": label} for label in HISTORY_RANGES],
+                value="1 min",
+                inline=True,
+            ),
+            dcc.Interval(id="history-interval", interval=1000, n_intervals=0),
+            # Time window the user zoomed into on any history chart, or None
+            dcc.Store(id="history-window"),
             html.Div([
-                html.Label("PID Yaw:"),
-                dcc.Input(id="pid-yaw-input", type="number", value=0, placeholder="Enter PID Yaw", step=0.1),
-            ], style={"marginBottom": "20px"}),
+                html.Div([dcc.Graph(id=graph_id)], style={"width": "48%", "display": "inline-block"})
+                for graph_id in HISTORY_GRAPHS
+            ]),
+        ]),
+        html.Div([
+            # Results of the recorder's analysis stages (config['analytics'] in main.py)
+            html.H2("Control Loop Analytics"),
+            html.Pre(id="analytics-text"),
+        ]),
+        html.Div([
+            # Recorder health, polled from the metrics endpoint
+            html.H2("Recorder Metrics"),
+            dcc.Interval(id="metrics-interval", interval=1000, n_intervals=0),
+            html.Pre(id="metrics-text"),
         ]),
-        
-        html.Button("Send Command", id="send-button", 
-                   style={"backgroundColor": "#2196F3", "color": "white", "padding": "10px 20px"}),
-        html.Div(id="command-status", style={"marginTop": "10px"}),
-        
-        # Command History
         html.Div([
-            html.H3("Command History"),
-            html.Pre(id="command-history", style={"maxHeight": "200px", "overflowY": "scroll"}),
-        ], style={"marginTop": "20px"}),
-    ], style={"marginTop": "20px", "padding": "20px", "border": "1px solid #ddd", "borderRadius": "5px"}),
-])
+            html.H2("Send Commands to Drone"),
+            # Gains sent to the drone; every one has to be filled in
+            html.Div([
+                html.H3("PID Gains", style={"color": "#FF9800"}),
+                html.Table([
+                    html.Tr([html.Th("")] + [html.Th(axis.capitalize()) for axis in PID_AXES]),
+                ] + [
+                    html.Tr([html.Th(term)] + [
+                        html.Td(dcc.Input(id=GAIN_INPUTS[term, axis], type="number", placeholder=f"{term} {axis}",
+                                          step=0.001))
+                        for axis in PID_AXES
+                    ])
+                    for term in PID_TERMS
+                ], style={"marginBottom": "20px"}),
+            ]),
+            
+            html.Button("Send Command", id="send-button", 
+                       style={"backgroundColor": "#2196F3", "color": "white", "padding": "10px 20px"}),
+            html.Div(id="command-status", style={"marginTop": "10px"}),
+            
+            # Command History
+            html.Div([
+                html.H3("Command History"),
+                html.Pre(id="command-history", style={"maxHeight": "200px", "overflowY": "scroll"}),
+            ], style={"marginTop": "20px"}),
+        ], style={"marginTop": "20px", "padding": "20px", "border": "1px solid #ddd", "borderRadius": "5px"}),
+    ])
+
+app.layout = build_layout
+
+def telemetry_text(latest_data, position, orientation):
+    return [
+        html.P(f"Roll: {latest_data['roll']}"),
+        html.P(f"Pitch: {latest_data['pitch']}"),
+        html.P(f"Throttle: {latest_data['throttle']}"),
+        html.P(f"Yaw: {latest_data['yaw']}"),
+        html.P(f"PID X: {latest_data['pid_x']}, PID Y: {latest_data['pid_y']}, "
+               f"PID Z: {latest_data['pid_z']}, PID Yaw: {latest_data['pid_yaw']}"),
+        html.P(f"Position: {position}"),
+        html.P(f"Orientation: {orientation}"),
+    ]
+
+def sample_values(latest_data):
+    """Extract the values shown in the figures from a telemetry record"""
+    return {
+        "position": latest_data.get("position", [0, 0, 0]),  # Default to [0, 0, 0] if missing
+        "orientation": latest_data.get("orientation", [0, 0, 0, 0]),  # Default to [0, 0, 0, 0] if missing
+        "rc": [float(latest_data["roll"]), float(latest_data["pitch"]),
+               float(latest_data["throttle"]), float(latest_data["yaw"])],
+        "pid": [float(latest_data["pid_x"]), float(latest_data["pid_y"]),
+                float(latest_data["pid_z"]), float(latest_data["pid_yaw"])],
+    }
+
+def build_snapshot(latest_data, previous):
+    """Derive the state every session renders from the newest telemetry record"""
+    tick = previous["tick"] + 1 if previous else 1
+    values = sample_values(latest_data)
+    trajectory = previous["trajectory"] if previous else {"tick": [], "x": [], "y": [], "z": []}
+    point = {"tick": tick, "x": values["position"][0], "y": values["position"][1], "z": values["position"][2]}
+    return {
+        "tick": tick,
+        "created": time.time(),
+        "latest": latest_data,
+        "values": values,
+        # Trajectory points are tagged with their tick so each session can
+        # append exactly the points it has not drawn yet
+        "trajectory": {key: (trajectory[key] + [point[key]])[-MAX_TRAJECTORY_POINTS:] for key in point},
+    }
+
+def history_path(drone=None):
+    return HISTORY_PATH if drone is None else f"{HISTORY_PATH}-{drone}"
+
+# Opened for writing by whichever process becomes the snapshot leader, per drone
+history_writers = {}
+# Records this process has ingested, for the profiler's rates
+records_ingested = 0
+
+def ingest_history(records, drone=None):
+    global records_ingested
+    if drone not in history_writers:
+        history_writers[drone] = TimeSeriesStore(history_path(drone))
+    history_writers[drone].extend(records)
+    records_ingested += len(records)
+
+# One ingest stage per host builds the snapshot that every session reads
+snapshot_store = SnapshotStore()
+snapshot_publisher = SnapshotPublisher(snapshot_store, telemetry_reader, build_snapshot, ingest=ingest_history)
+# Tools that drive the publisher themselves (benchmark.py) turn this off
+BACKGROUND_INGEST = True
+
+# Snapshot store and publisher of each fleet drone, created when a session first selects it
+drone_feeds = {}
+drone_feeds_lock = threading.Lock()
+
+def drone_feed(drone):
+    """Return (store, publisher) for a fleet drone, or for the single-drone recorder if drone is None"""
+    if drone is None:
+        return snapshot_store, snapshot_publisher
+    with drone_feeds_lock:
+        if drone not in drone_feeds:
+            # Only drones that fleet.py recorded; the id comes from the browser
+            if drone not in fleet_drones():
+                return None, None
+            directory = os.path.join(FLEET_DIR, drone)
+            reader = make_reader(os.path.join(directory, os.path.basename(FILE_PATH)),
+                                 os.path.join(directory, os.path.basename(COLUMNAR_PATH)))
+            store = SnapshotStore(os.path.join(SNAPSHOT_DIR, f"drone-dashboard-snapshot-{drone}.json"))
+            publisher = SnapshotPublisher(store, reader, build_snapshot,
+                                          ingest=lambda records: ingest_history(records, drone))
+            drone_feeds[drone] = (store, publisher)
+        return drone_feeds[drone]
+
+def feed_store(drone=None):
+    """Snapshot store of a drone, with its publisher running; None for an unknown drone"""
+    store, publisher = drone_feed(drone)
+    if store is None:
+        return None
+    if BACKGROUND_INGEST and not publisher.is_alive():
+        try:
+            publisher.start()
+        except RuntimeError:
+            # Another request thread started it first
+            pass
+    return store
+
+def current_snapshot(drone=None):
+    store = feed_store(drone)
+    return None if store is None else store.read()
+
+def session_last_tick(session_tick, drone):
+    """The snapshot tick this session rendered last, if it was showing the same drone"""
+    if isinstance(session_tick, list) and session_tick[0] == drone:
+        return session_tick[1]
+    return None
+
+def new_trajectory_points(snapshot, last_tick):
+    """Return the trajectory points this session has not drawn yet, or None"""
+    trajectory = snapshot["trajectory"]
+    start = 0
+    if last_tick is not None:
+        start = len(trajectory["tick"])
+        while start > 0 and trajectory["tick"][start - 1] > last_tick:
+            start -= 1
+    if start >= len(trajectory["tick"]):
+        return None
+    return {key: trajectory[key][start:] for key in ("x", "y", "z")}
+
+def bar_patch(values):
+    patch = Patch()
+    patch["data"][0]["y"] = values
+    return patch
 
 # Callback to update graphs and live telemetry text
-@app.callback(
-    [
-        Output("position-3d-graph", "figure"),
-        Output("orientation-graph", "figure"),
-        Output("rc-commands-graph", "figure"),
-        Output("pid-graph", "figure"),
-        Output("live-update-text", "children")
-    ],
-    [Input("interval-component", "n_intervals")]
-)
-def update_dashboard(n):
-    # Check if telemetry file exists
-    if not os.path.exists(FILE_PATH):
-        return {}, {}, {}, {}, "Waiting for telemetry data..."
+def update_dashboard(n, session_tick, drone=None):
+    last_tick = session_last_tick(session_tick, drone)
+    snapshot = current_snapshot(drone)
+    if snapshot is None:
+        return no_update, no_update, no_update, no_update, "Waiting for telemetry data...", no_update
+    if snapshot["tick"] == last_tick:
+        return no_update, no_update, no_update, no_update, no_update, no_update
 
     try:
-        # Read telemetry file
-        with open(FILE_PATH, "r") as file:
-            raw_data = file.read()
-
-        # Split concatenated JSON objects
-        raw_entries = raw_data.strip().split("}{")
-        raw_entries = [entry if entry.startswith("{") else "{" + entry for entry in raw_entries]
-        raw_entries = [entry if entry.endswith("}") else entry + "}" for entry in raw_entries]
-
-        # Parse JSON entries into dictionaries
-        parsed_entries = [json.loads(entry) for entry in raw_entries]
-
-        # Get the latest telemetry data
-        latest_data = parsed_entries[-1]
-
-        # Check for position and orientation fields
-        position = latest_data.get("position", [0, 0, 0])  # Default to [0, 0, 0] if missing
-        orientation = latest_data.get("orientation", [0, 0, 0, 0])  # Default to [0, 0, 0, 0] if missing
-
-        # Update trajectory data
-        trajectory_data["x"].append(position[0])
-        trajectory_data["y"].append(position[1])
-        trajectory_data["z"].append(position[2])
-
-        # Limit trajectory size to prevent memory issues
-        max_points = 200  # Retain fewer points to reduce clutter
-        if len(trajectory_data["x"]) > max_points:
-            trajectory_data["x"].pop(0)
-            trajectory_data["y"].pop(0)
-            trajectory_data["z"].pop(0)
-
-        # Create figures for the dashboard
-        position_figure = {
-            "data": [
-                {
-                    "x": trajectory_data["x"],
-                    "y": trajectory_data["y"],
-                    "z": trajectory_data["z"],
-                    "type": "scatter3d",
-                    "mode": "lines+markers",
-                    "line": {"color": "blue", "width": 2},
-                    "marker": {"size": 5, "color": "blue", "opacity": 0.8},
-                }
-            ],
-            "layout": {
-                "title": "Drone 3D Path",
-                "scene": {
-                    "xaxis": {"title": "X Position", "range": [-50, 50]},  # Zoom out x-axis
-                    "yaxis": {"title": "Y Position", "range": [-50, 50]},  # Zoom out y-axis
-                    "zaxis": {"title": "Z Position", "range": [-50, 50]},  # Zoom out z-axis
-                }
-            }
-        }
+        values = snapshot["values"]
+        points = new_trajectory_points(snapshot, last_tick)
 
-        orientation_figure = {
-            "data": [
-                {"x": ["QX", "QY", "QZ", "QW"],
-                 "y": orientation,
-                 "type": "bar"}
-            ],
-            "layout": {
-                "title": "Orientation Quaternion",
-                "xaxis": {"title": "Components"},
-                "yaxis": {"title": "Value"}
-            }
-        }
+        # Append the new points to the trajectory; the browser drops the oldest ones
+        trajectory_update = no_update
+        if points is not None:
+            trajectory_update = (
+                {"x": [points["x"]], "y": [points["y"]], "z": [points["z"]]},
+                [0],
+                MAX_TRAJECTORY_POINTS,
+            )
 
-        rc_commands_figure = {
-            "data": [
-                {"x": ["Roll", "Pitch", "Throttle", "Yaw"],
-                 "y": [float(latest_data["roll"]), float(latest_data["pitch"]),
-                       float(latest_data["throttle"]), float(latest_data["yaw"])],
-                 "type": "bar"}
-            ],
-            "layout": {
-                "title": "RC Commands",
-                "xaxis": {"title": "Control"},
-                "yaxis": {"title": "Value", "range": [800, 2200]}  # Locked range
-            }
-        }
+        live_text = telemetry_text(snapshot["latest"], values["position"], values["orientation"])
+        return (trajectory_update, bar_patch(values["orientation"]), bar_patch(values["rc"]),
+                bar_patch(values["pid"]), live_text, [drone, snapshot["tick"]])
+
+    except Exception as e:
+        return no_update, no_update, no_update, no_update, f"Error processing telemetry data: {e}", no_update
+
+def telemetry_frame(snapshot, last_tick, drone=None):
+    """What a client-side rendering session needs to catch up from ``last_tick`` to ``snapshot``"""
+    try:
+        values = snapshot["values"]
+        sample = dict(values, trajectory=new_trajectory_points(snapshot, last_tick))
+        live_text = telemetry_text(snapshot["latest"], values["position"], values["orientation"])
+        return {"sample": sample, "text": live_text, "tick": snapshot["tick"]}
+    except Exception as e:
+        return {"sample": None, "text": f"Error processing telemetry data: {e}", "tick": None}
 
-        pid_graph_figure = {
-            "data": [
-                {"x": ["PID X", "PID Y", "PID Z", "PID Yaw"],
-                 "y": [float(latest_data["pid_x"]), float(latest_data["pid_y"]),
-                       float(latest_data["pid_z"]), float(latest_data["pid_yaw"])],
-                 "type": "bar"}
-            ],
-            "layout": {
-                "title": "PID Outputs",
-                "xaxis": {"title": "Control"},
-                "yaxis": {"title": "Value", "range": [-100, 100]}  # Locked range
+def update_telemetry_store(n, session_tick, drone=None):
+    """Server half of client-side rendering: ship only what this session is missing"""
+    last_tick = session_last_tick(session_tick, drone)
+    snapshot = current_snapshot(drone)
+    if snapshot is None:
+        return no_update, "Waiting for telemetry data...", no_update
+    if snapshot["tick"] == last_tick:
+        return no_update, no_update, no_update
+    frame = telemetry_frame(snapshot, last_tick)
+    if frame["sample"] is None:
+        return no_update, frame["text"], no_update
+    return frame["sample"], frame["text"], [drone, frame["tick"]]
+
+# Event stream of telemetry frames for PUSH_UPDATES
+register_push_routes(app.server, feed_store, telemetry_frame, max_rate=PUSH_MAX_RATE)
+
+# Set by enable_profiling when the dashboard is served with profiling enabled in config.json
+profiler = None
+
+def enable_profiling(config_path=CONFIG_PATH):
+    """Profile on SIGUSR2 or POST /admin/profile?seconds=30 (local host only), as config['profiling'] says.
+
+    Called when the dashboard is served, before the first request, so that
+    importing the module (benchmark.py) installs no signal handler.
+    """
+    global profiler
+    try:
+        with open(config_path) as f:
+            options = json.load(f).get("profiling")
+    except (OSError, ValueError):
+        options = None
+    profiler = make_profiler("dashboard", options, base_dir=os.path.dirname(config_path),
+                             counters=lambda: {"records_ingested": records_ingested})
+    if profiler is not None:
+        profiler.install_signal()
+        register_profile_routes(app.server, profiler)
+    return profiler
+
+if PUSH_UPDATES:
+    # The browser follows /api/live for the selected drone and fills telemetry-store itself
+    app.clientside_callback(
+        "function(drone) { return window.livePush.connect(drone, %r); }" % PUSH_MAX_RATE,
+        Output("live-push-status", "children"),
+        [Input("drone-select", "value")]
+    )
+elif CLIENTSIDE_RENDERING:
+    app.callback(
+        [
+            Output("telemetry-store", "data"),
+            Output("live-update-text", "children"),
+            Output("session-tick", "data")
+        ],
+        [Input("interval-component", "n_intervals")],
+        [State("session-tick", "data"), State("drone-select", "value")]
+    )(update_telemetry_store)
+
+if CLIENTSIDE_RENDERING or PUSH_UPDATES:
+    app.clientside_callback(
+        """
+        function(sample, orientationFigure, rcFigure, pidFigure) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!sample) {
+                return [noUpdate, noUpdate, noUpdate, noUpdate];
             }
+            const withValues = (figure, y) => figure
+                ? Object.assign({}, figure, {data: [Object.assign({}, figure.data[0], {y: y})]})
+                : noUpdate;
+            const t = sample.trajectory;
+            return [
+                t ? [{x: [t.x], y: [t.y], z: [t.z]}, [0], %d] : noUpdate,
+                withValues(orientationFigure, sample.orientation),
+                withValues(rcFigure, sample.rc),
+                withValues(pidFigure, sample.pid),
+            ];
         }
-
-        live_text = [
-            html.P(f"Roll: {latest_data['roll']}"),
-            html.P(f"Pitch: {latest_data['pitch']}"),
-            html.P(f"Throttle: {latest_data['throttle']}"),
-            html.P(f"Yaw: {latest_data['yaw']}"),
-            html.P(f"PID X: {latest_data['pid_x']}, PID Y: {latest_data['pid_y']}, "
-                   f"PID Z: {latest_data['pid_z']}, PID Yaw: {latest_data['pid_yaw']}"),
-            html.P(f"Position: {position}"),
-            html.P(f"Orientation: {orientation}"),
+        """ % MAX_TRAJECTORY_POINTS,
+        [
+            Output("position-3d-graph", "extendData"),
+            Output("orientation-graph", "figure"),
+            Output("rc-commands-graph", "figure"),
+            Output("pid-graph", "figure"),
+        ],
+        [Input("telemetry-store", "data")],
+        [
+            State("orientation-graph", "figure"),
+            State("rc-commands-graph", "figure"),
+            State("pid-graph", "figure"),
         ]
+    )
+else:
+    app.callback(
+        [
+            Output("position-3d-graph", "extendData"),
+            Output("orientation-graph", "figure"),
+            Output("rc-commands-graph", "figure"),
+            Output("pid-graph", "figure"),
+            Output("live-update-text", "children"),
+            Output("session-tick", "data")
+        ],
+        [Input("interval-component", "n_intervals")],
+        [State("session-tick", "data"), State("drone-select", "value")]
+    )(update_dashboard)
+
+@app.callback(
+    Output("position-3d-graph", "figure"),
+    [Input("drone-select", "value")],
+    prevent_initial_call=True
+)
+def reset_trajectory(drone):
+    """Start an empty path when switching drones; the next tick fills it from the new drone"""
+    return POSITION_FIGURE
+
+@app.callback(
+    Output("drone-select", "options"),
+    [Input("metrics-interval", "n_intervals")]
+)
+def update_drone_options(n):
+    return [{"label": drone, "value": drone} for drone in fleet_drones()]
+
+# Read-only views of the history in worker processes that are not the leader, per drone
+history_readers = {}
+
+def open_history(drone=None):
+    if drone in history_writers:
+        return history_writers[drone]
+    path = history_path(drone)
+    try:
+        st = os.stat(os.path.join(path, "meta.json"))
+    except FileNotFoundError:
+        return None
+    # The leader starts a new history when the layout changes; follow it
+    key = (st.st_ino, st.st_mtime_ns)
+    reader = history_readers.get(drone)
+    if reader is None or key != reader["key"]:
+        reader = history_readers[drone] = {"store": TimeSeriesStore(path, writable=False), "key": key}
+    return reader["store"]
+
+def to_epoch(value):
+    """Convert a plotly date axis value back to a Unix timestamp"""
+    if isinstance(value, (int, float)):
+        return value / 1000.0
+    return np.datetime64(str(value).replace(" ", "T"), "ms").astype(np.int64) / 1000.0
 
-        return position_figure, orientation_figure, rc_commands_figure, pid_graph_figure, live_text
+def history_figure(title, series, range_key):
+    return {
+        "data": [
+            # Whole milliseconds on a date axis and float32 samples at float32
+            # precision keep the JSON payload small
+            {"x": np.rint(times * 1000).astype(np.int64), "y": values.astype(np.float64).round(4), "name": name,
+             "type": "scattergl", "mode": "lines"}
+            for name, (times, values) in series.items()
+        ],
+        "layout": {
+            "title": title,
+            "uirevision": range_key,  # keep the user's zoom across refreshes
+            "xaxis": {"type": "date"},
+            "margin": {"t": 40},
+        },
+    }
+
+@app.callback(
+    Output("history-window", "data"),
+    [Input("history-range", "value")] + [Input(graph_id, "relayoutData") for graph_id in HISTORY_GRAPHS]
+)
+def update_history_window(range_key, *relayouts):
+    trigger = dash.callback_context.triggered[0]["prop_id"] if dash.callback_context.triggered else ""
+    if not trigger.endswith(".relayoutData"):
+        return None
+    relayout = relayouts[list(HISTORY_GRAPHS).index(trigger.split(".")[0])] or {}
+    if "xaxis.range[0]" in relayout:
+        return [to_epoch(relayout["xaxis.range[0]"]), to_epoch(relayout["xaxis.range[1]"])]
+    if "xaxis.range" in relayout:
+        return [to_epoch(v) for v in relayout["xaxis.range"]]
+    if relayout.get("xaxis.autorange"):
+        return None
+    return no_update
+
+@app.callback(
+    [Output(graph_id, "figure") for graph_id in HISTORY_GRAPHS],
+    [Input("history-interval", "n_intervals"), Input("history-range", "value"), Input("history-window", "data"),
+     Input("drone-select", "value")]
+)
+def update_history(n, range_key, window, drone):
+    if drone is not None and drone not in fleet_drones():
+        return [no_update] * len(HISTORY_GRAPHS)
+    store = open_history(drone)
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    # A zoomed-in window is fixed in time, so it is not refreshed every tick
+    if store is None or (window and triggered == ["history-interval.n_intervals"]):
+        return [no_update] * len(HISTORY_GRAPHS)
+    if window:
+        t0, t1 = window
+    else:
+        _, newest = store.span()
+        seconds = HISTORY_RANGES.get(range_key)
+        t0 = newest - seconds if seconds and newest is not None else None
+        t1 = None
+    figures = []
+    for title, channels in HISTORY_GRAPHS.values():
+        series, level = store.query(channels, t0, t1, max_points=HISTORY_MAX_POINTS)
+        figures.append(history_figure(f"{title} (level {level})", series, range_key))
+    return figures
 
+analytics_store = SnapshotStore(ANALYTICS_SNAPSHOT_PATH)
+
+def format_number(value, spec=".2f"):
+    return "-" if value is None else format(value, spec)
+
+def analytics_text(snapshot):
+    stages = snapshot["stages"]
+    lines = ["Rolling mean / std: " + ", ".join(
+        f"{name} {values['mean']:.1f} / {values['std']:.1f}"
+        for name, values in stages.get("rolling", {}).items())]
+    saturation = stages.get("saturation", {})
+    lines.append(f"Saturation (windups: {saturation.get('windups', 0)}): " + ", ".join(
+        f"{name} {values['saturated_fraction']:.0%}" + (" WINDUP" if values["windup"] else "")
+        for name, values in saturation.get("channels", {}).items()))
+    lines.append("Dominant oscillation: " + ", ".join(
+        f"{name} {values['frequency_hz']:.1f} Hz ({values['amplitude']:.1f})"
+        for name, values in stages.get("oscillation", {}).items()))
+    step = stages.get("step_response", {})
+    last_step = step.get("last") or {}
+    lines.append("Last step response" + (" (measuring)" if step.get("measuring") else "") + ": " + (", ".join(
+        f"{name} rise {format_number(values['rise_time'])} s, overshoot {values['overshoot_pct']:.0f}%, "
+        f"settling {format_number(values['settling_time'])} s"
+        for name, values in last_step.get("channels", {}).items()) or "-"))
+    lines.append("Recent events:")
+    for event in snapshot["events"][-5:]:
+        details = {key: value for key, value in event.items() if key not in ("type", "stage", "event", "time")}
+        lines.append(f"  {time.strftime('%H:%M:%S', time.localtime(event['time']))} {event['event']} {details}")
+    return "\n".join(lines)
+
+@app.callback(
+    Output("analytics-text", "children"),
+    [Input("metrics-interval", "n_intervals")]
+)
+def update_analytics(n):
+    snapshot = analytics_store.read()
+    if snapshot is None:
+        return "No analytics yet (enable 'analytics' in config.json)"
+    try:
+        return analytics_text(snapshot)
     except Exception as e:
-        return {}, {}, {}, {}, f"Error processing telemetry data: {e}"
+        return f"Error processing analytics: {e}"
 
-def load_commands():
-    """Load existing commands from file"""
+# Previous metrics snapshot, used to turn counters into per-second rates
+previous_metrics = {"time": None, "values": {}}
+
+@app.callback(
+    Output("metrics-text", "children"),
+    [Input("metrics-interval", "n_intervals")]
+)
+def update_metrics(n):
+    try:
+        with urllib.request.urlopen(METRICS_URL, timeout=0.2) as response:
+            values = json.load(response)
+    except Exception:
+        return "Metrics endpoint not available (enable 'metrics' in config.json)"
+
+    now = time.time()
+    elapsed = now - previous_metrics["time"] if previous_metrics["time"] else None
+    previous = previous_metrics["values"]
+    previous_metrics.update(time=now, values=values)
+
+    def rate(name):
+        if not elapsed or name not in previous or values.get(name) is None:
+            return "-"
+        return f"{(values[name] - previous[name]) / elapsed:.1f}/s"
+
+    def quantiles(name):
+        histogram = values.get(name)
+        if not histogram:
+            return "-"
+        p50, p95 = histogram_quantile(histogram, 0.5), histogram_quantile(histogram, 0.95)
+        if p50 is None:
+            return "-"
+        return f"p50 <= {p50 * 1000:g} ms, p95 <= {p95 * 1000:g} ms"
+
+    return "\n".join([
+        f"Packets received: {rate('telemetry_datagrams_received_total')}, "
+        f"decoded: {rate('telemetry_packets_decoded_total')}, "
+        f"decode errors: {values.get('telemetry_decode_errors_total')}",
+        f"Writer queue depth: {values.get('writer_queue_depth')}, "
+        f"overflows: {values.get('writer_overflows_total')}, "
+        f"bytes written: {values.get('writer_bytes_written_total')} ({rate('writer_bytes_written_total')})",
+        f"Receive to persist: {quantiles('telemetry_persist_latency_seconds')}",
+        f"Commands sent: {values.get('commands_sent_total')}, acked: {values.get('commands_acked_total')}, "
+        f"retransmits: {values.get('commands_retransmits_total')}, timeouts: {values.get('commands_timeouts_total')}",
+        f"Command RTT: {quantiles('command_rtt_seconds')}",
+        f"Analytics events: {values.get('analytics_events_total')}, "
+        f"records skipped by heavy stages: {values.get('analytics_dropped_total')}",
+    ])
+
+command_journal = CommandJournal(COMMAND_JOURNAL_PATH)
+
+def drone_journal(drone=None):
+    """Command journal of a fleet drone, kept next to its recording"""
+    if drone is None:
+        return command_journal
+    return CommandJournal(os.path.join(FLEET_DIR, drone, os.path.basename(COMMAND_JOURNAL_PATH)))
+
+def load_commands(drone=None):
+    """Load the most recent commands from the journal"""
     try:
-        if os.path.exists(COMMAND_FILE_PATH) and os.path.getsize(COMMAND_FILE_PATH) > 0:
-            with open(COMMAND_FILE_PATH, 'r') as f:
-                return json.load(f)
+        return [entry["command"] for entry in drone_journal(drone).tail(COMMAND_HISTORY_SIZE)]
     except Exception:
-        pass
-    return []
+        return []
+
+def mirror_commands(commands):
+    """Rewrite commands.txt for tools that still watch it"""
+    with open(COMMAND_FILE_PATH, "w") as f:
+        json.dump(commands, f, indent=2)
 
 # Modify the handle_command callback
 @app.callback(
     [Output("command-status", "children"),
      Output("command-history", "children")],
-    [Input("send-button", "n_clicks")],
-    [
-        State("roll-input", "value"),
-        State("pitch-input", "value"),
-        State("throttle-input", "value"),
-        State("yaw-input", "value"),
-        State("pid-x-input", "value"),
-        State("pid-y-input", "value"),
-        State("pid-z-input", "value"),
-        State("pid-yaw-input", "value"),
-    ]
+    [Input("send-button", "n_clicks"), Input("drone-select", "value")],
+    [State(input_id, "value") for input_id in GAIN_INPUTS.values()]
 )
-def handle_command(n_clicks, roll_p, pitch_p, throttle_p, yaw_p, roll_i, pitch_i, throttle_i, yaw_i, roll_d, pitch_d, throttle_d, yaw_d):
-    if n_clicks is None:
-        commands = load_commands()
+def handle_command(n_clicks, drone, *gains):
+    if drone is not None and drone not in fleet_drones():
+        return f"Unknown drone {drone}", ""
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    # Show the selected drone's history without sending anything
+    if n_clicks is None or "drone-select.value" in triggered:
+        commands = load_commands(drone)
         return "", json.dumps(commands, indent=2)
 
+    # A missing gain is not sent as 0, which the drone would fly with
+    gains = dict(zip(GAIN_INPUTS, gains))
+    missing = [f"{term} {axis}" for (term, axis), value in gains.items() if value is None]
+    if missing:
+        return f"Enter every PID gain before sending (missing: {', '.join(missing)})", no_update
+
     # Create a command dictionary
     new_command = {
         "pid_values": {
-            "P": {
-                "roll": float(roll_p) if roll_p else 0.0,
-                "pitch": float(pitch_p) if pitch_p else 0.0,
-                "throttle": float(throttle_p) if throttle_p else 0.0,
-                "yaw": float(yaw_p) if yaw_p else 0.0,
-            },
-            "I": {
-                "roll": float(roll_i) if roll_i else 0.0,
-                "pitch": float(pitch_i) if pitch_i else 0.0,
-                "throttle": float(throttle_i) if throttle_i else 0.0,
-                "yaw": float(yaw_i) if yaw_i else 0.0,
-            },
-            "D": {
-                "roll": float(roll_d) if roll_d else 0.0,
-                "pitch": float(pitch_d) if pitch_d else 0.0,
-                "throttle": float(throttle_d) if throttle_d else 0.0,
-                "yaw": float(yaw_d) if yaw_d else 0.0,
-            },
+            term: {axis: float(gains[term, axis]) for axis in PID_AXES}
+            for term in PID_TERMS
         }
     }
 
 
     try:
-        # Load existing commands
-        commands = load_commands()
-        
-        # Append new command
-        commands.append(new_command)
-        
-        # Keep only last 100 commands to prevent file from growing too large
-        commands = commands[-100:]
-        
-        # Write all commands to the text file
-        with open(COMMAND_FILE_PATH, "w") as f:
-            json.dump(commands, f, indent=2)
-            
+        # Record the command, then hand it straight to the running sender
+        drone_journal(drone).append(new_command)
+        commands = load_commands(drone)
+        if MIRROR_COMMANDS_TXT and drone is None:
+            mirror_commands(commands)
+
+        try:
+            send_command(new_command, drone_socket_path(drone) if drone is not None else COMMAND_SOCKET_PATH)
+        except OSError as e:
+            return f"Command recorded, but the command sender is not reachable: {e}", json.dumps(commands, indent=2)
+
         # Update command history display
         return f"Command sent successfully! (Total commands: {len(commands)})", json.dumps(commands, indent=2)
     except Exception as e:
@@ -327,4 +790,5 @@ def handle_command(n_clicks, roll_p, pitch_p, throttle_p, yaw_p, roll_i, pitch_i
 
 # Run the Dash app
 if __name__ == "__main__":
-    app.run_server(debug=True, host="0.0.0.0", port=8050)
\ No newline at end of file
+    enable_profiling()
+    app.run(debug=True, host="0.0.0.0", port=8050)
\ No newline at end of file
@@ -0,0 +1,331 @@
+"""Record a fleet of drones from one ground station.
+
+Telemetry from every drone arrives on one UDP port and is demultiplexed by
+the record's ``drone_id`` field, or else by source address, into per-drone
+sessions. Each session has its own sink in ``<directory>/<drone id>/``,
+its own command channel and scheduler, and its own command socket for the
+dashboard (see drone_socket_path).
+
+For higher aggregate rates several worker processes bind the same port
+with SO_REUSEPORT. The kernel hashes each sender's address to one socket,
+so all packets of a drone reach the same worker, which then owns that
+drone's session. Worker 0 keeps every configured drone subscribed; the
+workers share when each drone was last heard from, so drones that stream
+to another worker are not subscribed again.
+Commands are sent from the shared socket too, since a drone streams to
+whichever address it last heard from; their confirmations come back to
+the worker that owns the drone.
+
+Usage: python fleet.py --workers 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import time
+
+import main
+import wire_protocol
+from background_writer import BackgroundWriter
+from command_channel import decode_confirmation, open_command_channel
+from command_ipc import drone_socket_path, open_command_listener
+from receiver import TelemetryReceiver
+
+logger = logging.getLogger(__name__)
+
+FLEET_DIR = 'fleet'
+# Characters allowed in a drone id, which is also a directory name
+UNSAFE_ID = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class DroneSession:
+    """Everything the recorder keeps for one drone: sink, command channel and latest state"""
+
+    def __init__(self, drone_id, address, writer):
+        self.drone_id = drone_id
+        self.address = address
+        self.writer = writer
+        self.channel = None
+        self.handler = None
+        self.listener = None
+        # Task opening the channel and listener, see FleetRecorder.session
+        self.connecting = None
+        self.socket_path = drone_socket_path(drone_id)
+        # Binary protocol version the drone agreed to, applied once the channel is open
+        self.protocol = None
+        self.latest = None
+        self.packets = 0
+        self.last_received = None
+
+    async def connect(self, loop, config, sock):
+        """Open the command channel on the telemetry socket ``sock`` and the dashboard's command socket"""
+        self.channel = open_command_channel(loop, sock, *self.address, **config.get('commands', {}))
+        self.channel.protocol = self.protocol
+        self.handler = main.CommandHandler(*self.address, self.channel, config.get('scheduler'))
+        self.handler.scheduler.start()
+        self.listener, _ = await open_command_listener(loop, self.handler.submit, self.socket_path)
+
+    def set_protocol(self, version):
+        if version != self.protocol:
+            logger.info(f"Drone {self.drone_id} speaks binary protocol version {version}")
+        self.protocol = version
+        if self.channel is not None:
+            self.channel.protocol = version
+
+    def stats(self):
+        stats = {
+            'address': list(self.address),
+            'packets': self.packets,
+            'writer': self.writer.stats(),
+        }
+        if self.channel is not None:
+            stats['commands'] = self.channel.stats()
+        return stats
+
+    def close(self):
+        if self.handler is not None:
+            self.handler.scheduler.stop()
+        if self.listener is not None:
+            self.listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        if self.channel is not None:
+            self.channel.close()
+        self.writer.stop()
+
+
+class FleetRecorder:
+    """Demultiplexes one telemetry socket into DroneSessions.
+
+    Drones listed in config['fleet']['drones'] are known by id and address;
+    with ``accept_unknown`` any other sender gets a session named after its
+    address.
+    """
+
+    def __init__(self, loop, config, sock, worker=0, liveness=None):
+        self.loop = loop
+        self.config = config
+        self.options = config.get('fleet', {})
+        self.directory = self.options.get('directory', FLEET_DIR)
+        self.accept_unknown = self.options.get('accept_unknown', True)
+        self.worker = worker
+        self.drones = {drone['id']: (drone['host'], drone['port']) for drone in self.options.get('drones', [])}
+        self.by_address = {address: drone_id for drone_id, address in self.drones.items()}
+        # Last time (time.time()) each configured drone was heard from by any worker;
+        # shared memory across workers, see main_cli
+        self.slots = {UNSAFE_ID.sub('_', str(drone_id)): i for i, drone_id in enumerate(self.drones)}
+        self.liveness = liveness if liveness is not None else [0.0] * len(self.drones)
+        self.by_host = {}
+        for drone_id, (host, _) in self.drones.items():
+            # A host alone only identifies a drone if no other drone shares it
+            self.by_host[host] = None if host in self.by_host else drone_id
+        self.sessions = {}
+        # Session of each address telemetry came from, to route confirmations
+        self.by_sender = {}
+        self.unknown = 0
+        receiver_options = config.get('receiver', {})
+        self.receiver = TelemetryReceiver(
+            loop, sock, self.handle,
+            batch_size=receiver_options.get('batch_size', 64),
+            max_datagram=receiver_options.get('max_datagram', 4096))
+        self.subscription = None
+
+    def start(self):
+        self.receiver.start()
+        if self.worker == 0:
+            self.subscription = self.loop.create_task(self.keep_subscribed())
+
+    def identify(self, record, addr):
+        drone_id = record.pop('drone_id', None) if record is not None else None
+        if drone_id is None:
+            drone_id = self.by_address.get(addr) or self.by_host.get(addr[0])
+        if drone_id is None and self.accept_unknown:
+            drone_id = f"{addr[0]}-{addr[1]}"
+        return None if drone_id is None else UNSAFE_ID.sub('_', str(drone_id))
+
+    def session(self, drone_id, addr):
+        session = self.sessions.get(drone_id)
+        if session is None:
+            drone_dir = os.path.join(self.directory, drone_id)
+            os.makedirs(drone_dir, exist_ok=True)
+            path = os.path.join(drone_dir, os.path.basename(self.config.get('path_to_save', 'measurements.txt')))
+            # A columnar store goes next to the drone's log instead of config['columnar']['path']
+            columnar = {k: v for k, v in self.config.get('columnar', {}).items() if k != 'path'}
+            sink_config = dict(self.config, path_to_save=path, columnar=columnar)
+            writer = BackgroundWriter(main.make_sink(sink_config), **self.config.get('writer', {}))
+            writer.start()
+            # Commands go to the configured address, or back to where telemetry came from
+            session = DroneSession(drone_id, self.drones.get(drone_id, addr), writer)
+            self.sessions[drone_id] = session
+            session.connecting = self.loop.create_task(session.connect(self.loop, self.config, self.receiver.sock))
+            session.connecting.add_done_callback(lambda task: self._connected(session, task))
+            logger.info(f"Worker {self.worker} recording drone {drone_id} from {addr} into {drone_dir}")
+        return session
+
+    def _connected(self, session, task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error(f"Could not open the command channel of drone {session.drone_id}: {error}")
+
+    def handle(self, data, addr, received_at):
+        """Receiver callback: route one datagram to the session of the drone that sent it"""
+        if wire_protocol.message_type(data) == wire_protocol.HELLO:
+            drone_id = self.identify(None, addr)
+            if drone_id is not None:
+                self.session(drone_id, addr).set_protocol(wire_protocol.decode_hello(data))
+            return
+        try:
+            confirmation = decode_confirmation(data)
+        except ValueError as e:
+            logger.warning(f"Ignoring malformed confirmation from {addr}: {e}")
+            return
+        if confirmation is not None:
+            session = self.by_sender.get(addr)
+            if session is not None and session.channel is not None:
+                session.channel.confirm(confirmation, addr)
+            return
+        record = main.decode_packet(data)
+        if record is None:
+            return
+        drone_id = self.identify(record, addr)
+        if drone_id is None:
+            self.unknown += 1
+            return
+        session = self.session(drone_id, addr)
+        self.by_sender[addr] = session
+        session.writer.submit(record, received_at)
+        session.packets += 1
+        session.last_received = time.monotonic()
+        session.latest = record
+        slot = self.slots.get(drone_id)
+        if slot is not None:
+            self.liveness[slot] = time.time()
+
+    async def keep_subscribed(self, interval=1.0):
+        """Subscribe every configured drone that no worker has heard from lately"""
+        subscribe = dict(self.config.get('receiver', {}).get('subscribe', {"subscribe": "telemetry"}))
+        if self.config.get('protocol', 'auto') == 'auto':
+            subscribe['protocol'] = list(wire_protocol.SUPPORTED_VERSIONS)
+        message = json.dumps(subscribe).encode()
+        while True:
+            for slot, (drone_id, address) in enumerate(self.drones.items()):
+                if time.time() - self.liveness[slot] > interval:
+                    try:
+                        self.receiver.sock.sendto(message, address)
+                    except OSError as e:
+                        logger.warning(f"Could not subscribe to telemetry from {drone_id} at {address}: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {
+            'worker': self.worker,
+            'receiver': self.receiver.stats(),
+            'unknown_senders': self.unknown,
+            'drones': {drone_id: session.stats() for drone_id, session in self.sessions.items()},
+        }
+
+    def close(self):
+        if self.subscription is not None:
+            self.subscription.cancel()
+        self.receiver.stop()
+        self.receiver.sock.close()
+        for session in self.sessions.values():
+            if session.connecting is not None:
+                session.connecting.cancel()
+            session.close()
+        logger.info(f"Fleet worker stats: {self.stats()}")
+
+
+def open_fleet_socket(bind_address, reuse_port=False, rcvbuf=None):
+    """Create the shared telemetry socket; with ``reuse_port`` several processes can bind it"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind(tuple(bind_address))
+    sock.setblocking(False)
+    return sock
+
+
+async def start_fleet(config, worker=0, reuse_port=False, liveness=None):
+    """Start a FleetRecorder on the running event loop"""
+    loop = asyncio.get_running_loop()
+    options = config.get('fleet', {})
+    sock = open_fleet_socket(options.get('bind', ['0.0.0.0', 5100]), reuse_port,
+                             config.get('receiver', {}).get('rcvbuf'))
+    recorder = FleetRecorder(loop, config, sock, worker, liveness)
+    recorder.start()
+    logger.info(f"Fleet worker {worker} receiving telemetry on {sock.getsockname()}")
+    return recorder
+
+
+async def run_worker(config, worker, reuse_port, liveness=None, stats_interval=10.0):
+    recorder = await start_fleet(config, worker, reuse_port, liveness)
+    try:
+        while True:
+            await asyncio.sleep(stats_interval)
+            logger.info(f"Fleet worker {worker}: {len(recorder.sessions)} drone(s), "
+                        f"{recorder.receiver.datagrams} datagrams")
+    finally:
+        recorder.close()
+
+
+def worker_main(config, worker, reuse_port, liveness=None):
+    # Shared state of main.py (decode counters, config) is per process
+    main.config = config
+    try:
+        asyncio.run(run_worker(config, worker, reuse_port, liveness))
+    except KeyboardInterrupt:
+        pass
+
+
+def main_cli():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(process)d - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Record telemetry from several drones")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--workers', type=int, help="receiver processes (default config['fleet']['workers'])")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    workers = args.workers or config.get('fleet', {}).get('workers', 1)
+    if workers > 1 and config.get('fleet', {}).get('bind', ['0.0.0.0', 5100])[1] == 0:
+        parser.error("Several workers need a fixed port in config['fleet']['bind']")
+
+    if workers == 1:
+        worker_main(config, 0, False)
+        return
+    # A drone streams to the worker its address hashes to; worker 0 subscribes them all
+    liveness = multiprocessing.RawArray('d', len(config.get('fleet', {}).get('drones', [])))
+    processes = [multiprocessing.Process(target=worker_main, args=(config, i, True, liveness),
+                                         name=f'fleet-worker-{i}')
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logger.info("Shutting down fleet recorder...")
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # Ctrl+C in a terminal reaches the workers too; interrupt the ones it did not reach
+        for process in processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+                process.join()
+
+
+if __name__ == "__main__":
+    main_cli()
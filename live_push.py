@@ -0,0 +1,140 @@
+import json
+import logging
+import threading
+import time
+
+from flask import Response, request, stream_with_context
+from plotly.utils import PlotlyJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotWatcher:
+    """Wakes push clients when a SnapshotStore has a new snapshot.
+
+    One thread per store and process waits for a new tick, and only while
+    at least one client is subscribed, so an idle dashboard does no work at
+    all. In the worker process that publishes the snapshots the thread is
+    woken by the publish itself. Other worker processes cannot be notified
+    and check the snapshot file with a ``stat`` every ``poll_interval``.
+    """
+
+    def __init__(self, store, poll_interval=0.02, idle_check=1.0):
+        self.store = store
+        self.poll_interval = poll_interval
+        # How often a woken-by-publish watcher still checks for unsubscribes
+        self.idle_check = idle_check
+        self.snapshot = None
+        self.subscribers = 0
+        self.wakeups = 0
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def subscribe(self):
+        with self._changed:
+            self.subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='snapshot-watcher', daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self):
+        with self._changed:
+            self.subscribers -= 1
+
+    def wait(self, tick, timeout):
+        """Return the current snapshot once its tick differs from ``tick``, or None after ``timeout``"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self.snapshot is None or self.snapshot["tick"] == tick:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+            return self.snapshot
+
+    def _run(self):
+        store = self.store
+        while True:
+            with self._changed:
+                if self.subscribers <= 0:
+                    self._thread = None
+                    return
+            seen = store.publishes
+            snapshot = store.read()
+            if snapshot is not None and snapshot is not self.snapshot:
+                with self._changed:
+                    self.snapshot = snapshot
+                    self.wakeups += 1
+                    self._changed.notify_all()
+            with store.published:
+                store.published.wait_for(lambda: store.publishes != seen,
+                                         self.idle_check if store.local_publisher else self.poll_interval)
+
+
+def event_stream(watcher, render, last_tick=None, max_rate=20.0, keepalive=15.0):
+    """Server-Sent Events for one client; frames may hold Dash components.
+
+    At most ``max_rate`` frames per second are sent. Snapshots that arrive
+    in between are coalesced: the next frame is rendered from the newest
+    snapshot and ``render(snapshot, last_tick)`` includes everything the
+    client has not seen since ``last_tick``. A comment line every
+    ``keepalive`` seconds keeps proxies from closing an idle stream.
+    """
+    min_interval = 1.0 / max_rate if max_rate else 0.0
+    watcher.subscribe()
+    try:
+        yield "retry: 1000\n\n"
+        last_sent = 0.0
+        while True:
+            snapshot = watcher.wait(last_tick, keepalive)
+            if snapshot is None:
+                yield ": keepalive\n\n"
+                continue
+            wait = last_sent + min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+                snapshot = watcher.snapshot
+            frame = render(snapshot, last_tick)
+            last_tick = snapshot["tick"]
+            last_sent = time.monotonic()
+            if frame is not None:
+                yield f"id: {last_tick}\ndata: {json.dumps(frame, cls=PlotlyJSONEncoder)}\n\n"
+    finally:
+        watcher.unsubscribe()
+
+
+def register_push_routes(server, store_for, render, max_rate=20.0):
+    """Add /api/live, an event stream of dashboard frames, to a Flask server.
+
+    ``store_for(drone)`` returns the SnapshotStore of a drone (None for the
+    single-drone recorder) or None if there is no such drone.
+    ``render(snapshot, last_tick, drone)`` builds one frame. Clients may ask
+    for a lower rate with ``?rate=``, never a higher one than ``max_rate``.
+    """
+    watchers = {}
+    watchers_lock = threading.Lock()
+
+    @server.route('/api/live')
+    def live():
+        drone = request.args.get('drone') or None
+        store = store_for(drone)
+        if store is None:
+            return Response(f"Unknown drone: {drone}\n", status=404, mimetype='text/plain')
+        try:
+            rate = min(float(request.args.get('rate', max_rate)), max_rate)
+        except ValueError:
+            rate = 0.0
+        if not rate > 0:
+            return Response("rate must be a positive number\n", status=400, mimetype='text/plain')
+        # EventSource resends the id of the last frame it got when it reconnects
+        last_tick = request.headers.get('Last-Event-ID')
+        last_tick = int(last_tick) if last_tick and last_tick.isdigit() else None
+        with watchers_lock:
+            watcher = watchers.get(store.path)
+            if watcher is None:
+                watcher = watchers[store.path] = SnapshotWatcher(store)
+        stream = event_stream(watcher, lambda snapshot, tick: render(snapshot, tick, drone), last_tick, rate)
+        return Response(stream_with_context(stream), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    return watchers
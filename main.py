@@ -1,10 +1,18 @@
+import asyncio
 import json
 import time
 import logging
 import os
-from socket import socket, AF_INET, SOCK_DGRAM, timeout
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+import threading
+
+from background_writer import BackgroundWriter
+from command_channel import decode_confirmation, open_command_channel
+from command_ipc import COMMAND_SOCKET_PATH, open_command_listener
+from command_scheduler import CommandScheduler
+from metrics import REGISTRY, MetricsServer
+from receiver import TelemetryReceiver, keep_subscribed, open_telemetry_socket
+from telemetry_log import TelemetryLogWriter
+import wire_protocol
 
 # Configure logging
 logging.basicConfig(
@@ -13,25 +21,88 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class CommandHandler(FileSystemEventHandler):
-    def __init__(self, host, port):
+packets_decoded = REGISTRY.counter('telemetry_packets_decoded_total', 'Telemetry datagrams decoded')
+decode_errors = REGISTRY.counter('telemetry_decode_errors_total', 'Telemetry datagrams that could not be decoded')
+# Set by start_recorder when config['analytics'] is enabled
+telemetry_pipeline = None
+# Set by start_recorder; switched to binary commands when the drone agrees to a protocol version
+command_channel = None
+# CSV log for flush_to_file(use_json=False), started on first use
+csv_writer = None
+# Set by start_recorder when config['shared_memory'] is enabled; the dashboard reads it live
+telemetry_ring = None
+# None when config['persist'] is false and only the shared memory ring is fed
+telemetry_writer = None
+
+def build_command(command):
+    """Convert a command into the pid_values packet the drone expects.
+
+    Commands written by the dashboard already carry ``pid_values``; commands
+    edited by hand into commands.txt give p/i/d per axis.
+    """
+    if "pid_values" in command:
+        return {"pid_values": command["pid_values"]}
+    return {
+        "pid_values": {
+            "P": {
+                "roll": command["roll"]["p"],
+                "pitch": command["pitch"]["p"],
+                "throttle": command["throttle"]["p"],
+                "yaw": command["yaw"]["p"],
+            },
+            "I": {
+                "roll": command["roll"]["i"],
+                "pitch": command["pitch"]["i"],
+                "throttle": command["throttle"]["i"],
+                "yaw": command["yaw"]["i"],
+            },
+            "D": {
+                "roll": command["roll"]["d"],
+                "pitch": command["pitch"]["d"],
+                "throttle": command["throttle"]["d"],
+                "yaw": command["yaw"]["d"],
+            },
+        }
+    }
+
+class CommandHandler:
+    def __init__(self, host, port, channel, scheduler_options=None):
         self.host = host
         self.port = port
-        self.sock = socket(AF_INET, SOCK_DGRAM)
-        self.last_modified = 0
-        self.cooldown = 0.1  # 100ms cooldown between sends
+        # Confirmations are matched and retransmits scheduled by the channel,
+        # so sending never blocks
+        self.channel = channel
+        # Bursts of edits are coalesced, but the latest one is always sent
+        self.scheduler = CommandScheduler(self.deliver, **(scheduler_options or {}))
         self.last_sent_command = None
-        
-        # Enable receiving responses
-        self.sock.settimeout(1.0)  # 1 second timeout for responses
+        self.last_command_to_send = None
+        # Called with every new command sent, e.g. by the analysis pipeline
+        self.sent_listeners = []
+        # Latest command received over the command socket, not yet sent
+        self.pending_command = None
+        self.lock = threading.Lock()
 
     def on_modified(self, event):
         if not event.is_directory and event.src_path.endswith('commands.txt'):
-            current_time = time.time()
-            if current_time - self.last_modified < self.cooldown:
-                return
-            self.last_modified = current_time
-            self.send_latest_command()
+            self.scheduler.request()
+
+    def submit(self, command):
+        """Queue a command received directly from the dashboard"""
+        with self.lock:
+            self.pending_command = command
+        self.scheduler.request()
+
+    def deliver(self, changed):
+        """Scheduler callback: send the new command, or repeat the last one when streaming"""
+        if changed:
+            with self.lock:
+                command, self.pending_command = self.pending_command, None
+            if command is not None:
+                self.send_command(command)
+            else:
+                self.send_latest_command()
+        elif self.last_command_to_send is not None:
+            self.channel.send_command(self.last_command_to_send)
 
     def send_latest_command(self):
         try:
@@ -45,113 +116,397 @@ class CommandHandler(FileSystemEventHandler):
                 return
 
             # Get the latest command
-            latest_command = commands[-1]
-            
+            self.send_command(commands[-1])
+
+        except Exception as e:
+            logger.error(f"Error sending command: {e}")
+
+    def send_command(self, latest_command):
+        try:
             if self.last_sent_command != latest_command:
                 # Send the complete command including PID values
-                command_to_send = {
-                    "pid_values": {
-                        "P": {
-                            "roll": latest_command["roll"]["p"],
-                            "pitch": latest_command["pitch"]["p"],
-                            "throttle": latest_command["throttle"]["p"],
-                            "yaw": latest_command["yaw"]["p"],
-                        },
-                        "I": {
-                            "roll": latest_command["roll"]["i"],
-                            "pitch": latest_command["pitch"]["i"],
-                            "throttle": latest_command["throttle"]["i"],
-                            "yaw": latest_command["yaw"]["i"],
-                        },
-                        "D": {
-                            "roll": latest_command["roll"]["d"],
-                            "pitch": latest_command["pitch"]["d"],
-                            "throttle": latest_command["throttle"]["d"],
-                            "yaw": latest_command["yaw"]["d"],
-                        },
-                    }
-                }
-
-                
+                command_to_send = build_command(latest_command)
+
                 # Send the command
-                command_bytes = json.dumps(command_to_send).encode()
-                self.sock.sendto(command_bytes, (self.host, self.port))
+                self.channel.send_command(command_to_send)
                 print(f"\nSent command to {self.host}:{self.port}:")
                 print(json.dumps(command_to_send, indent=2))
                 logger.info(f"Sent command: {command_to_send}")
-                
-                # Wait for confirmation
-                try:
-                    response, addr = self.sock.recvfrom(1024)
-                    response_data = json.loads(response.decode())
-                    logger.info(f"Received confirmation from {addr}: {response_data}")
-                except timeout:
-                    logger.warning("No confirmation received from server")
-                
+
                 self.last_sent_command = latest_command
+                self.last_command_to_send = command_to_send
+                for listener in self.sent_listeners:
+                    listener(command_to_send)
 
         except Exception as e:
             logger.error(f"Error sending command: {e}")
 
-def flush_to_file(data, use_json: bool = True):
-    """Function from original main.py to handle data flushing"""
-    global config, columns
+def watch_commands(command_handler, path='.'):
+    """Pass changes to commands.txt to the handler; watchdog is only imported when this is used"""
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    class CommandsFileHandler(FileSystemEventHandler):
+        def on_modified(self, event):
+            command_handler.on_modified(event)
+
+    observer = Observer()
+    observer.schedule(CommandsFileHandler(), path=path, recursive=False)
+    observer.start()
+    return observer
+
+def decode_packet(data):
+    """Decode a telemetry datagram into a dict, or return None if it is malformed"""
+    if wire_protocol.message_type(data) == wire_protocol.TELEMETRY:
+        try:
+            data = wire_protocol.decode_telemetry(data)
+        except ValueError as e:
+            decode_errors.inc()
+            logger.error(f"Error while decoding binary telemetry: {e}")
+            return None
+        packets_decoded.inc()
+        return data
 
     data = data.decode()
 
     if type(data) is not str:
+        decode_errors.inc()
         logging.error(
             "Provided data is not string type. type = {}".format(type(data)))
-        return
+        return None
 
     try:
         data = dict(json.loads(data))
-        print("Received data:", data)
+        logger.debug(f"Received data: {data}")
     except Exception as e:
+        decode_errors.inc()
         logging.error(
             "Error while loading string to json: {}\ndata={}".format(e, data))
+        return None
+    packets_decoded.inc()
+    return data
+
+def make_sink(config):
+    """Create the telemetry sink selected by config['sink'] ("json", "segmented", "columnar" or "csv")"""
+    sink = config.get('sink', 'json')
+    if sink == 'json':
+        return TelemetryLogWriter(config['path_to_save'], config.get('index_interval', 1.0))
+    if sink == 'segmented':
+        from segmented_log import SegmentedLogWriter
+        return SegmentedLogWriter(config['path_to_save'], index_interval=config.get('index_interval', 1.0),
+                                  **config.get('segments', {}))
+    if sink == 'columnar':
+        # NumPy is only needed for the columnar store
+        from columnar_store import ColumnarWriter
+        options = dict(config.get('columnar', {}))
+        path = options.pop('path', os.path.splitext(config['path_to_save'])[0] + '.cols')
+        return ColumnarWriter(path, **options)
+    if sink == 'csv':
+        from csv_log import CsvLogWriter
+        return CsvLogWriter(config['path_to_save'], **config.get('csv', {}))
+    raise ValueError(f"Unknown telemetry sink: {sink}")
+
+def flush_to_file(data, use_json: bool = True, received_at=None):
+    """Function from original main.py to handle data flushing
+
+    Records are handed to a background writer; this never blocks on disk
+    I/O. With ``use_json=False`` they go to a CSV log at
+    config['path_to_save'] instead of the configured sink.
+    """
+    global config, telemetry_writer, csv_writer
+
+    if received_at is None:
+        received_at = time.time()
+
+    data = decode_packet(data)
+    if data is None:
+        return
+
+    if use_json:
+        if telemetry_writer is not None:
+            telemetry_writer.submit(data, received_at)
+    else:
+        if csv_writer is None:
+            csv_writer = BackgroundWriter(make_sink(dict(config, sink='csv')), **config.get('writer', {}))
+            csv_writer.start()
+        csv_writer.submit(data, received_at)
+    return data
+
+def handle_telemetry(data, addr, received_at):
+    """Receiver callback: decode, persist and analyse one telemetry datagram.
+
+    Commands are sent from the telemetry socket, so their confirmations
+    arrive here too and go to the command channel.
+    """
+    if wire_protocol.message_type(data) == wire_protocol.HELLO:
+        version = wire_protocol.decode_hello(data)
+        if command_channel is not None and command_channel.protocol != version:
+            logger.info(f"Drone at {addr} speaks binary protocol version {version}")
+            command_channel.protocol = version
+        return
+    try:
+        confirmation = decode_confirmation(data)
+    except ValueError as e:
+        logger.warning(f"Ignoring malformed confirmation from {addr}: {e}")
+        return
+    if confirmation is not None:
+        if command_channel is not None:
+            command_channel.confirm(confirmation, addr)
         return
+    record = flush_to_file(data, received_at=received_at)
+    if record is None:
+        return
+    if telemetry_ring is not None:
+        telemetry_ring.append(record, received_at)
+    if telemetry_pipeline is not None:
+        telemetry_pipeline.feed(record, received_at)
+
+def make_pipeline(options):
+    """Create the analysis pipeline from config['analytics'], with its own event log"""
+    # NumPy is only needed for the analysis stages
+    from snapshot import SnapshotStore
+    from telemetry_pipeline import ANALYTICS_SNAPSHOT_PATH, StagePipeline, default_stages
+    writer = BackgroundWriter(TelemetryLogWriter(options.get('path', 'analytics.jsonl')),
+                              **options.get('writer', {}))
+    writer.start()
+    return StagePipeline(
+        default_stages(options), writer, SnapshotStore(options.get('snapshot_path', ANALYTICS_SNAPSHOT_PATH)),
+        workers=options.get('workers', 2), queue_size=options.get('queue_size', 10000),
+        summary_interval=options.get('summary_interval', 1.0))
+
+class Recorder:
+    """The running parts of the recorder, as created by start_recorder"""
+
+    def __init__(self, writer, command_channel, command_handler, command_listener,
+                 command_socket_path, receiver, subscription, observer, metrics_server=None, pipeline=None,
+                 ring=None, profiler=None):
+        self.writer = writer
+        self.command_channel = command_channel
+        self.command_handler = command_handler
+        self.command_listener = command_listener
+        self.command_socket_path = command_socket_path
+        self.receiver = receiver
+        self.subscription = subscription
+        self.observer = observer
+        self.metrics_server = metrics_server
+        self.pipeline = pipeline
+        self.ring = ring
+        self.profiler = profiler
 
-    if not use_json:
-        write_cols = False
-        if columns is None and os.path.isfile(config['path_to_save']):
-            f = open(config['path_to_save'], 'r')
-            line = f.readline()
-            columns = line.split(',')
-            logging.warning(
-                "File already exists. Using columns found in the file: {}",
-                columns)
-            write_cols = True
-        elif columns is None:
-            columns = [c for c in data]
-            write_cols = True
-
-        if write_cols:
-            with open(config['path_to_save'], 'a') as f:
-                f.write(','.join(['timestamp'] + columns) + '\n')
-
-        for key in data:
-            if key not in columns:
-                logging.warning("{} column doesn't exist".format(key))
-
-        temp = []
-        for c in columns:
-            val = data.get(c, '')
-            if val == '':
-                logging.warning("{} not found in sent data".format(c))
-            temp.append(val)
-        temp = [time.time()] + temp
-        temp = [str(x) for x in temp]
-
-    with open(config['path_to_save'], 'a') as f:
-        if use_json:
-            f.write(json.dumps(data))
-        else:
-            f.write(','.join(temp) + '\n')
+    def register_metrics(self):
+        """Expose the components' own counters on the metrics endpoint"""
+        receiver, writer, channel = self.receiver, self.writer, self.command_channel
+        REGISTRY.register('telemetry_datagrams_received_total', 'counter',
+                          'Telemetry datagrams received', lambda: receiver.datagrams)
+        REGISTRY.register('telemetry_receive_pauses_total', 'counter',
+                          'Times reading paused because every receive batch was busy', lambda: receiver.pauses)
+        if writer is not None:
+            REGISTRY.register('writer_queue_depth', 'gauge',
+                              'Records waiting for the writer thread', writer.queue.qsize)
+            REGISTRY.register('writer_overflows_total', 'counter',
+                              'Records dropped because the writer queue was full', lambda: writer.overflows)
+            REGISTRY.register('writer_records_written_total', 'counter',
+                              'Records written to the sink', lambda: writer.records_written)
+            REGISTRY.register('writer_bytes_written_total', 'counter',
+                              'Bytes written to the sink', lambda: writer.bytes_written)
+        ring = self.ring
+        if ring is not None:
+            REGISTRY.register('shared_memory_samples_total', 'counter',
+                              'Samples published to the shared memory ring', lambda: ring.written)
+        REGISTRY.register('commands_sent_total', 'counter',
+                          'Command datagrams sent, including retransmits', lambda: channel.sent)
+        REGISTRY.register('commands_retransmits_total', 'counter',
+                          'Command retransmissions', lambda: channel.retransmits)
+        REGISTRY.register('commands_acked_total', 'counter',
+                          'Commands confirmed by the drone', lambda: channel.acks)
+        REGISTRY.register('commands_timeouts_total', 'counter',
+                          'Commands given up on without confirmation', lambda: channel.timeouts)
+        pipeline = self.pipeline
+        if pipeline is not None:
+            REGISTRY.register('analytics_events_total', 'counter',
+                              'Events raised by the analysis stages', lambda: pipeline.events_emitted)
+            REGISTRY.register('analytics_dropped_total', 'counter',
+                              'Records skipped by heavy stages that fell behind',
+                              lambda: pipeline.stats()['dropped'])
+
+    def stats(self):
+        stats = {
+            'receiver': self.receiver.stats(),
+            'commands': self.command_channel.stats(),
+            'scheduler': self.command_handler.scheduler.stats(),
+        }
+        if self.writer is not None:
+            stats['writer'] = self.writer.stats()
+        if self.ring is not None:
+            stats['shared_memory'] = {'name': self.ring.name, 'capacity': self.ring.capacity,
+                                      'samples': self.ring.written}
+        if self.pipeline is not None:
+            stats['analytics'] = self.pipeline.stats()
+        return stats
+
+    def close(self):
+        if self.profiler is not None:
+            # Keep what an open window has collected so far
+            self.profiler.stop()
+        self.subscription.cancel()
+        self.receiver.stop()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        self.command_handler.scheduler.stop()
+        self.command_listener.close()
+        if os.path.exists(self.command_socket_path):
+            os.unlink(self.command_socket_path)
+        self.command_channel.close()
+        self.receiver.sock.close()
+        stop_ingest(self.writer, self.ring, self.pipeline)
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        for name, stats in self.stats().items():
+            logger.info(f"{name} stats: {stats}")
+
+def start_ingest(config):
+    """Create what handle_telemetry feeds: the sink writer, the shared memory ring and analytics.
+
+    Returns (writer, ring, pipeline); each is None when disabled in config.
+    Used by start_recorder, and by replay.py to feed recorded flights
+    through the same path.
+    """
+    global telemetry_writer, telemetry_pipeline, telemetry_ring
+
+    # Persist telemetry from a background thread so the receive loop never waits on disk.
+    # With persist off the log can still be written by `python shm_ring.py` reading the ring
+    telemetry_writer = None
+    if config.get('persist', True):
+        telemetry_writer = BackgroundWriter(make_sink(config), latency_metric='telemetry_persist_latency_seconds',
+                                            **config.get('writer', {}))
+        telemetry_writer.start()
+
+    # Live samples for the dashboard, in shared memory
+    telemetry_ring = None
+    ring_options = config.get('shared_memory', {})
+    if ring_options.get('enabled'):
+        # NumPy is only needed for the ring
+        from shm_ring import SHM_NAME, ShmRingWriter
+        try:
+            telemetry_ring = ShmRingWriter(ring_options.get('name', SHM_NAME), ring_options.get('capacity', 65536))
+            logger.info(f"Publishing telemetry to shared memory ring {telemetry_ring.name}")
+        except RuntimeError as e:
+            # Recording goes on; the live view stays with the ring's current writer
+            logger.error(f"Not publishing to shared memory: {e}")
+
+    # Streaming analytics on the received telemetry, results to disk and the dashboard
+    telemetry_pipeline = None
+    analytics_options = config.get('analytics', {})
+    if analytics_options.get('enabled'):
+        telemetry_pipeline = make_pipeline(analytics_options)
+        telemetry_pipeline.start()
+    return telemetry_writer, telemetry_ring, telemetry_pipeline
+
+def stop_ingest(writer, ring, pipeline):
+    """Stop what start_ingest created, writing out everything still queued"""
+    if pipeline is not None:
+        pipeline.stop()
+        pipeline.writer.stop()
+    if writer is not None:
+        writer.stop()
+    if ring is not None:
+        ring.close()
+    if csv_writer is not None:
+        csv_writer.stop()
+
+async def start_recorder(config, watch_commands_file=True):
+    """Start receiving telemetry and sending commands on the running event loop"""
+    global command_channel
+    loop = asyncio.get_running_loop()
+    drone_address = (config['host'], config['port'])
+
+    # Histograms are only allocated when metrics are on, so enable them before
+    # creating the components that record into them
+    metrics_options = config.get('metrics', {})
+    if metrics_options.get('enabled'):
+        REGISTRY.enable()
+
+    start_ingest(config)
+
+    receiver_options = config.get('receiver', {})
+    telemetry_sock = open_telemetry_socket(
+        receiver_options.get('bind', ['0.0.0.0', 0]), receiver_options.get('rcvbuf'))
+
+    # The drone streams to whichever address it last heard from, so commands go out on the
+    # telemetry socket and their confirmations come back through handle_telemetry
+    command_channel = open_command_channel(loop, telemetry_sock, *drone_address, **config.get('commands', {}))
+    command_handler = CommandHandler(
+        config['host'], config['port'], command_channel, config.get('scheduler'))
+    if telemetry_pipeline is not None:
+        command_handler.sent_listeners.append(telemetry_pipeline.on_command)
+    command_handler.scheduler.start()
+
+    # The dashboard sends commands straight to the handler; commands.txt is still watched
+    # for commands edited by hand
+    command_socket_path = config.get('command_socket', COMMAND_SOCKET_PATH)
+    command_listener, _ = await open_command_listener(loop, command_handler.submit, command_socket_path)
+
+    receiver = TelemetryReceiver(
+        loop, telemetry_sock, handle_telemetry,
+        batch_size=receiver_options.get('batch_size', 64),
+        max_datagram=receiver_options.get('max_datagram', 4096))
+    receiver.start()
+    # With protocol "auto" the binary versions we decode are offered to the drone;
+    # firmware that does not know them keeps sending JSON
+    subscribe = dict(receiver_options.get('subscribe', {"subscribe": "telemetry"}))
+    if config.get('protocol', 'auto') == 'auto':
+        subscribe['protocol'] = list(wire_protocol.SUPPORTED_VERSIONS)
+    subscription = loop.create_task(keep_subscribed(
+        loop, receiver, drone_address, json.dumps(subscribe).encode()))
+
+    # Set up file system observer
+    observer = None
+    if watch_commands_file:
+        observer = watch_commands(command_handler)
+
+    logger.info(f"Started command sender. Listening on {command_socket_path}"
+                + (" and watching commands.txt" if watch_commands_file else ""))
+    logger.info(f"Sending to {config['host']}:{config['port']}")
+    logger.info(f"Receiving telemetry on {telemetry_sock.getsockname()}")
+
+    recorder = Recorder(telemetry_writer, command_channel, command_handler, command_listener,
+                        command_socket_path, receiver, subscription, observer, pipeline=telemetry_pipeline,
+                        ring=telemetry_ring)
+
+    # SIGUSR2 profiles the running recorder for a while (see profiling.py); nothing runs until then
+    if config.get('profiling', {}).get('enabled'):
+        from profiling import make_profiler
+        writer = telemetry_writer
+
+        def counters():
+            counters = {'packets': receiver.datagrams}
+            if writer is not None:
+                counters['records_written'] = writer.records_written
+            return counters
+
+        recorder.profiler = make_profiler(
+            'recorder', config['profiling'], counters=counters, tags={'drone': f"{config['host']}:{config['port']}"},
+            call_later=loop.call_later)
+        if recorder.profiler.install_signal(loop):
+            logger.info(f"Send SIGUSR2 to process {os.getpid()} to profile the recorder")
+    if REGISTRY.enabled:
+        recorder.register_metrics()
+        recorder.metrics_server = MetricsServer(
+            REGISTRY, metrics_options.get('host', '127.0.0.1'), metrics_options.get('port', 9108))
+        recorder.metrics_server.start()
+    return recorder
+
+async def run(config, watch_commands_file=True):
+    """Run the recorder and command sender on one event loop"""
+    recorder = await start_recorder(config, watch_commands_file)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        recorder.close()
 
 def main():
-    global config, columns
-    columns = None
+    global config
 
     # Load configuration
     try:
@@ -162,36 +517,10 @@ def main():
         logger.error(f"Error loading config: {e}")
         return
 
-    # Create command handler
-    command_handler = CommandHandler(config['host'], config['port'])
-
-    # Set up file system observer
-    observer = Observer()
-    observer.schedule(command_handler, path='.', recursive=False)
-    observer.start()
-
-    logger.info(f"Started command sender. Watching for changes in commands.txt")
-    logger.info(f"Sending to {config['host']}:{config['port']}")
-
     try:
-        while True:
-            try:
-                # Try to receive data (from original main.py)
-                data, addr = command_handler.sock.recvfrom(1024 * 4)
-                flush_to_file(data)
-            except timeout:
-                # Timeout is expected, continue the loop
-                continue
-            except Exception as e:
-                logger.error(f"Error receiving data: {e}")
-                continue
-
+        asyncio.run(run(config))
     except KeyboardInterrupt:
-        observer.stop()
-        command_handler.sock.close()
         logger.info("Shutting down command sender...")
-    finally:
-        observer.join()
 
 if __name__ == "__main__":
     main()
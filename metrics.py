@@ -0,0 +1,182 @@
+import bisect
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds for latency histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class NullHistogram:
+    """Stands in for a Histogram while metrics are disabled"""
+    __slots__ = ()
+
+    def observe(self, value):
+        pass
+
+
+NULL_HISTOGRAM = NullHistogram()
+
+
+class MetricsRegistry:
+    """Collects the recorder's metrics for the local metrics endpoint.
+
+    Counters are plain integer increments and always live. Histograms are
+    only allocated while the registry is enabled; otherwise callers get
+    NULL_HISTOGRAM and observing is a no-op. Values that components already
+    track, such as queue depth, are read through ``register`` callbacks at
+    scrape time, so they add nothing to the hot path.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def counter(self, name, help_text):
+        return self._add(name, 'counter', help_text, Counter())
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        if not self.enabled:
+            return NULL_HISTOGRAM
+        return self._add(name, 'histogram', help_text, Histogram(buckets))
+
+    def register(self, name, kind, help_text, read):
+        """Expose a value computed by ``read()`` when the metrics are scraped"""
+        self._add(name, kind, help_text, read)
+
+    def _add(self, name, kind, help_text, metric):
+        with self._lock:
+            self._metrics[name] = (kind, help_text, metric)
+        return metric
+
+    def _items(self):
+        with self._lock:
+            return list(self._metrics.items())
+
+    def snapshot(self):
+        """Return all current values as a JSON-serialisable dict"""
+        values = {}
+        for name, (kind, _, metric) in self._items():
+            if kind == 'histogram':
+                values[name] = {
+                    'buckets': dict(zip([str(b) for b in metric.buckets] + ['+Inf'], metric.counts)),
+                    'sum': metric.sum,
+                    'count': metric.count,
+                }
+            else:
+                values[name] = _read(metric)
+        return values
+
+    def render_prometheus(self):
+        lines = []
+        for name, (kind, help_text, metric) in self._items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(list(metric.buckets) + ['+Inf'], metric.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum {metric.sum}')
+                lines.append(f'{name}_count {metric.count}')
+            else:
+                lines.append(f'{name} {_read(metric)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _read(metric):
+    if isinstance(metric, Counter):
+        return metric.value
+    try:
+        return metric()
+    except Exception as e:
+        logger.debug(f"Metric callback failed: {e}")
+        return None
+
+
+def histogram_quantile(histogram, q):
+    """Estimate a quantile from a snapshot() histogram, returning the bucket upper bound"""
+    total = histogram['count']
+    if not total:
+        return None
+    seen = 0
+    for bound, count in histogram['buckets'].items():
+        seen += count
+        if seen >= q * total:
+            return float(bound)
+    return None
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves REGISTRY as Prometheus text on /metrics and as JSON on /metrics.json"""
+
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9108):
+        # Only loaded when metrics are enabled, it adds to every recorder's start-up otherwise
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry_ = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry_.render_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry_.snapshot()).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-server', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logger.info(f"Serving metrics on http://{self.httpd.server_address[0]}:{self.httpd.server_address[1]}/metrics")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
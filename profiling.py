@@ -0,0 +1,263 @@
+"""Profile a running recorder or dashboard for a fixed window.
+
+Profiling is off unless config['profiling']['enabled'] is set, and even
+then nothing is installed while no window is open: no profiling hook, no
+sampling thread and no allocation tracing, so the cost when off is zero.
+A window is opened with SIGUSR2 (``kill -USR2 <pid>``), or on the
+dashboard with ``POST /admin/profile?seconds=30``, and writes into
+config['profiling']['output_dir']:
+
+- ``<name>-<time>-<pid>.collapsed``: stacks of every thread, sampled every
+  ``interval`` seconds, in the collapsed format of flamegraph.pl and
+  speedscope (mode "sample")
+- ``<name>-<time>-<pid>.pstats``: cProfile of the event loop thread, for
+  ``python -m pstats`` or snakeviz (mode "cprofile", recorder only)
+- ``<name>-<time>-<pid>.alloc.txt``: the ``top`` source lines holding the
+  most memory allocated during the window, from tracemalloc
+- ``<name>-<time>-<pid>.json``: the window's tags (process, session,
+  packet and record rates) and the paths of the files above
+"""
+import cProfile
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = 'profiles'
+MODES = ('sample', 'cprofile')
+
+
+class StackSampler(threading.Thread):
+    """Counts the call stacks of all other threads every ``interval`` seconds"""
+
+    def __init__(self, interval=0.005):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RuntimeProfiler:
+    """Runs one profiling window at a time and writes its reports.
+
+    ``counters()`` returns running totals such as received packets; their
+    rates over the window tag every report. In "cprofile" mode the window
+    has to start and stop on the thread to be profiled, so ``call_later``
+    (e.g. the event loop's) schedules the stop; without it only "sample"
+    is available.
+    """
+
+    def __init__(self, name, output_dir=PROFILE_DIR, duration=30.0, mode='sample', interval=0.005,
+                 trace_allocations=True, traceback_frames=1, top=25, counters=None, tags=None,
+                 call_later=None):
+        self.name = name
+        self.output_dir = output_dir
+        self.duration = duration
+        self.mode = mode
+        self.interval = interval
+        self.trace_allocations = trace_allocations
+        self.traceback_frames = traceback_frames
+        self.top = top
+        self.counters = counters or (lambda: {})
+        self.tags = dict(tags or {})
+        self.call_later = call_later
+        # Identifies the recording or dashboard session the reports belong to
+        self.session = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.active = None
+        self.last_report = None
+        self.windows = 0
+        self._started = 0
+        self._lock = threading.Lock()
+
+    def start(self, duration=None, mode=None):
+        """Open a window; returns False if one is already open"""
+        duration = self.duration if duration is None else duration
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if mode == 'cprofile' and self.call_later is None:
+            raise ValueError("cprofile mode needs an event loop to profile, use sample")
+        with self._lock:
+            if self.active is not None:
+                return False
+            self._started += 1
+            window = {'id': self._started, 'mode': mode, 'duration': duration, 'started': time.time(),
+                      'started_monotonic': time.monotonic(), 'counters': self.counters()}
+            if mode == 'cprofile':
+                window['profile'] = cProfile.Profile()
+                window['profile'].enable()
+            else:
+                window['sampler'] = StackSampler(self.interval)
+                window['sampler'].start()
+            if self.trace_allocations and not tracemalloc.is_tracing():
+                tracemalloc.start(self.traceback_frames)
+                window['tracemalloc'] = True
+            self.active = window
+        # A window stopped early must not take a later one down with its timer
+        (self.call_later or self._timer)(duration, lambda: self.stop(window['id']))
+        logger.info(f"Profiling {self.name} for {duration:g} s ({mode})")
+        return True
+
+    def trigger(self):
+        """Signal handler: open a window with the configured defaults"""
+        if not self.start():
+            logger.info("A profiling window is already open")
+
+    def install_signal(self, loop=None, signum=getattr(signal, 'SIGUSR2', None)):
+        """Open a window on ``signum``; with ``loop`` the handler runs on the event loop"""
+        if signum is None:
+            return False
+        if loop is not None:
+            loop.add_signal_handler(signum, self.trigger)
+        elif threading.current_thread() is threading.main_thread():
+            signal.signal(signum, lambda signum, frame: self.trigger())
+        else:
+            return False
+        return True
+
+    def stop(self, window_id=None):
+        """Close the open window and write its reports; returns the report, or None if none was open"""
+        with self._lock:
+            window = self.active
+            if window is None or (window_id is not None and window['id'] != window_id):
+                return None
+            self.active = None
+        if 'profile' in window:
+            window['profile'].disable()
+        if 'sampler' in window:
+            window['sampler'].stop()
+        elapsed = time.monotonic() - window['started_monotonic']
+        counters = self.counters()
+        base = os.path.join(self.output_dir,
+                            f"{self.name}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(window['started']))}"
+                            f"-{os.getpid()}")
+        os.makedirs(self.output_dir, exist_ok=True)
+        report = dict(self.tags, process=self.name, pid=os.getpid(), session=self.session,
+                      mode=window['mode'], started=window['started'], duration_s=elapsed, files=[])
+        for key, value in counters.items():
+            report[key] = value
+            if key in window['counters'] and elapsed > 0:
+                report[f"{key}_per_s"] = (value - window['counters'][key]) / elapsed
+        if 'profile' in window:
+            window['profile'].dump_stats(base + '.pstats')
+            report['files'].append(base + '.pstats')
+        if 'sampler' in window:
+            window['sampler'].write_collapsed(base + '.collapsed')
+            report['samples'] = window['sampler'].samples
+            report['files'].append(base + '.collapsed')
+        if window.get('tracemalloc'):
+            report['top_allocations'] = self._write_allocations(base + '.alloc.txt', report)
+            report['files'].append(base + '.alloc.txt')
+        with open(base + '.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        self.windows += 1
+        self.last_report = report
+        logger.info(f"Profile of {self.name} written to {base}.*")
+        return report
+
+    def status(self):
+        window = self.active
+        return {
+            'session': self.session,
+            'active': window is not None,
+            'mode': window['mode'] if window else None,
+            'remaining_s': max(0.0, window['duration'] - (time.monotonic() - window['started_monotonic']))
+            if window else None,
+            'windows': self.windows,
+            'last_report': self.last_report,
+        }
+
+    def _write_allocations(self, path, report):
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        stats = snapshot.statistics('lineno')[:self.top]
+        rates = ', '.join(f"{key} {value:.1f}" for key, value in report.items() if key.endswith('_per_s'))
+        with open(path, 'w') as f:
+            f.write(f"# {self.name} session {self.session}, {report['duration_s']:.1f} s window"
+                    f"{', ' + rates if rates else ''}\n")
+            f.write(f"# traced {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n")
+            for stat in stats:
+                f.write(f"{stat}\n")
+        return [{'where': str(stat.traceback), 'size_kib': stat.size / 1024, 'count': stat.count}
+                for stat in stats]
+
+    def _timer(self, delay, callback):
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+
+
+def make_profiler(name, options, base_dir=None, **kwargs):
+    """RuntimeProfiler configured from config['profiling'], or None unless it is enabled.
+
+    A relative ``output_dir`` is taken relative to ``base_dir`` when given.
+    """
+    options = dict(options or {})
+    if not options.pop('enabled', False):
+        return None
+    output_dir = options.pop('output_dir', PROFILE_DIR)
+    if base_dir is not None:
+        output_dir = os.path.join(base_dir, output_dir)
+    return RuntimeProfiler(name, output_dir=output_dir, **options, **kwargs)
+
+
+def register_profile_routes(server, profiler):
+    """Add /admin/profile to a Flask server: GET for status, POST to start a window, DELETE to stop it.
+
+    Only requests from the local host are served.
+    """
+    from flask import jsonify, request
+
+    @server.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+    def admin_profile():
+        if request.remote_addr not in ('127.0.0.1', '::1'):
+            return jsonify({'error': 'profiling is only available from the local host'}), 403
+        if request.method == 'POST':
+            try:
+                seconds = request.args.get('seconds')
+                started = profiler.start(float(seconds) if seconds else None, request.args.get('mode'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if not started:
+                return jsonify(dict(profiler.status(), error='a profiling window is already open')), 409
+        elif request.method == 'DELETE':
+            profiler.stop()
+        return jsonify(profiler.status())
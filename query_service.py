@@ -0,0 +1,418 @@
+"""Query recorded telemetry: fields over a time range, optionally resampled and aggregated.
+
+Works on any store the recorder writes: a columnar store directory, a
+segmented log or a single NDJSON log. Data is read in blocks of columns and
+aggregated with NumPy per block, so large ranges stream with bounded memory.
+Results that fit within the cache limits are kept for repeat queries until
+the underlying store changes.
+
+The dashboard serves the same queries on /api/query, e.g.
+/api/query?fields=roll,throttle&t0=1712000000&t1=1712000600&rate=10&agg=mean,max
+
+Usage: python query_service.py measurements.txt --fields roll,throttle --last 600 --rate 10 --agg mean,max
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from columnar_store import SCHEMA_FILE, TELEMETRY_COLUMNS, ColumnarReader, flatten_record
+from segmented_log import SEGMENTS_SUFFIX, SegmentCatalog
+from telemetry_log import INDEX_SUFFIX, TelemetryLogReader, iter_legacy_records
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES = ('mean', 'min', 'max', 'std', 'count', 'first', 'last')
+
+
+class ColumnarSource:
+    """Reads column blocks straight out of a columnar store"""
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = ColumnarReader(path)
+
+    def version(self):
+        return self.reader.refresh()
+
+    def fields(self):
+        return [name for name in self.reader.columns if name != 'timestamp']
+
+    def blocks(self, names, t0=None, t1=None, block_rows=1 << 20):
+        for name in names:
+            if name not in self.reader.columns:
+                raise ValueError(f"Unknown field {name}")
+        timestamps = self.reader.column('timestamp')
+        start = 0 if t0 is None else int(np.searchsorted(timestamps, t0, side='left'))
+        stop = len(timestamps) if t1 is None else int(np.searchsorted(timestamps, t1, side='right'))
+        for a in range(start, stop, block_rows):
+            b = min(stop, a + block_rows)
+            yield {name: self.reader.column(name, a, b) for name in ['timestamp'] + list(names)}
+
+    def records(self, t0=None, t1=None, block_rows=4096):
+        """Yield the rows with t0 <= timestamp <= t1 as telemetry dicts, oldest first"""
+        timestamps = self.reader.column('timestamp')
+        start = 0 if t0 is None else int(np.searchsorted(timestamps, t0, side='left'))
+        stop = len(timestamps) if t1 is None else int(np.searchsorted(timestamps, t1, side='right'))
+        for a in range(start, stop, block_rows):
+            yield from self.reader.rows_as_records(a, min(stop, a + block_rows))
+
+
+class LogSource:
+    """Turns NDJSON records into column blocks; also covers segmented logs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.catalog = None
+        if os.path.isdir(path + SEGMENTS_SUFFIX):
+            self.catalog = SegmentCatalog(path + SEGMENTS_SUFFIX)
+
+    def version(self):
+        files = [self.path] + ([self.catalog.path] if self.catalog else [])
+        return tuple((st.st_ino, st.st_size, st.st_mtime_ns) for st in map(os.stat, filter(os.path.exists, files)))
+
+    def fields(self):
+        # Fields can be missing from single records, so look at the first few
+        names = {}
+        for i, record in enumerate(self.records(None, None)):
+            names.update(dict.fromkeys(flatten_record(record, None)))
+            if i == 100:
+                break
+        return [name for name in names if name != 'timestamp']
+
+    def records(self, t0=None, t1=None):
+        """Yield the records with t0 <= timestamp <= t1, oldest first"""
+        if self.catalog is not None:
+            yield from self.catalog.read_range(t0, t1)
+        # A segmented log's path links to the active segment, whose index is next to the segment
+        path = os.path.realpath(self.path)
+        if os.path.exists(path + INDEX_SUFFIX):
+            yield from TelemetryLogReader(path).read_range(t0, t1)
+        elif os.path.exists(path):
+            # Logs written before the NDJSON format have no index to seek with
+            for record in iter_legacy_records(path):
+                timestamp = record.get('timestamp')
+                if timestamp is None or (t0 is not None and timestamp < t0):
+                    continue
+                if t1 is not None and timestamp > t1:
+                    break
+                yield record
+
+    def blocks(self, names, t0=None, t1=None, block_rows=1 << 16):
+        # Telemetry fields are known even if the first records lack them
+        known = set(self.fields()).union(name for name, _ in TELEMETRY_COLUMNS)
+        for name in names:
+            if name not in known:
+                raise ValueError(f"Unknown field {name}")
+        names = ['timestamp'] + list(names)
+        nan = float('nan')
+        rows = []
+        for record in self.records(t0, t1):
+            row = flatten_record(record, record['timestamp'])
+            rows.append([row.get(name, nan) for name in names])
+            if len(rows) == block_rows:
+                yield self._columns(names, rows)
+                rows = []
+        if rows:
+            yield self._columns(names, rows)
+
+    def _columns(self, names, rows):
+        data = np.array([[v if isinstance(v, (int, float)) else np.nan for v in row] for row in rows], dtype=float)
+        return {name: data[:, i] for i, name in enumerate(names)}
+
+
+def open_source(path):
+    if os.path.exists(os.path.join(path, SCHEMA_FILE)):
+        return ColumnarSource(path)
+    return LogSource(path)
+
+
+class Query:
+    """Fields over [t0, t1], raw or resampled to ``rate`` Hz with per-bucket aggregates"""
+
+    def __init__(self, fields, t0=None, t1=None, rate=None, aggregates=('mean',), last=None):
+        if not fields:
+            raise ValueError("No fields requested")
+        unknown = [name for name in aggregates if name not in AGGREGATES]
+        if unknown:
+            raise ValueError(f"Unknown aggregate {unknown[0]}, expected one of {', '.join(AGGREGATES)}")
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        self.fields = tuple(fields)
+        self.t0 = t0
+        self.t1 = t1
+        self.rate = rate
+        self.aggregates = tuple(aggregates)
+        self.last = last
+
+    @classmethod
+    def from_params(cls, params):
+        """Build a query from string parameters (HTTP query string or CLI)"""
+        def number(name):
+            value = params.get(name)
+            if value in (None, ''):
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                raise ValueError(f"{name} must be a number")
+        fields = [name.strip() for name in (params.get('fields') or '').split(',') if name.strip()]
+        aggregates = [name.strip() for name in (params.get('agg') or 'mean').split(',') if name.strip()]
+        return cls(fields, number('t0'), number('t1'), number('rate'), aggregates, number('last'))
+
+    def resolve(self, end):
+        """Turn a relative ``last`` window into absolute bounds given the newest timestamp"""
+        if self.last is None or end is None:
+            return self.t0, self.t1
+        return end - self.last, end
+
+    def key(self, t0, t1):
+        return (self.fields, t0, t1, self.rate, self.aggregates if self.rate else None)
+
+
+class Resampler:
+    """Aggregates column blocks into fixed-width time buckets.
+
+    Buckets are aligned to ``origin``; the last bucket of every block is
+    held back and merged with the first bucket of the next block, so
+    buckets that straddle a block boundary come out the same as if the
+    whole range had been processed at once.
+    """
+
+    def __init__(self, fields, step, aggregates, origin=None):
+        self.fields = fields
+        self.step = step
+        self.aggregates = aggregates
+        self.origin = origin
+        self.pending = None
+
+    def feed(self, block):
+        timestamps = block['timestamp']
+        if not len(timestamps):
+            return None
+        if self.origin is None:
+            self.origin = math.floor(timestamps[0] / self.step) * self.step
+        buckets = np.floor((timestamps - self.origin) / self.step).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)]
+        state = {'bucket': buckets[starts]}
+        for name in self.fields:
+            values = np.asarray(block[name], dtype=np.float64)
+            valid = ~np.isnan(values)
+            filled = np.where(valid, values, 0.0)
+            state[name] = {
+                'count': np.add.reduceat(valid.astype(np.int64), starts),
+                'sum': np.add.reduceat(filled, starts),
+                'squares': np.add.reduceat(filled * filled, starts),
+                'min': np.fmin.reduceat(values, starts),
+                'max': np.fmax.reduceat(values, starts),
+                'first': values[starts],
+                'last': values[ends - 1],
+            }
+        if self.pending is not None:
+            state = self._merge(self.pending, state)
+        # Hold back the last bucket, the next block may continue it
+        self.pending = self._slice(state, slice(-1, None))
+        return self._output(self._slice(state, slice(None, -1)))
+
+    def finish(self):
+        pending, self.pending = self.pending, None
+        return self._output(pending) if pending is not None else None
+
+    def _merge(self, pending, state):
+        if pending['bucket'][0] != state['bucket'][0]:
+            return {key: _concat(pending[key], state[key]) for key in state}
+        merged = self._slice(state, slice(None))
+        for name in self.fields:
+            a, b = pending[name], merged[name]
+            for key in ('count', 'sum', 'squares'):
+                b[key][0] += a[key][0]
+            b['min'][0] = np.fmin(a['min'][0], b['min'][0])
+            b['max'][0] = np.fmax(a['max'][0], b['max'][0])
+            b['first'][0] = a['first'][0]
+        return merged
+
+    def _slice(self, state, index):
+        return {key: ({k: v[index].copy() for k, v in value.items()} if isinstance(value, dict) else value[index].copy())
+                for key, value in state.items()}
+
+    def _output(self, state):
+        if not len(state['bucket']):
+            return None
+        table = {'t': self.origin + state['bucket'] * self.step}
+        for name in self.fields:
+            stats = state[name]
+            count = stats['count']
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = stats['sum'] / count
+                for aggregate in self.aggregates:
+                    if aggregate == 'mean':
+                        values = mean
+                    elif aggregate == 'std':
+                        values = np.sqrt(np.maximum(stats['squares'] / count - mean * mean, 0.0))
+                    else:
+                        values = stats[aggregate]
+                    table[f'{name}_{aggregate}'] = values
+        return table
+
+
+def _concat(a, b):
+    if isinstance(a, dict):
+        return {key: np.concatenate((a[key], b[key])) for key in a}
+    return np.concatenate((a, b))
+
+
+class QueryService:
+    """Runs queries against one store and caches results that fit ``cache_rows``"""
+
+    def __init__(self, path, cache_entries=32, cache_rows=200000):
+        self.path = path
+        self.source = open_source(path)
+        self.cache_entries = cache_entries
+        self.cache_rows = cache_rows
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def newest_timestamp(self):
+        if isinstance(self.source, ColumnarSource):
+            self.source.version()
+            timestamps = self.source.reader.column('timestamp')
+            return float(timestamps[-1]) if len(timestamps) else None
+        if os.path.exists(self.path):
+            return TelemetryLogReader(self.path).last_timestamp()
+        return None
+
+    def run(self, query):
+        """Yield result tables ({column: array}), from the cache when possible"""
+        t0, t1 = query.resolve(self.newest_timestamp() if query.last is not None else None)
+        key = (self.source.version(),) + query.key(t0, t1)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is not None:
+            yield from cached
+            return
+
+        kept, rows = [], 0
+        for table in self._evaluate(query, t0, t1):
+            if kept is not None:
+                rows += len(next(iter(table.values())))
+                kept = kept + [table] if rows <= self.cache_rows else None
+            yield table
+        if kept is not None:
+            with self.lock:
+                self.cache[key] = kept
+                while len(self.cache) > self.cache_entries:
+                    self.cache.popitem(last=False)
+
+    def _evaluate(self, query, t0, t1):
+        blocks = self.source.blocks(query.fields, t0, t1)
+        if query.rate is None:
+            yield from blocks
+            return
+        resampler = Resampler(query.fields, 1.0 / query.rate, query.aggregates,
+                              origin=None if t0 is None else math.floor(t0 * query.rate) / query.rate)
+        for block in blocks:
+            table = resampler.feed(block)
+            if table is not None:
+                yield table
+        table = resampler.finish()
+        if table is not None:
+            yield table
+
+    def stream(self, query, output_format='ndjson'):
+        """Yield the encoded result in pieces, one per result table"""
+        header_sent = False
+        for table in self.run(query):
+            names = list(table)
+            if output_format == 'csv':
+                buffer = io.StringIO()
+                np.savetxt(buffer, np.column_stack([table[name] for name in names]), delimiter=',', fmt='%.10g')
+                header = '' if header_sent else ','.join(names) + '\n'
+                yield header + buffer.getvalue().replace('nan', '')
+            else:
+                columns = [np.where(np.isnan(table[name]), None, table[name]).tolist() for name in names]
+                yield ''.join(json.dumps(dict(zip(names, row))) + '\n' for row in zip(*columns))
+            header_sent = True
+
+
+def register_query_routes(server, path):
+    """Serve queries on /api/query and the available fields on /api/query/fields of a Flask app"""
+    from flask import Response, jsonify, request
+
+    service = QueryService(path)
+
+    @server.route('/api/query')
+    def query_endpoint():
+        try:
+            query = Query.from_params(request.args)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        output_format = request.args.get('format', 'ndjson')
+        mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+        stream = service.stream(query, output_format)
+        try:
+            # Fail with a 400 before streaming starts when a field does not exist
+            first = next(stream, '')
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        return Response(_chain(first, stream), mimetype=mimetype)
+
+    @server.route('/api/query/fields')
+    def query_fields():
+        return jsonify(fields=service.source.fields(), newest=service.newest_timestamp(),
+                       cache={'entries': len(service.cache), 'hits': service.hits, 'misses': service.misses})
+
+    return service
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def main_cli():
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Query recorded telemetry")
+    parser.add_argument('path', help="columnar store directory or telemetry log (config['path_to_save'])")
+    parser.add_argument('--fields', required=True, help="comma separated field names, e.g. roll,throttle")
+    parser.add_argument('--between', nargs=2, type=float, metavar=('T0', 'T1'))
+    parser.add_argument('--last', type=float, help="query the last N seconds of the recording")
+    parser.add_argument('--rate', type=float, help="resample to this many buckets per second")
+    parser.add_argument('--agg', default='mean', help=f"comma separated aggregates: {', '.join(AGGREGATES)}")
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='csv')
+    args = parser.parse_args()
+
+    t0, t1 = args.between or (None, None)
+    try:
+        query = Query.from_params({'fields': args.fields, 't0': t0, 't1': t1, 'rate': args.rate,
+                                   'agg': args.agg, 'last': args.last})
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    for piece in QueryService(args.path).stream(query, args.format):
+        sys.stdout.write(piece)
+    sys.stdout.flush()
+    print(f"Query took {time.perf_counter() - started:.3f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main_cli()
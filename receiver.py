@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DatagramBatch:
+    """A preallocated block of receive buffers filled in one drain of the socket"""
+
+    def __init__(self, capacity, max_datagram):
+        self.buffer = bytearray(capacity * max_datagram)
+        view = memoryview(self.buffer)
+        self.slots = [view[i * max_datagram:(i + 1) * max_datagram] for i in range(capacity)]
+        self.lengths = [0] * capacity
+        self.addrs = [None] * capacity
+        self.received_at = [0.0] * capacity
+        self.count = 0
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield bytes(self.slots[i][:self.lengths[i]]), self.addrs[i], self.received_at[i]
+
+
+class TelemetryReceiver:
+    """Receives telemetry datagrams from the asyncio event loop.
+
+    When the socket becomes readable, the reader callback drains it with
+    ``recvfrom_into`` into a preallocated DatagramBatch and returns
+    immediately. A separate task decodes the batch and passes every datagram
+    to ``handler(data, addr, received_at)``. If all batches are waiting to be
+    decoded, reading pauses and the kernel buffer absorbs the burst.
+    """
+
+    def __init__(self, loop, sock, handler, batch_size=64, max_datagram=4096, pool_size=8):
+        self.loop = loop
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.handler = handler
+        self.batch_size = batch_size
+        self._free = [DatagramBatch(batch_size, max_datagram) for _ in range(pool_size)]
+        self._ready = asyncio.Queue()
+        self._reading = False
+        self._task = None
+
+        self.datagrams = 0
+        self.batches = 0
+        self.pauses = 0
+        self.handler_errors = 0
+        self.last_received = None
+        # Resolved with the receive time of the first datagram, for start-up timing
+        self.first_received = loop.create_future()
+
+    def start(self):
+        self._task = self.loop.create_task(self._process_batches())
+        self._resume()
+
+    def stop(self):
+        self._pause()
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self):
+        return {
+            'datagrams': self.datagrams,
+            'batches': self.batches,
+            'pauses': self.pauses,
+            'handler_errors': self.handler_errors,
+            'pending_batches': self._ready.qsize(),
+        }
+
+    def _resume(self):
+        if not self._reading:
+            self.loop.add_reader(self.sock.fileno(), self._on_readable)
+            self._reading = True
+
+    def _pause(self):
+        if self._reading:
+            self.loop.remove_reader(self.sock.fileno())
+            self._reading = False
+
+    def _on_readable(self):
+        if not self._free:
+            self.pauses += 1
+            self._pause()
+            return
+        batch = self._free.pop()
+        count = 0
+        while count < self.batch_size:
+            try:
+                nbytes, addr = self.sock.recvfrom_into(batch.slots[count])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                logger.error(f"Error receiving data: {e}")
+                break
+            batch.lengths[count] = nbytes
+            batch.addrs[count] = addr
+            batch.received_at[count] = time.time()
+            count += 1
+
+        batch.count = count
+        if count:
+            self.datagrams += count
+            self.batches += 1
+            self.last_received = time.monotonic()
+            if not self.first_received.done():
+                self.first_received.set_result(batch.received_at[0])
+            self._ready.put_nowait(batch)
+        else:
+            self._free.append(batch)
+
+    async def _process_batches(self):
+        while True:
+            batch = await self._ready.get()
+            for data, addr, received_at in batch:
+                try:
+                    self.handler(data, addr, received_at)
+                except Exception as e:
+                    self.handler_errors += 1
+                    logger.error(f"Error handling telemetry from {addr}: {e}")
+            batch.count = 0
+            self._free.append(batch)
+            self._resume()
+            # Let the reader callback run between batches
+            await asyncio.sleep(0)
+
+
+def open_telemetry_socket(bind_address=('0.0.0.0', 0), rcvbuf=None):
+    """Create the non-blocking UDP socket telemetry is received on"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind(tuple(bind_address))
+    sock.setblocking(False)
+    return sock
+
+
+async def keep_subscribed(loop, receiver, drone_address, message, interval=1.0):
+    """Announce the telemetry socket to the drone until telemetry flows.
+
+    The drone streams telemetry back to whichever address it last heard
+    from, so the subscription is repeated whenever the stream goes quiet.
+    """
+    while True:
+        last = receiver.last_received
+        if last is None or time.monotonic() - last > interval:
+            try:
+                receiver.sock.sendto(message, drone_address)
+            except OSError as e:
+                logger.warning(f"Could not subscribe to telemetry from {drone_address}: {e}")
+        await asyncio.sleep(interval)
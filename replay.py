@@ -0,0 +1,324 @@
+"""Replay recorded flights through the live pipeline.
+
+A recorded log (NDJSON, segmented, legacy or columnar) is streamed lazily
+with its original timing, at a multiple of it, or as fast as possible.
+Samples either go out as UDP telemetry from a stand-in drone that main.py
+subscribes to like a real one (``--to udp``), or straight into main.py's
+ingest path in this process (``--to ingest``). An ingested replay writes
+the sink configured in config.json; the shared memory ring and analytics
+stay off so a running recorder's live view and event log are not mixed
+with the replay, unless ``--shared-memory`` or ``--analytics`` give the
+replay its own.
+
+On a terminal the replay can be steered by typing ``p`` (pause/resume),
+``s <seconds>`` (seek, from the start of the flight), ``+<seconds>`` or
+``-<seconds>`` (skip) and ``x <speed>`` (0 for as fast as possible).
+
+Usage: python replay.py measurements.txt --speed 4 --to udp --port 5000
+       python replay.py measurements.txt --speed 0 --to ingest --output replayed.txt
+       python replay.py measurements.txt --to ingest --output replayed.txt --analytics replay-analytics.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from query_service import open_source
+from simulator import DroneSimulator
+import wire_protocol
+
+logger = logging.getLogger(__name__)
+
+
+class FlightReplay:
+    """Streams the records of a log to ``emit(record, timestamp)`` on the event loop.
+
+    ``speed`` multiplies the original timing; None replays as fast as
+    possible, yielding to the event loop every ``batch`` records. Gaps in the
+    recording longer than ``max_gap`` seconds (the recorder was stopped) are
+    skipped. ``pause``, ``resume``, ``seek`` and ``set_speed`` take effect
+    immediately, also while waiting for the next record.
+    """
+
+    def __init__(self, path, emit, speed=1.0, start=None, end=None, max_gap=5.0, batch=256):
+        self.path = path
+        self.source = open_source(path)
+        self.emit = emit
+        self.speed = speed
+        self.start = start
+        self.end = end
+        self.max_gap = max_gap
+        self.batch = batch
+        self.paused = False
+        self.finished = False
+        self.position = None
+        self._seek_to = None
+        self._anchor = None
+        self._changed = asyncio.Event()
+
+        self.records = 0
+        self.seeks = 0
+        self.gaps_skipped = 0
+        # How far behind the schedule the replay fell, at worst
+        self.max_behind = 0.0
+        self.started = None
+        self.elapsed = 0.0
+
+    def first_timestamp(self):
+        """Timestamp of the first record of the log, or None if it is empty"""
+        for record in self.source.records():
+            return record['timestamp']
+        return None
+
+    def pause(self):
+        self.paused = True
+        self._changed.set()
+
+    def resume(self):
+        self.paused = False
+        self._changed.set()
+
+    def seek(self, timestamp):
+        """Continue from the first record at or after ``timestamp`` (in the log's time)"""
+        self._seek_to = timestamp
+        self.seeks += 1
+        self._changed.set()
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self._anchor = None
+        self._changed.set()
+
+    async def run(self):
+        """Replay until the end of the log (or ``end``)"""
+        self.started = time.monotonic()
+        target = self.start
+        while True:
+            self._anchor = None
+            self._seek_to = None
+            for record in self.source.records(target, self.end):
+                timestamp = record.pop('timestamp')
+                if not await self._wait_until_due(timestamp):
+                    break
+                self.emit(record, timestamp)
+                self.position = timestamp
+                self.records += 1
+            else:
+                break
+            target = self._seek_to
+        self.elapsed = time.monotonic() - self.started
+        self.finished = True
+
+    async def _wait_until_due(self, timestamp):
+        """Wait until ``timestamp`` is due; False if a seek asked to start over elsewhere"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._seek_to is not None:
+                return False
+            if self.paused:
+                self._anchor = None
+                await self._wait_for_change(None)
+                continue
+            if self.speed is None:
+                if self.records % self.batch == 0:
+                    await asyncio.sleep(0)
+                return True
+            now = loop.time()
+            if self._anchor is not None and self.max_gap is not None \
+                    and timestamp - self.position > self.max_gap:
+                self.gaps_skipped += 1
+                self._anchor = None
+            if self._anchor is None:
+                self._anchor = (now, timestamp)
+            due = self._anchor[0] + (timestamp - self._anchor[1]) / self.speed
+            if due <= now:
+                self.max_behind = max(self.max_behind, now - due)
+                return True
+            await self._wait_for_change(due - now)
+
+    async def _wait_for_change(self, timeout):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    def stats(self):
+        elapsed = self.elapsed if self.finished else time.monotonic() - (self.started or time.monotonic())
+        return {
+            'records': self.records,
+            'position': self.position,
+            'speed': self.speed,
+            'paused': self.paused,
+            'seeks': self.seeks,
+            'gaps_skipped': self.gaps_skipped,
+            'max_behind_ms': self.max_behind * 1000,
+            'elapsed_s': elapsed,
+            'records_per_s': self.records / elapsed if elapsed else None,
+        }
+
+
+class ReplayDrone(DroneSimulator):
+    """A simulated drone that sends recorded samples instead of generated ones.
+
+    It answers subscriptions and confirms commands like DroneSimulator, so
+    main.py can record the replay and send commands during it.
+    """
+
+    def __init__(self, loop, **options):
+        super().__init__(loop, rate=1.0, **options)
+        self.not_subscribed = 0
+
+    async def _stream(self):
+        # Samples come from FlightReplay through emit
+        pass
+
+    def emit(self, record, timestamp):
+        if self.subscriber is None:
+            self.not_subscribed += 1
+            return
+        self.send_sample(record)
+
+    def stats(self):
+        return dict(super().stats(), not_subscribed=self.not_subscribed)
+
+
+def ingest_emitter(handle_telemetry, protocol='json'):
+    """emit() that encodes samples and hands them to main.handle_telemetry as if just received"""
+    address = ('replay', 0)
+    seq = 0
+
+    def emit(record, timestamp):
+        nonlocal seq
+        seq += 1
+        now = time.time()
+        if protocol == 'binary':
+            data = wire_protocol.encode_telemetry(record, seq, now)
+        else:
+            data = json.dumps(record).encode()
+        handle_telemetry(data, address, now)
+    return emit
+
+
+class ReplayConsole:
+    """Steers a FlightReplay from commands typed on stdin (see the module docstring)"""
+
+    def __init__(self, replay, flight_start):
+        self.replay = replay
+        self.flight_start = flight_start
+
+    def handle(self, line):
+        command = line.strip()
+        replay = self.replay
+        try:
+            if command == 'p' and replay.paused:
+                replay.resume()
+            elif command == 'p':
+                replay.pause()
+            elif command.startswith('s '):
+                replay.seek(self.flight_start + float(command[2:]))
+            elif command[:1] in '+-' and command[1:]:
+                replay.seek((replay.position or self.flight_start) + float(command))
+            elif command.startswith('x '):
+                speed = float(command[2:])
+                replay.set_speed(speed if speed > 0 else None)
+            elif command:
+                print("Commands: p, s <seconds>, +<seconds>, -<seconds>, x <speed>")
+                return
+        except ValueError:
+            print(f"Not a number: {command}")
+            return
+        print(json.dumps(replay.stats()))
+
+    def attach(self, loop):
+        loop.add_reader(sys.stdin, lambda: self.handle(sys.stdin.readline()))
+
+
+async def replay_flight(args):
+    loop = asyncio.get_running_loop()
+    speed = args.speed if args.speed > 0 else None
+    stop_ingest = drone = None
+    if args.to == 'udp':
+        _, drone = await loop.create_datagram_endpoint(
+            lambda: ReplayDrone(loop, protocol=args.protocol, tag_packets=not args.plain),
+            local_addr=(args.host, args.port))
+        logger.info(f"Waiting for main.py to subscribe on {args.host}:{args.port}")
+        while drone.subscriber is None:
+            await asyncio.sleep(0.1)
+        emit = drone.emit
+    else:
+        import main
+        with open(args.config) as f:
+            config = json.load(f)
+        if args.output:
+            config['path_to_save'] = args.output
+            # A columnar store goes next to the output instead of config['columnar']['path']
+            config['columnar'] = {k: v for k, v in config.get('columnar', {}).items() if k != 'path'}
+        # Live outputs of a recorder that may be running next to the replay
+        config['shared_memory'] = dict(config.get('shared_memory', {}), enabled=bool(args.shared_memory),
+                                       name=args.shared_memory)
+        config['analytics'] = dict(config.get('analytics', {}), enabled=bool(args.analytics), path=args.analytics,
+                                   snapshot_path=f"{args.analytics}.snapshot.json")
+        if os.path.abspath(config['path_to_save']) == os.path.abspath(args.path):
+            logger.error(f"Not replaying {args.path} into itself, choose another file with --output")
+            return
+        main.config = config
+        ingest = main.start_ingest(config)
+        stop_ingest = lambda: main.stop_ingest(*ingest)
+        emit = ingest_emitter(main.handle_telemetry, args.protocol if args.protocol != 'auto' else 'json')
+
+    replay = FlightReplay(args.path, emit, speed=speed, start=args.start, end=args.end, max_gap=args.max_gap)
+    flight_start = replay.first_timestamp()
+    if flight_start is None:
+        logger.error(f"No timestamped records in {args.path}")
+        return
+    if sys.stdin.isatty():
+        ReplayConsole(replay, flight_start).attach(loop)
+    logger.info(f"Replaying {args.path} at {'maximum speed' if speed is None else f'{speed:g}x'}")
+    try:
+        await replay.run()
+    finally:
+        if sys.stdin.isatty():
+            loop.remove_reader(sys.stdin)
+        if stop_ingest is not None:
+            stop_ingest()
+        if drone is not None:
+            logger.info(f"Replay drone stats: {drone.stats()}")
+            drone.transport.close()
+        logger.info(f"Replay stats: {replay.stats()}")
+
+
+def main_cli():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Replay a recorded flight through the live pipeline")
+    parser.add_argument('path', help="recorded log or columnar store")
+    parser.add_argument('--speed', type=float, default=1.0, help="multiple of the original timing, 0 for maximum")
+    parser.add_argument('--start', type=float, help="first timestamp to replay")
+    parser.add_argument('--end', type=float, help="last timestamp to replay")
+    parser.add_argument('--max-gap', type=float, default=5.0, help="skip pauses in the recording longer than this")
+    parser.add_argument('--to', choices=('udp', 'ingest'), default='udp')
+    parser.add_argument('--host', default='127.0.0.1', help="address of the replay drone (--to udp)")
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--protocol', choices=('auto', 'json', 'binary'), default='auto')
+    parser.add_argument('--plain', action='store_true', help="do not add seq/sent_at to replayed telemetry")
+    parser.add_argument('--config', default='config.json', help="sinks to ingest into (--to ingest)")
+    parser.add_argument('--output', help="write the replay here instead of config['path_to_save'] (--to ingest)")
+    parser.add_argument('--shared-memory', metavar='NAME',
+                        help="publish the replay to this shared memory ring (--to ingest; off by default)")
+    parser.add_argument('--analytics', metavar='PATH',
+                        help="run the analysis stages and write their events here (--to ingest; off by default)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(replay_flight(args))
+    except KeyboardInterrupt:
+        logger.info("Replay stopped")
+
+
+if __name__ == "__main__":
+    main_cli()
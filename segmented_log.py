@@ -0,0 +1,407 @@
+"""Segmented telemetry log with per-segment summaries and retention.
+
+Usage: python segmented_log.py measurements.txt --between 1712000000 1712003600 --where "throttle>1800"
+"""
+import argparse
+import gzip
+import json
+import logging
+import operator
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from telemetry_log import INDEX_SUFFIX, TelemetryLogReader, TelemetryLogWriter, iter_legacy_records
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS_SUFFIX = '.segments'
+CATALOG_FILE = 'catalog.json'
+# Vector fields are summarised per axis, with the same names as the columnar store
+VECTOR_AXES = {'position': 'xyz', 'orientation': 'xyzw'}
+
+CONDITION = re.compile(r'^\s*(\w+)\s*(>=|<=|==|>|<)\s*(-?[\d.eE+-]+)\s*$')
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq}
+
+
+class SegmentSummary:
+    """Running time span, record count and per-field min/max/mean of one segment"""
+
+    def __init__(self):
+        self.count = 0
+        self.start = None
+        self.end = None
+        self.fields = {}
+
+    def add(self, record, timestamp):
+        self.count += 1
+        if timestamp is not None:
+            if self.start is None or timestamp < self.start:
+                self.start = timestamp
+            if self.end is None or timestamp > self.end:
+                self.end = timestamp
+        for key, value in record.items():
+            if key == 'timestamp':
+                continue
+            if isinstance(value, list) and key in VECTOR_AXES:
+                for axis, item in zip(VECTOR_AXES[key], value):
+                    self._add_value(f'{key}_{axis}', item)
+            else:
+                self._add_value(key, value)
+
+    def _add_value(self, name, value):
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value != value:
+            return
+        stats = self.fields.get(name)
+        if stats is None:
+            self.fields[name] = [value, value, value, 1]
+        else:
+            if value < stats[0]:
+                stats[0] = value
+            if value > stats[1]:
+                stats[1] = value
+            stats[2] += value
+            stats[3] += 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'start': self.start,
+            'end': self.end,
+            'fields': {name: {'min': lo, 'max': hi, 'mean': total / n, 'count': n}
+                       for name, (lo, hi, total, n) in self.fields.items()},
+        }
+
+
+def parse_condition(text):
+    """Parse "field>value" into (field, operator, value)"""
+    match = CONDITION.match(text)
+    if match is None:
+        raise ValueError(f"Cannot parse condition {text!r}, expected e.g. 'throttle>1800'")
+    return match.group(1), match.group(2), float(match.group(3))
+
+
+def may_match(summary, condition):
+    """Whether any record of a segment can satisfy the condition, judged from its min/max"""
+    field, op, value = condition
+    stats = summary['fields'].get(field)
+    if stats is None:
+        return False
+    if op in ('>', '>='):
+        return OPERATORS[op](stats['max'], value)
+    if op in ('<', '<='):
+        return OPERATORS[op](stats['min'], value)
+    return stats['min'] <= value <= stats['max']
+
+
+def record_matches(record, condition):
+    field, op, value = condition
+    axes = field.rsplit('_', 1)
+    if field not in record and axes[0] in VECTOR_AXES and len(axes) == 2:
+        try:
+            current = record[axes[0]][VECTOR_AXES[axes[0]].index(axes[1])]
+        except (KeyError, IndexError, ValueError, TypeError):
+            return False
+    else:
+        current = record.get(field)
+    return isinstance(current, (int, float)) and OPERATORS[op](current, value)
+
+
+def iter_time_range(records, t0=None, t1=None):
+    """Records of a time-ordered log without an index that fall in t0..t1"""
+    for record in records:
+        timestamp = record.get('timestamp')
+        if t0 is None and t1 is None:
+            yield record
+            continue
+        if timestamp is None or (t0 is not None and timestamp < t0):
+            continue
+        if t1 is not None and timestamp > t1:
+            break
+        yield record
+
+
+class SegmentCatalog:
+    """The summaries of the closed segments of a segmented log.
+
+    The catalog is a small JSON file next to the segments, rewritten
+    atomically on every change, so tools can pick the segments covering a
+    time window or condition without opening any of them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, CATALOG_FILE)
+        self._lock = threading.Lock()
+
+    def segments(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def add(self, entry):
+        with self._lock:
+            segments = self.segments()
+            segments.append(entry)
+            self._save(segments)
+
+    def update(self, name, **changes):
+        with self._lock:
+            segments = self.segments()
+            for entry in segments:
+                if entry['segment'] == name:
+                    entry.update(changes)
+            self._save([entry for entry in segments if not entry.get('deleted')])
+
+    def _save(self, segments):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.catalog-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(segments, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def find(self, t0=None, t1=None, conditions=()):
+        """Return the catalog entries that may hold records in t0..t1 matching all conditions"""
+        found = []
+        for entry in self.segments():
+            if entry['start'] is None and (t0 is not None or t1 is not None):
+                # Legacy logs without timestamps cannot cover a time window
+                continue
+            if t0 is not None and entry['end'] < t0:
+                continue
+            if t1 is not None and entry['start'] > t1:
+                continue
+            if all(may_match(entry, condition) for condition in conditions):
+                found.append(entry)
+        return found
+
+    def read_range(self, t0=None, t1=None, conditions=()):
+        """Yield the matching records from the segments selected by ``find``"""
+        for entry in self.find(t0, t1, conditions):
+            segment_path = os.path.join(self.directory, entry['segment'])
+            if entry['segment'].startswith('legacy-') and not os.path.exists(segment_path + INDEX_SUFFIX):
+                records = iter_time_range(iter_legacy_records(segment_path), t0, t1)
+            else:
+                records = TelemetryLogReader(segment_path).read_range(t0, t1)
+            for record in records:
+                if all(record_matches(record, condition) for condition in conditions):
+                    yield record
+
+
+class SegmentedLogWriter:
+    """A TelemetryLogWriter that rolls over to a new segment by size or age.
+
+    Segments live in ``<path>.segments/``. ``path`` itself becomes a
+    symlink to the active segment, so the dashboard's TailReader only ever
+    reads the active segment and follows each rollover like a log rotation.
+    A segment is closed once it reaches ``max_bytes`` or spans
+    ``max_seconds``; its summary then goes into the catalog.
+
+    Retention runs on a background thread at start, every
+    ``retention_interval`` seconds and after each rollover: closed segments
+    are gzip-compressed ``compact_after`` seconds after their last record,
+    deleted ``delete_after`` seconds after it, and the oldest are deleted
+    while all segments together exceed ``max_total_bytes``.
+    """
+
+    def __init__(self, path, max_bytes=64 << 20, max_seconds=3600, index_interval=1.0,
+                 compact_after=None, delete_after=None, max_total_bytes=None, retention_interval=60.0):
+        self.path = path
+        self.directory = path + SEGMENTS_SUFFIX
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.index_interval = index_interval
+        self.compact_after = compact_after
+        self.delete_after = delete_after
+        self.max_total_bytes = max_total_bytes
+        self.retention_interval = retention_interval
+        os.makedirs(self.directory, exist_ok=True)
+        self.catalog = SegmentCatalog(self.directory)
+        self.rollovers = 0
+        self._retention = None
+        self._retention_due = threading.Event()
+        self._closed = threading.Event()
+
+        self._adopt_legacy_log()
+        active = self._active_segment()
+        if active is not None:
+            self._open(active, resume=True)
+        else:
+            self._open(self._new_segment_name(time.time()))
+        if compact_after is not None or delete_after is not None or max_total_bytes is not None:
+            self._retention = threading.Thread(target=self._retention_loop, name='segment-retention', daemon=True)
+            self._retention.start()
+
+    @property
+    def offset(self):
+        return self._writer.offset
+
+    def append(self, record, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        if self._segment_start is None:
+            self._segment_start = timestamp
+        elif (self._writer.offset >= self.max_bytes
+              or (self.max_seconds and timestamp - self._segment_start >= self.max_seconds)):
+            self.rollover(timestamp)
+            self._segment_start = timestamp
+        written = self._writer.append(record, timestamp)
+        self.summary.add(record, timestamp)
+        return written
+
+    def flush(self):
+        self._writer.flush()
+
+    def fsync(self):
+        self._writer.fsync()
+
+    def close(self):
+        self._writer.close()
+        if self._retention is not None:
+            self._closed.set()
+            self._retention_due.set()
+            self._retention.join()
+
+    def rollover(self, timestamp=None):
+        """Close the active segment, catalog it and start a new one"""
+        self._writer.close()
+        self._catalog_segment(self.segment, self.summary)
+        self._open(self._new_segment_name(timestamp or time.time()))
+        self.rollovers += 1
+        self._retention_due.set()
+
+    def _retention_loop(self):
+        # Also at start, so limits hold for recorders restarted before they roll over
+        while True:
+            self._retention_due.clear()
+            try:
+                self.apply_retention()
+            except Exception as e:
+                logger.error(f"Error applying segment retention: {e}")
+            self._retention_due.wait(self.retention_interval)
+            if self._closed.is_set():
+                return
+
+    def _open(self, name, resume=False):
+        self.segment = name
+        segment_path = os.path.join(self.directory, name)
+        self.summary = SegmentSummary()
+        if resume:
+            # The recorder stopped before this segment was closed: rebuild its summary
+            for record in TelemetryLogReader(segment_path):
+                self.summary.add(record, record.get('timestamp'))
+        self._segment_start = self.summary.start
+        self._writer = TelemetryLogWriter(segment_path, self.index_interval)
+        # Point the path at the new segment atomically
+        link = self.path + '.tmp-link'
+        if os.path.lexists(link):
+            os.unlink(link)
+        os.symlink(os.path.relpath(segment_path, os.path.dirname(os.path.abspath(self.path))), link)
+        os.replace(link, self.path)
+        logger.info(f"Writing telemetry to segment {segment_path}")
+
+    def _new_segment_name(self, timestamp):
+        existing = [entry['segment'] for entry in self.catalog.segments()]
+        number = 1 + max((int(name.split('-')[1]) for name in existing if name.startswith('segment-')), default=0)
+        return f"segment-{number:06d}-{time.strftime('%Y%m%dT%H%M%S', time.localtime(timestamp))}.jsonl"
+
+    def _active_segment(self):
+        if not os.path.islink(self.path):
+            return None
+        target = os.path.basename(os.readlink(self.path))
+        catalogued = {entry['segment'] for entry in self.catalog.segments()}
+        if target in catalogued or not os.path.exists(os.path.join(self.directory, target)):
+            return None
+        return target
+
+    def _adopt_legacy_log(self):
+        """Move a log written before segmentation into the catalog as a closed segment"""
+        if not os.path.isfile(self.path) or os.path.islink(self.path):
+            return
+        name = f"legacy-{time.strftime('%Y%m%dT%H%M%S', time.localtime(os.path.getmtime(self.path)))}.txt"
+        target = os.path.join(self.directory, name)
+        os.replace(self.path, target)
+        if os.path.exists(self.path + INDEX_SUFFIX):
+            os.replace(self.path + INDEX_SUFFIX, target + INDEX_SUFFIX)
+        summary = SegmentSummary()
+        for record in iter_legacy_records(target):
+            summary.add(record, record.get('timestamp'))
+        self._catalog_segment(name, summary)
+        logger.info(f"Moved existing log {self.path} to segment {target}")
+
+    def _catalog_segment(self, name, summary):
+        segment_path = os.path.join(self.directory, name)
+        self.catalog.add(dict(summary.to_dict(), segment=name, bytes=os.path.getsize(segment_path),
+                              closed=time.time(), compressed=False))
+
+    def apply_retention(self, now=None):
+        """Compact and delete closed segments according to the retention settings"""
+        now = time.time() if now is None else now
+        segments = self.catalog.segments()
+        for entry in segments:
+            age = now - (entry['end'] if entry['end'] is not None else entry['closed'])
+            if self.delete_after is not None and age >= self.delete_after:
+                self._delete(entry)
+            elif self.compact_after is not None and age >= self.compact_after and not entry['compressed']:
+                self._compact(entry)
+        if self.max_total_bytes is not None:
+            segments = self.catalog.segments()
+            total = sum(entry['bytes'] for entry in segments) + self._writer.offset
+            for entry in segments:
+                if total <= self.max_total_bytes:
+                    break
+                total -= entry['bytes']
+                self._delete(entry)
+
+    def _compact(self, entry):
+        segment_path = os.path.join(self.directory, entry['segment'])
+        compressed_path = segment_path + '.gz'
+        with open(segment_path, 'rb') as src, gzip.open(compressed_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        # Offsets in the index do not apply to the compressed file
+        self.catalog.update(entry['segment'], segment=entry['segment'] + '.gz', compressed=True,
+                            bytes=os.path.getsize(compressed_path))
+        for stale in (segment_path, segment_path + INDEX_SUFFIX):
+            if os.path.exists(stale):
+                os.remove(stale)
+        logger.info(f"Compacted segment {entry['segment']}")
+
+    def _delete(self, entry):
+        segment_path = os.path.join(self.directory, entry['segment'])
+        self.catalog.update(entry['segment'], deleted=True)
+        for stale in (segment_path, segment_path + INDEX_SUFFIX):
+            if os.path.exists(stale):
+                os.remove(stale)
+        logger.info(f"Deleted segment {entry['segment']}")
+
+
+def main_cli():
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Find segments of a segmented telemetry log")
+    parser.add_argument('path', help="config['path_to_save'] of the recorder")
+    parser.add_argument('--between', nargs=2, type=float, metavar=('T0', 'T1'))
+    parser.add_argument('--where', action='append', default=[], help="condition such as 'throttle>1800'")
+    parser.add_argument('--records', action='store_true', help="print the matching records instead of segments")
+    args = parser.parse_args()
+
+    catalog = SegmentCatalog(args.path + SEGMENTS_SUFFIX)
+    t0, t1 = args.between or (None, None)
+    conditions = [parse_condition(text) for text in args.where]
+    if args.records:
+        for record in catalog.read_range(t0, t1, conditions):
+            print(json.dumps(record))
+        return
+    for entry in catalog.find(t0, t1, conditions):
+        print(f"{entry['segment']}: {entry['count']} records, {entry['start']} .. {entry['end']}, "
+              f"{entry['bytes'] / 1e6:.1f} MB" + (" (compressed)" if entry['compressed'] else ""))
+
+
+if __name__ == "__main__":
+    main_cli()
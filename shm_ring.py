@@ -0,0 +1,343 @@
+"""Live telemetry in shared memory, from the recorder to the dashboard.
+
+main.py writes every decoded sample into a fixed-size ring of NumPy
+structured records in ``multiprocessing.shared_memory``; the dashboard
+reads the newest samples straight from it, without going through the disk
+or parsing JSON. There is one writer and any number of readers, and
+neither side ever takes a lock.
+
+The ring can also be recorded to a log by a separate process, so the live
+path does not depend on persistence at all:
+
+Usage: python shm_ring.py measurements.jsonl --name drone-telemetry
+"""
+import argparse
+import fcntl
+import logging
+import os
+import secrets
+import tempfile
+import time
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from columnar_store import TELEMETRY_COLUMNS, flatten_record, unflatten_row
+
+logger = logging.getLogger(__name__)
+
+SHM_NAME = 'drone-telemetry'
+MAGIC = 0x4452494E47  # "DRING"
+LAYOUT_VERSION = 1
+# Header words: magic, layout version, capacity, record size, generation,
+# samples written, closed flag, spare
+HEADER_WORDS = 8
+H_MAGIC, H_VERSION, H_CAPACITY, H_ITEMSIZE, H_GENERATION, H_WRITTEN, H_CLOSED = range(7)
+HEADER_BYTES = HEADER_WORDS * 8
+
+# ``sequence`` is the 1-based number of the sample held by a slot, or 0 while
+# the slot is being rewritten
+RING_DTYPE = np.dtype([('sequence', '<u8')] + TELEMETRY_COLUMNS)
+FIELDS = RING_DTYPE.names[1:]
+
+
+def _attach(name):
+    """Open an existing segment without letting this process' resource tracker unlink it at exit"""
+    shm = shared_memory.SharedMemory(name)
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+def lock_path(name):
+    """Lock file held by the writer of a ring for as long as it writes"""
+    return os.path.join(tempfile.gettempdir(), f"{name}.ring.lock")
+
+
+def _unlink(name):
+    try:
+        # Opened without _attach, so the unlink below balances the registration
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+class ShmRingWriter:
+    """Single writer of the telemetry ring.
+
+    A sample is published by zeroing the slot's ``sequence``, writing the
+    fields, setting ``sequence`` to the sample number and finally bumping
+    the header's written count, so a reader that sees the same sequence
+    before and after copying a slot knows it got a consistent sample.
+
+    An existing segment with the same layout is reused and numbering
+    continues where it stopped, so running dashboards stay attached across
+    recorder restarts. Only one process writes a ring at a time: the writer
+    holds an flock on lock_path(name), which the kernel releases even if
+    the writer dies, and a second writer raises RuntimeError.
+    """
+
+    def __init__(self, name=SHM_NAME, capacity=65536):
+        self.name = name
+        self.capacity = capacity
+        size = HEADER_BYTES + capacity * RING_DTYPE.itemsize
+        self._lock = open(lock_path(name), 'a+')
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock.seek(0)
+            owner = self._lock.read().strip() or 'another process'
+            self._lock.close()
+            raise RuntimeError(f"Shared memory ring {name} is already written by process {owner}")
+        self._lock.truncate(0)
+        self._lock.write(str(os.getpid()))
+        self._lock.flush()
+        self.shm = None
+        try:
+            existing = _attach(name)
+        except FileNotFoundError:
+            existing = None
+        if existing is not None:
+            header = np.ndarray((HEADER_WORDS,), dtype='<u8', buffer=existing.buf)
+            if existing.size >= size and header[H_MAGIC] == MAGIC and header[H_VERSION] == LAYOUT_VERSION \
+                    and header[H_CAPACITY] == capacity and header[H_ITEMSIZE] == RING_DTYPE.itemsize:
+                self.shm = existing
+                self.header = header
+                self.header[H_CLOSED] = 0
+                logger.info(f"Reusing shared memory ring {name} at sample {int(header[H_WRITTEN])}")
+            else:
+                # Readers of the old segment see it closed and reattach by name
+                header[H_CLOSED] = 1
+                del header
+                existing.close()
+                _unlink(name)
+        if self.shm is None:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            self.header = np.ndarray((HEADER_WORDS,), dtype='<u8', buffer=self.shm.buf)
+            self.header[:] = 0
+            self.header[[H_MAGIC, H_VERSION, H_CAPACITY, H_ITEMSIZE, H_GENERATION]] = [
+                MAGIC, LAYOUT_VERSION, capacity, RING_DTYPE.itemsize, secrets.randbits(63)]
+            # The segment outlives this process so the dashboard keeps the last samples
+            try:
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            except Exception:
+                pass
+        self.ring = np.ndarray((capacity,), dtype=RING_DTYPE, buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.written = int(self.header[H_WRITTEN])
+
+    def append(self, record, timestamp):
+        flat = flatten_record(record, timestamp)
+        # Missing or non-numeric fields are NaN
+        values = tuple(value if isinstance(value, (int, float)) else np.nan
+                       for value in map(flat.get, FIELDS))
+        sample = self.written + 1
+        slot = self.ring[self.written % self.capacity:][:1]
+        slot['sequence'] = 0
+        slot[0] = (0,) + values
+        slot['sequence'] = sample
+        self.written = sample
+        self.header[H_WRITTEN] = sample
+
+    def close(self):
+        self.header[H_CLOSED] = 1
+        del self.ring, self.header
+        self.shm.close()
+        # Another writer may take over from here
+        self._lock.close()
+
+    def unlink(self):
+        """Remove the segment; readers that still map it keep their copy"""
+        _unlink(self.name)
+
+
+class ShmRingReader:
+    """Reads new samples from the ring; any number of readers may run.
+
+    ``read`` returns the samples written since the previous call as a
+    structured array copied out of the ring in one step. Samples that were
+    overwritten before the reader got to them are counted in ``overruns``.
+    The reader attaches lazily, and reattaches when the recorder replaced
+    the segment.
+    """
+
+    def __init__(self, name=SHM_NAME, backlog=200, check_interval=1.0):
+        self.name = name
+        self.backlog = backlog
+        self.check_interval = check_interval
+        self.shm = None
+        self.ring = None
+        self.header = None
+        self.generation = None
+        self.position = None
+        self.overruns = 0
+        self.torn = 0
+        self._last_check = 0.0
+
+    @property
+    def attached(self):
+        return self.shm is not None
+
+    def attach(self):
+        try:
+            shm = _attach(self.name)
+        except FileNotFoundError:
+            return False
+        header = np.ndarray((HEADER_WORDS,), dtype='<u8', buffer=shm.buf)
+        if header[H_MAGIC] != MAGIC or header[H_VERSION] != LAYOUT_VERSION \
+                or header[H_ITEMSIZE] != RING_DTYPE.itemsize:
+            del header
+            shm.close()
+            return False
+        self.detach()
+        self.shm = shm
+        self.header = header
+        self.ring = np.ndarray((int(header[H_CAPACITY]),), dtype=RING_DTYPE, buffer=shm.buf, offset=HEADER_BYTES)
+        self.generation = int(header[H_GENERATION])
+        written = int(header[H_WRITTEN])
+        self.position = max(0, written - self.backlog)
+        return True
+
+    def detach(self):
+        if self.shm is not None:
+            self.ring = self.header = None
+            self.shm.close()
+            self.shm = None
+
+    @property
+    def closed(self):
+        """True while no recorder is writing to the ring"""
+        return self.shm is None or bool(self.header[H_CLOSED])
+
+    def _replaced(self):
+        """True if the recorder put a new segment under the ring's name"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        try:
+            shm = _attach(self.name)
+        except FileNotFoundError:
+            return False
+        header = np.ndarray((HEADER_WORDS,), dtype='<u8', buffer=shm.buf)
+        replaced = int(header[H_GENERATION]) != self.generation
+        del header
+        shm.close()
+        return replaced
+
+    def read(self, limit=None):
+        """Return the samples written since the last call, oldest first"""
+        if self.shm is None and not self.attach():
+            return np.zeros(0, dtype=RING_DTYPE)
+        written = int(self.header[H_WRITTEN])
+        capacity = len(self.ring)
+        if written == self.position and self._replaced() and self.attach():
+            # Everything in the new segment is new to this reader
+            capacity = len(self.ring)
+            written = int(self.header[H_WRITTEN])
+            self.position = max(0, written - capacity)
+        if written < self.position:
+            # The writer started over
+            self.position = max(0, written - self.backlog)
+        start = max(self.position, written - capacity)
+        self.overruns += start - self.position
+        if limit is not None:
+            start = max(start, written - limit)
+        if written == start:
+            self.position = written
+            return np.zeros(0, dtype=RING_DTYPE)
+        index = np.arange(start, written) % capacity
+        samples = self.ring[index]
+        # A slot rewritten while it was copied has a different sequence now
+        expected = np.arange(start + 1, written + 1, dtype=np.uint64)
+        valid = (samples['sequence'] == expected) & (self.ring['sequence'][index] == expected)
+        if not valid.all():
+            self.torn += int((~valid).sum())
+            samples = samples[valid]
+        self.position = written
+        return samples
+
+    def skip(self):
+        """Skip to the newest sample without reading anything"""
+        if self.shm is not None:
+            self.position = int(self.header[H_WRITTEN])
+
+    def close(self):
+        self.detach()
+
+
+def sample_records(samples):
+    """Turn ring samples into the dicts the rest of the code expects"""
+    records = []
+    for row in samples.tolist():
+        # Fields the sample did not carry are NaN and left out, as in the log
+        record = unflatten_row({name: value for name, value in zip(FIELDS, row[1:]) if value == value})
+        records.append(record)
+    return records
+
+
+class ShmRingTail:
+    """Follows the shared-memory ring; a drop-in for TailReader.
+
+    Until the recorder has created the ring, ``fallback`` (e.g. a TailReader
+    on the log) is polled instead.
+    """
+
+    def __init__(self, name=SHM_NAME, max_records=200, fallback=None):
+        self.reader = ShmRingReader(name, backlog=max_records)
+        self.records = deque(maxlen=max_records)
+        self.fallback = fallback
+
+    def latest(self):
+        if not self.reader.attached and self.fallback is not None:
+            return self.fallback.latest()
+        return self.records[-1] if self.records else None
+
+    def poll(self):
+        if not self.reader.attached:
+            if not self.reader.attach():
+                return self.fallback.poll() if self.fallback is not None else []
+            if self.fallback is not None and self.fallback.latest() is not None:
+                # The backlog was already read from the log
+                self.records.extend(self.fallback.records)
+                self.reader.skip()
+        new_records = sample_records(self.reader.read())
+        self.records.extend(new_records)
+        return new_records
+
+
+def main_cli():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Record the shared-memory telemetry ring to a log")
+    parser.add_argument('path', help="NDJSON log to append to")
+    parser.add_argument('--name', default=SHM_NAME)
+    parser.add_argument('--interval', type=float, default=0.05, help="seconds between reads of the ring")
+    args = parser.parse_args()
+
+    from background_writer import BackgroundWriter
+    from telemetry_log import TelemetryLogWriter
+
+    reader = ShmRingReader(args.name, backlog=0)
+    writer = BackgroundWriter(TelemetryLogWriter(args.path))
+    writer.start()
+    try:
+        while True:
+            for record in sample_records(reader.read()):
+                writer.submit(record, record.pop('timestamp'))
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info(f"Stopping, {reader.overruns} samples overrun, {reader.torn} torn reads")
+    finally:
+        writer.stop()
+        reader.close()
+
+
+if __name__ == "__main__":
+    main_cli()
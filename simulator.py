@@ -0,0 +1,265 @@
+"""Stand-in drone for exercising main.py and dashboard.py without hardware.
+
+The simulator listens on the drone's UDP port and, like the firmware,
+streams telemetry to whichever address it last heard from: a ``subscribe``
+message or a PID command sent from another socket moves the stream there.
+Commands (datagrams with ``pid_values``) are confirmed with
+``{"status": "ok", "seq": <seq>}``. Telemetry is emitted at a configurable
+rate, optionally in bursts, with injectable loss and reordering.
+
+With ``--protocol auto`` the simulator answers a subscribe message that
+offers binary protocol versions (see wire_protocol) with a HELLO and then
+streams binary telemetry; ``json`` or ``binary`` force one encoding.
+Commands are accepted in both encodings and confirmed in the one they
+arrived in.
+
+Usage: python simulator.py --port 5000 --rate 200 --loss 0.01 --protocol auto --drones 1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+
+import wire_protocol
+
+logger = logging.getLogger(__name__)
+
+
+def make_sample(t, pid_values=None):
+    """Build a telemetry sample in the shape the drone sends"""
+    gain = 1.0
+    if pid_values:
+        gain = 1.0 + 0.01 * pid_values.get("P", {}).get("roll", 0.0)
+    yaw_angle = 0.2 * t
+    return {
+        "roll": 1500.0 + round(20 * math.sin(0.5 * t)),
+        "pitch": 1500.0 + round(20 * math.cos(0.5 * t)),
+        "throttle": 1200.0 + round(100 * math.sin(0.1 * t)),
+        "yaw": 1500.0,
+        "pid_x": gain * 10 * math.sin(2.0 * t),
+        "pid_y": gain * 10 * math.cos(2.0 * t),
+        "pid_z": gain * -13.0 + math.sin(0.3 * t),
+        "pid_yaw": gain * -12.9 + math.cos(0.3 * t),
+        "position": [20 * math.cos(0.2 * t), 20 * math.sin(0.2 * t), 5 + math.sin(0.1 * t)],
+        "orientation": [0.0, 0.0, math.sin(yaw_angle / 2), math.cos(yaw_angle / 2)],
+    }
+
+
+class DroneSimulator(asyncio.DatagramProtocol):
+    """UDP drone that streams telemetry to its subscriber and confirms commands.
+
+    ``rate`` is the average number of telemetry packets per second; they are
+    sent in bursts of ``burst`` back-to-back packets. ``loss`` drops that
+    fraction of telemetry packets and ``ack_loss`` of confirmations, and
+    ``reorder`` holds a packet back so it is sent after the next one. With
+    ``tag_packets`` every sample also carries ``seq`` and ``sent_at`` so the
+    receiving side can measure loss and latency; binary telemetry always
+    carries them in its header.
+    """
+
+    def __init__(self, loop, rate=100.0, burst=1, loss=0.0, reorder=0.0, ack_loss=0.0,
+                 tag_packets=True, seed=None, protocol='auto', drone_id=None):
+        self.loop = loop
+        self.rate = rate
+        self.burst = burst
+        self.loss = loss
+        self.reorder = reorder
+        self.ack_loss = ack_loss
+        self.tag_packets = tag_packets
+        self.protocol = protocol
+        # Sent as ``drone_id`` in JSON telemetry so a fleet recorder can tell drones apart
+        self.drone_id = drone_id
+        # Binary protocol version agreed with the subscriber, None for JSON
+        self.version = None
+        self.random = random.Random(seed)
+        self.transport = None
+        self.subscriber = None
+        self.pid_values = None
+        self._held = None
+        self._task = None
+        self._start = time.monotonic()
+
+        self.telemetry_seq = 0
+        self.telemetry_sent = 0
+        self.telemetry_dropped = 0
+        self.reordered = 0
+        self.commands_received = 0
+        self.acks_sent = 0
+        self.acks_dropped = 0
+        # Times the stream moved to another address
+        self.redirects = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._task = self.loop.create_task(self._stream())
+
+    def connection_lost(self, exc):
+        if self._task is not None:
+            self._task.cancel()
+
+    def datagram_received(self, data, addr):
+        binary = wire_protocol.message_type(data) == wire_protocol.COMMAND
+        try:
+            message = wire_protocol.decode_command(data) if binary else json.loads(data.decode())
+        except Exception:
+            logger.warning(f"Simulator ignoring malformed datagram from {addr}")
+            return
+        if "subscribe" in message:
+            self._subscribe(message, addr)
+            return
+        if "pid_values" not in message:
+            logger.warning(f"Simulator ignoring unknown message from {addr}: {message}")
+            return
+
+        self._follow(addr)
+        self.commands_received += 1
+        self.pid_values = message.get("pid_values", self.pid_values)
+        if self.random.random() < self.ack_loss:
+            self.acks_dropped += 1
+            return
+        if binary:
+            ack = wire_protocol.encode_ack(message["seq"], timestamp=time.time())
+        else:
+            ack = json.dumps({"status": "ok", "seq": message.get("seq")}).encode()
+        self.transport.sendto(ack, addr)
+        self.acks_sent += 1
+
+    def _subscribe(self, message, addr):
+        if self.protocol == 'binary':
+            version = wire_protocol.VERSION
+        elif self.protocol == 'auto':
+            version = wire_protocol.negotiate(message.get("protocol"))
+        else:
+            version = None
+        if self.subscriber != addr or self.version != version:
+            encoding = f"binary protocol version {version}" if version else "JSON"
+            logger.info(f"Streaming telemetry to {addr} as {encoding}")
+            self.redirects += self.subscriber not in (None, addr)
+        self.subscriber = addr
+        self.version = version
+        if version is not None:
+            self.transport.sendto(wire_protocol.encode_hello(version, time.time()), addr)
+
+    def _follow(self, addr):
+        """Stream to the last sender, in the encoding already agreed"""
+        if self.subscriber != addr:
+            logger.info(f"Streaming telemetry to {addr}, which sent the last command")
+            self.redirects += self.subscriber is not None
+            self.subscriber = addr
+
+    def stats(self):
+        return {
+            'telemetry_sent': self.telemetry_sent,
+            'telemetry_dropped': self.telemetry_dropped,
+            'reordered': self.reordered,
+            'commands_received': self.commands_received,
+            'acks_sent': self.acks_sent,
+            'acks_dropped': self.acks_dropped,
+            'redirects': self.redirects,
+        }
+
+    async def _stream(self):
+        interval = self.burst / self.rate
+        next_burst = time.monotonic()
+        while True:
+            now = time.monotonic()
+            # Catch up on bursts that are due so the average rate holds even
+            # when the event loop wakes up late
+            while next_burst <= now:
+                if self.subscriber is not None:
+                    for _ in range(self.burst):
+                        self._emit()
+                next_burst += interval
+            await asyncio.sleep(max(0.0, next_burst - time.monotonic()))
+
+    def _emit(self):
+        self.send_sample(make_sample(time.monotonic() - self._start, self.pid_values))
+
+    def send_sample(self, sample):
+        """Send one telemetry sample to the subscriber, subject to the injected loss and reordering"""
+        self.telemetry_seq += 1
+        if self.random.random() < self.loss:
+            self.telemetry_dropped += 1
+            return
+        if self.version is not None:
+            payload = wire_protocol.encode_telemetry(sample, self.telemetry_seq, time.time())
+        else:
+            if self.tag_packets:
+                sample["seq"] = self.telemetry_seq
+                sample["sent_at"] = time.time()
+            if self.drone_id is not None:
+                sample["drone_id"] = self.drone_id
+            payload = json.dumps(sample).encode()
+        if self._held is None and self.random.random() < self.reorder:
+            self._held = payload
+            self.reordered += 1
+            return
+        self._send(payload)
+        if self._held is not None:
+            self._send(self._held)
+            self._held = None
+
+    def _send(self, payload):
+        self.transport.sendto(payload, self.subscriber)
+        self.telemetry_sent += 1
+
+
+async def start_simulator(host='127.0.0.1', port=5000, **options):
+    """Start a DroneSimulator on the running loop and return it"""
+    loop = asyncio.get_running_loop()
+    _, simulator = await loop.create_datagram_endpoint(
+        lambda: DroneSimulator(loop, **options), local_addr=(host, port))
+    return simulator
+
+
+async def serve(args):
+    simulators = []
+    # A fleet is simulated as drones on consecutive ports
+    for i in range(args.drones):
+        drone_id = args.drone_id if args.drones == 1 else f"{args.drone_id or 'drone'}-{i}"
+        simulators.append(await start_simulator(
+            args.host, args.port + i, rate=args.rate, burst=args.burst, loss=args.loss,
+            reorder=args.reorder, ack_loss=args.ack_loss, tag_packets=not args.plain, seed=args.seed,
+            protocol=args.protocol, drone_id=drone_id))
+        logger.info(f"Simulated drone {drone_id or ''} listening on {args.host}:{args.port + i} at {args.rate} Hz")
+    try:
+        while True:
+            await asyncio.sleep(5)
+            for simulator in simulators:
+                logger.info(f"Simulator {simulator.drone_id or ''} stats: {simulator.stats()}")
+    finally:
+        for simulator in simulators:
+            simulator.transport.close()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Simulated drone for local testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=100.0, help="telemetry packets per second")
+    parser.add_argument('--burst', type=int, default=1, help="packets sent back to back per burst")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of telemetry packets dropped")
+    parser.add_argument('--reorder', type=float, default=0.0, help="fraction of telemetry packets reordered")
+    parser.add_argument('--ack-loss', type=float, default=0.0, help="fraction of confirmations dropped")
+    parser.add_argument('--plain', action='store_true', help="do not add seq/sent_at to telemetry")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--protocol', choices=('auto', 'json', 'binary'), default='auto',
+                        help="telemetry encoding; auto uses binary when the subscriber offers it")
+    parser.add_argument('--drone-id', help="drone_id sent with JSON telemetry")
+    parser.add_argument('--drones', type=int, default=1, help="number of drones, on consecutive ports")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        logger.info("Shutting down simulator...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Prefer RAM-backed storage so publishing a snapshot never touches the disk
+SNAPSHOT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, 'drone-dashboard-snapshot.json')
+
+
+class SnapshotStore:
+    """A JSON snapshot shared by every dashboard worker process on the host.
+
+    Snapshots are published by writing a temporary file and renaming it over
+    the previous one, so readers always see a complete snapshot. Each
+    process keeps the last snapshot it parsed and only re-reads the file when
+    it changed, which costs one ``stat`` per read.
+
+    In the process that publishes, ``published`` is notified after every
+    publish, so threads waiting for a new snapshot need not poll.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self._cached = None
+        self._cached_key = None
+        # Set once a SnapshotPublisher in this process leads for this store
+        self.local_publisher = False
+        self.publishes = 0
+        self.published = threading.Condition()
+
+    def publish(self, snapshot):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.snapshot-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.path)
+        with self.published:
+            self.publishes += 1
+            self.published.notify_all()
+
+    def read(self):
+        """Return the current snapshot (shared, do not modify it) or None"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key != self._cached_key:
+            try:
+                with open(self.path) as f:
+                    self._cached = json.load(f)
+                self._cached_key = key
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Could not read dashboard snapshot: {e}")
+        return self._cached
+
+
+class SnapshotPublisher(threading.Thread):
+    """Builds one snapshot per tick for all dashboard sessions.
+
+    Only the process holding an exclusive lock on ``<store path>.lock``
+    ingests telemetry; in every other worker the thread just keeps trying to
+    take the lock, so another worker takes over if the leader exits.
+    ``build(latest_record, previous_snapshot)`` derives the snapshot from the
+    newest record; the optional ``ingest(records)`` receives every new record.
+    """
+
+    def __init__(self, store, reader, build, interval=0.1, ingest=None):
+        super().__init__(name='snapshot-publisher', daemon=True)
+        self.store = store
+        self.reader = reader
+        self.build = build
+        self.ingest = ingest
+        self.interval = interval
+        self.previous = None
+        self.is_leader = False
+        self._lock_file = None
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            if self.is_leader or self._try_lead():
+                try:
+                    self.publish_once()
+                except Exception as e:
+                    logger.error(f"Error building dashboard snapshot: {e}")
+            self._stopped.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def publish_once(self):
+        """Ingest new telemetry and publish a snapshot if anything arrived"""
+        records = self.reader.poll()
+        if not records:
+            return None
+        if self.ingest is not None:
+            self.ingest(records)
+        snapshot = self.build(self.reader.latest(), self.previous)
+        self.store.publish(snapshot)
+        self.previous = snapshot
+        return snapshot
+
+    def _try_lead(self):
+        if self._lock_file is None:
+            self._lock_file = open(self.store.path + '.lock', 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self.is_leader = True
+        self.store.local_publisher = True
+        # Continue from the last published snapshot so sessions keep their place
+        self.previous = self.store.read()
+        logger.info(f"Process {os.getpid()} is now publishing dashboard snapshots")
+        return True
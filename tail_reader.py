@@ -0,0 +1,129 @@
+import codecs
+import json
+import logging
+import os
+import re
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# A record boundary is the closing brace of one object followed (optionally
+# after whitespace) by the opening brace of the next one.
+RECORD_BOUNDARY = re.compile(r'}\s*{')
+
+
+class TailReader:
+    """Follows a telemetry log and parses only what was appended since the last poll.
+
+    The reader remembers its byte offset between calls, so the cost of a poll
+    depends on how much data arrived rather than on the size of the file.
+    Truncation (the file shrank) and rotation (the path now points to a
+    different inode) are detected on every poll and handled by starting over
+    at the beginning of the new file, after reading what was left of the
+    rotated one.
+    """
+
+    def __init__(self, path, max_records=200, backlog_bytes=None):
+        self.path = path
+        self.records = deque(maxlen=max_records)
+        # When attaching to an existing file only its tail is parsed; by
+        # default that is enough bytes for a full window of records.
+        self.backlog_bytes = backlog_bytes if backlog_bytes is not None else max_records * 512
+        self.offset = 0
+        self.inode = None
+        self._file = None
+        self.parse_errors = 0
+        self._pending = ''
+        self._resync = False
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def latest(self):
+        """Return the most recent record, or None if nothing was read yet"""
+        return self.records[-1] if self.records else None
+
+    def poll(self):
+        """Read and parse newly appended records. Returns the list of new records."""
+        try:
+            st = os.stat(self.path)
+            new_records = []
+            if self.inode is None:
+                # First attach: skip straight to the tail of an existing file
+                self._reset(max(0, st.st_size - self.backlog_bytes))
+            elif st.st_ino != self.inode:
+                # Finish the old file first, its writer has moved on to the new one
+                new_records = self._read_available()
+                logger.info(f"{self.path} was rotated, reading the new file from the start")
+                self._reset(0)
+            elif st.st_size < self.offset:
+                logger.info(f"{self.path} was truncated, clearing the telemetry window")
+                self.records.clear()
+                self._reset(0)
+        except FileNotFoundError:
+            return []
+
+        new_records += self._read_available()
+        self.records.extend(new_records)
+        return new_records
+
+    def _read_available(self):
+        chunk = self._file.read()
+        if not chunk:
+            return []
+        self.offset += len(chunk)
+
+        text = self._pending + self._utf8.decode(chunk)
+        self._pending = ''
+        if self._resync:
+            text = self._skip_partial_record(text)
+            if text is None:
+                return []
+        return self._parse(text)
+
+    def _reset(self, offset):
+        # The reader keeps the file open, so data appended to it just before
+        # a rotation can still be read after the path moved on
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'rb')
+        self._file.seek(offset)
+        self.inode = os.fstat(self._file.fileno()).st_ino
+        self.offset = offset
+        self._pending = ''
+        self._utf8.reset()
+        # Starting in the middle of a file means the first record is partial
+        self._resync = offset > 0
+
+    def _skip_partial_record(self, text):
+        match = RECORD_BOUNDARY.search(text)
+        if match is None:
+            # Keep waiting until a boundary shows up
+            self._pending = text
+            return None
+        self._resync = False
+        return text[match.start() + 1:]
+
+    def _parse(self, text):
+        records = []
+        pos = 0
+        end = len(text)
+        while True:
+            while pos < end and text[pos].isspace():
+                pos += 1
+            if pos >= end:
+                break
+            try:
+                record, pos = self._decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                match = RECORD_BOUNDARY.search(text, pos)
+                if match is None:
+                    # Most likely a record that is still being written
+                    break
+                self.parse_errors += 1
+                logger.warning(f"Skipping malformed telemetry record at offset {pos}")
+                pos = match.start() + 1
+                continue
+            if isinstance(record, dict):
+                records.append(record)
+        self._pending = text[pos:]
+        return records
@@ -0,0 +1,207 @@
+import gzip
+import json
+import logging
+import os
+import struct
+import time
+
+from tail_reader import RECORD_BOUNDARY
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.idx'
+# Sparse index entry: receive timestamp, byte offset of the record in the log
+INDEX_ENTRY = struct.Struct('<dQ')
+
+
+class TelemetryLogWriter:
+    """Appends telemetry records as newline-delimited JSON with a sidecar time index.
+
+    Every record carries a ``timestamp`` field with its receive time. Every
+    ``index_interval`` seconds the writer also appends a (timestamp, offset)
+    entry to ``<path>.idx`` so readers can seek to a point in time without
+    scanning the log.
+    """
+
+    def __init__(self, path, index_interval=1.0):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.index_interval = index_interval
+        self._file = open(path, 'ab')
+        self._index = open(self.index_path, 'ab')
+        self.offset = self._file.tell()
+        self._last_indexed = self._read_last_index_time()
+
+        if self.offset > 0 and not self._ends_with_newline():
+            # Appending to a legacy concatenated log: start on a fresh line
+            self._file.write(b'\n')
+            self.offset += 1
+
+    def append(self, record, timestamp=None):
+        """Write one record and return the number of bytes written"""
+        if timestamp is None:
+            timestamp = time.time()
+        # The receive time wins over a timestamp in the payload, the index relies on its order
+        line = (json.dumps({**record, 'timestamp': timestamp}) + '\n').encode()
+
+        if timestamp - self._last_indexed >= self.index_interval:
+            self._index.write(INDEX_ENTRY.pack(timestamp, self.offset))
+            self._last_indexed = timestamp
+
+        self._file.write(line)
+        self.offset += len(line)
+        return len(line)
+
+    def flush(self):
+        # Data goes out first so index entries never point past the end of the log
+        self._file.flush()
+        self._index.flush()
+
+    def fsync(self):
+        os.fsync(self._file.fileno())
+        os.fsync(self._index.fileno())
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _read_last_index_time(self):
+        size = os.path.getsize(self.index_path)
+        if size < INDEX_ENTRY.size:
+            return float('-inf')
+        with open(self.index_path, 'rb') as f:
+            f.seek(size - size % INDEX_ENTRY.size - INDEX_ENTRY.size)
+            timestamp, _ = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+        return timestamp
+
+
+class TelemetryLogReader:
+    """Reads time ranges out of a log written by TelemetryLogWriter.
+
+    The start of a range is located with a binary search over the on-disk
+    index, so only O(log n) index entries are read before streaming the
+    matching records. Logs without an index, and gzip-compressed logs
+    (``.gz``), are scanned from the start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+
+    def __iter__(self):
+        return self.read_range()
+
+    def read_range(self, t0=None, t1=None):
+        """Yield records with t0 <= timestamp <= t1 (either bound may be None)"""
+        compressed = self.path.endswith('.gz')
+        offset = self._find_offset(t0) if t0 is not None and not compressed else 0
+        with (gzip.open if compressed else open)(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed record in {self.path}")
+                    continue
+                timestamp = record.get('timestamp')
+                if timestamp is None:
+                    continue
+                if t0 is not None and timestamp < t0:
+                    continue
+                if t1 is not None and timestamp > t1:
+                    break
+                yield record
+
+    def read_last(self, seconds):
+        """Yield the records received during the last ``seconds`` of the log"""
+        end = self.last_timestamp()
+        if end is None:
+            return iter(())
+        return self.read_range(end - seconds, end)
+
+    def last_timestamp(self, block_size=4096):
+        """Return the timestamp of the final record without reading the whole file"""
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            tail = b''
+            while end > 0:
+                start = max(0, end - block_size)
+                f.seek(start)
+                tail = f.read(end - start) + tail
+                end = start
+                lines = tail.strip().split(b'\n')
+                # The first line may be cut off unless we reached the start of the file
+                for line in reversed(lines if start == 0 else lines[1:]):
+                    try:
+                        return json.loads(line)['timestamp']
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue
+        return None
+
+    def _find_offset(self, timestamp):
+        """Binary search the index for the last entry at or before ``timestamp``"""
+        if not os.path.exists(self.index_path):
+            return 0
+        count = os.path.getsize(self.index_path) // INDEX_ENTRY.size
+        offset = 0
+        with open(self.index_path, 'rb') as f:
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                f.seek(mid * INDEX_ENTRY.size)
+                entry_time, entry_offset = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+                if entry_time <= timestamp:
+                    offset = entry_offset
+                    lo = mid + 1
+                else:
+                    hi = mid
+        return offset
+
+
+def iter_legacy_records(path, chunk_size=1 << 16):
+    """Stream records from a log of concatenated JSON objects.
+
+    This is the format written before records were newline framed. It also
+    accepts newline-delimited logs, and files that switch from one format to
+    the other, so it can be used on any telemetry log.
+    """
+    decoder = json.JSONDecoder()
+    pending = ''
+    with (gzip.open if path.endswith('.gz') else open)(path, 'rt') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            text = pending + chunk
+            pos = 0
+            while True:
+                while pos < len(text) and text[pos].isspace():
+                    pos += 1
+                if pos >= len(text):
+                    break
+                try:
+                    record, pos = decoder.raw_decode(text, pos)
+                except json.JSONDecodeError:
+                    match = RECORD_BOUNDARY.search(text, pos)
+                    if match is not None:
+                        logger.warning(f"Skipping malformed record in {path}")
+                        pos = match.start() + 1
+                        continue
+                    if chunk:
+                        # Record continues in the next chunk
+                        break
+                    logger.warning(f"Skipping trailing partial record in {path}")
+                    pos = len(text)
+                    break
+                yield record
+            pending = text[pos:]
+            if not chunk:
+                return
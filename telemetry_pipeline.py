@@ -0,0 +1,471 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from snapshot import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# Latest analytics summary, read by the dashboard
+ANALYTICS_SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, 'drone-analytics.json')
+
+RC_CHANNELS = ('roll', 'pitch', 'throttle', 'yaw')
+PID_CHANNELS = ('pid_x', 'pid_y', 'pid_z', 'pid_yaw')
+
+
+def nanmean(rows):
+    """Column means ignoring NaN, NaN for all-NaN columns (without numpy's warning)"""
+    rows = np.asarray(rows, dtype=float).reshape(-1, np.shape(rows)[-1])
+    valid = ~np.isnan(rows)
+    counts = valid.sum(axis=0)
+    return np.where(counts > 0, np.where(valid, rows, 0.0).sum(axis=0) / np.maximum(counts, 1), np.nan)
+
+
+def channel_values(record, channels):
+    """Return the record's channels as floats, NaN where missing or not numeric"""
+    values = []
+    for name in channels:
+        try:
+            values.append(float(record[name]))
+        except (KeyError, TypeError, ValueError):
+            values.append(float('nan'))
+    return values
+
+
+class Stage:
+    """One step of the analysis pipeline.
+
+    ``process`` is called for every record and ``on_command`` for every PID
+    command sent to the drone, both in arrival order. They may return a list
+    of event dicts. ``summary`` returns the stage's current results. Stages
+    with ``heavy = True`` run on a worker thread instead of the receive loop.
+    """
+    name = 'stage'
+    heavy = False
+
+    def process(self, timestamp, record):
+        return None
+
+    def on_command(self, timestamp, command):
+        return None
+
+    def summary(self):
+        return {}
+
+
+class RollingStats(Stage):
+    """Rolling mean and standard deviation over the last ``window`` samples"""
+    name = 'rolling'
+
+    def __init__(self, channels=RC_CHANNELS + PID_CHANNELS, window=200):
+        self.channels = channels
+        self.window = window
+        self.values = [deque() for _ in channels]
+        self.sums = [0.0] * len(channels)
+        self.squares = [0.0] * len(channels)
+
+    def process(self, timestamp, record):
+        for i, value in enumerate(channel_values(record, self.channels)):
+            if value != value:
+                continue
+            values = self.values[i]
+            values.append(value)
+            self.sums[i] += value
+            self.squares[i] += value * value
+            if len(values) > self.window:
+                old = values.popleft()
+                self.sums[i] -= old
+                self.squares[i] -= old * old
+
+    def summary(self):
+        result = {}
+        for name, values, total, squares in zip(self.channels, self.values, self.sums, self.squares):
+            n = len(values)
+            if not n:
+                continue
+            mean = total / n
+            result[name] = {'mean': mean, 'std': max(0.0, squares / n - mean * mean) ** 0.5}
+        return result
+
+
+class SaturationDetector(Stage):
+    """Flags PID outputs pinned at their limit, and integral windup when they stay there.
+
+    A sample is saturated when ``|value| >= limit * threshold``. An output
+    that stays saturated with the same sign for ``windup_time`` seconds
+    raises a ``windup_start`` event and a ``windup_end`` event once it
+    comes off the limit.
+    """
+    name = 'saturation'
+
+    def __init__(self, channels=PID_CHANNELS, limit=100.0, threshold=0.98, windup_time=0.5, window=200):
+        self.channels = channels
+        self.level = limit * threshold
+        self.windup_time = windup_time
+        self.window = window
+        self.flags = [deque() for _ in channels]
+        self.saturated_counts = [0] * len(channels)
+        # (sign, start time) of the current saturated run, and whether it is windup
+        self.runs = [None] * len(channels)
+        self.winding_up = [False] * len(channels)
+        self.windups = 0
+
+    def process(self, timestamp, record):
+        events = None
+        for i, value in enumerate(channel_values(record, self.channels)):
+            if value != value:
+                continue
+            saturated = abs(value) >= self.level
+            flags = self.flags[i]
+            flags.append(saturated)
+            self.saturated_counts[i] += saturated
+            if len(flags) > self.window:
+                self.saturated_counts[i] -= flags.popleft()
+
+            sign = 1 if value > 0 else -1
+            run = self.runs[i]
+            if saturated and run is not None and run[0] == sign:
+                if not self.winding_up[i] and timestamp - run[1] >= self.windup_time:
+                    self.winding_up[i] = True
+                    self.windups += 1
+                    events = (events or []) + [{'event': 'windup_start', 'channel': self.channels[i],
+                                                'sign': sign, 'since': run[1]}]
+                continue
+            if self.winding_up[i]:
+                self.winding_up[i] = False
+                events = (events or []) + [{'event': 'windup_end', 'channel': self.channels[i],
+                                            'duration': timestamp - run[1]}]
+            self.runs[i] = (sign, timestamp) if saturated else None
+        return events
+
+    def summary(self):
+        return {
+            'windups': self.windups,
+            'channels': {
+                name: {'saturated_fraction': count / len(flags) if flags else 0.0, 'windup': winding_up}
+                for name, flags, count, winding_up in zip(
+                    self.channels, self.flags, self.saturated_counts, self.winding_up)
+            },
+        }
+
+
+class OscillationDetector(Stage):
+    """Dominant oscillation frequency per channel from a sliding DFT.
+
+    Every sample updates the ``size``-point spectrum in O(size) without
+    recomputing the FFT; the spectrum is refreshed with a full FFT every
+    ``size`` samples to stop rounding errors from accumulating. An
+    ``oscillation`` event is raised when the dominant amplitude of a channel
+    rises above ``threshold`` and the peak holds at least ``peak_ratio`` of
+    the signal's power, which steps and noise spread over many bins do not.
+    Only frequencies completing at least two cycles within the window are
+    considered, and the signal must also cross its mean at least four times,
+    so a slow drift or a step is not mistaken for oscillation.
+    """
+    name = 'oscillation'
+    heavy = True
+
+    def __init__(self, channels=PID_CHANNELS, size=128, threshold=5.0, peak_ratio=0.5):
+        self.channels = channels
+        self.size = size
+        self.threshold = threshold
+        self.peak_ratio = peak_ratio
+        self.samples = np.zeros((size, len(channels)))
+        self.spectrum = np.zeros((size // 2 + 1, len(channels)), dtype=complex)
+        self.twiddle = np.exp(2j * np.pi * np.arange(size // 2 + 1) / size)[:, None]
+        self.position = 0
+        self.count = 0
+        self.last_timestamp = None
+        self.sample_interval = None
+        self.oscillating = [False] * len(channels)
+        self.dominant = {}
+
+    def process(self, timestamp, record):
+        if self.last_timestamp is not None and timestamp > self.last_timestamp:
+            dt = timestamp - self.last_timestamp
+            self.sample_interval = dt if self.sample_interval is None else 0.99 * self.sample_interval + 0.01 * dt
+        self.last_timestamp = timestamp
+
+        values = np.array(channel_values(record, self.channels))
+        old = self.samples[self.position]
+        # Hold the previous value for missing channels
+        values = np.where(np.isnan(values), self.samples[self.position - 1], values)
+        self.spectrum = (self.spectrum + (values - old)) * self.twiddle
+        self.samples[self.position] = values
+        self.position = (self.position + 1) % self.size
+        self.count += 1
+        if self.position == 0:
+            self.spectrum = np.fft.rfft(self.samples, axis=0)
+        if self.count < self.size or not self.sample_interval:
+            return None
+
+        # Skip the DC bin and the single-cycle bin
+        magnitude = np.abs(self.spectrum[2:])
+        peaks = magnitude.argmax(axis=0)
+        power = (magnitude ** 2).sum(axis=0)
+        events = None
+        for i, name in enumerate(self.channels):
+            amplitude = 2 * magnitude[peaks[i], i] / self.size
+            frequency = (peaks[i] + 2) / (self.size * self.sample_interval)
+            self.dominant[name] = {'frequency_hz': float(frequency), 'amplitude': float(amplitude)}
+            oscillating = (amplitude >= self.threshold
+                           and magnitude[peaks[i], i] ** 2 >= self.peak_ratio * power[i])
+            if oscillating and not self.oscillating[i]:
+                # Only checked on a candidate onset, so the O(size) scan stays off the common path
+                oscillating = self._mean_crossings(i) >= 4
+            if oscillating and not self.oscillating[i]:
+                events = (events or []) + [{'event': 'oscillation', 'channel': name,
+                                            'frequency_hz': float(frequency), 'amplitude': float(amplitude)}]
+            self.oscillating[i] = oscillating
+        return events
+
+    def _mean_crossings(self, channel):
+        values = np.roll(self.samples[:, channel], -self.position)
+        above = values > values.mean()
+        return np.count_nonzero(above[1:] != above[:-1])
+
+    def summary(self):
+        return dict(self.dominant)
+
+
+class StepResponse(Stage):
+    """Rise time, overshoot and settling time of the PID outputs after each command.
+
+    The output level before the command is the mean of the last
+    ``baseline_samples`` samples and the final level the mean of the last
+    tenth of the ``window`` seconds after it. Channels whose level changed
+    by less than three standard deviations of the baseline noise are left
+    out. A command arriving before the window is over ends the measurement
+    early.
+    """
+    name = 'step_response'
+
+    def __init__(self, channels=PID_CHANNELS, window=2.0, baseline_samples=50, settling_band=0.05):
+        self.channels = channels
+        self.window = window
+        self.settling_band = settling_band
+        self.recent = deque(maxlen=baseline_samples)
+        self.started = None
+        self.baseline = None
+        self.noise = None
+        self.times = []
+        self.samples = []
+        self.last = {}
+
+    def on_command(self, timestamp, command):
+        events = self._finish(interrupted=True) if self.started is not None else None
+        if self.recent:
+            self.started = timestamp
+            self.baseline = nanmean(self.recent)
+            self.noise = np.sqrt(nanmean((np.array(self.recent) - self.baseline) ** 2))
+            self.times, self.samples = [], []
+        return events
+
+    def process(self, timestamp, record):
+        values = channel_values(record, self.channels)
+        if self.started is None:
+            self.recent.append(values)
+            return None
+        self.times.append(timestamp - self.started)
+        self.samples.append(values)
+        if timestamp - self.started >= self.window:
+            return self._finish(interrupted=False)
+        return None
+
+    def _finish(self, interrupted):
+        times, samples = np.array(self.times), np.array(self.samples).reshape(-1, len(self.channels))
+        self.started = None
+        self.recent.extend(self.samples[-self.recent.maxlen:])
+        if len(times) < 10:
+            return None
+        final = nanmean(samples[-max(1, len(samples) // 10):])
+        result = {'event': 'step_response', 'interrupted': interrupted, 'duration': float(times[-1]), 'channels': {}}
+        for i, name in enumerate(self.channels):
+            change = final[i] - self.baseline[i]
+            if not np.isfinite(change) or abs(change) <= max(3 * self.noise[i], 1e-9):
+                continue
+            # Normalise so the step goes from 0 to 1
+            response = (samples[:, i] - self.baseline[i]) / change
+            rise_start = np.flatnonzero(response >= 0.1)
+            rise_end = np.flatnonzero(response >= 0.9)
+            outside = np.flatnonzero(np.abs(response - 1) > self.settling_band)
+            if not len(outside):
+                settling_time = 0.0
+            elif outside[-1] + 1 < len(times):
+                settling_time = float(times[outside[-1] + 1])
+            else:
+                # Still outside the band when the window ended
+                settling_time = None
+            result['channels'][name] = {
+                'change': float(change),
+                'rise_time': float(times[rise_end[0]] - times[rise_start[0]]) if len(rise_end) else None,
+                'overshoot_pct': float(max(0.0, np.nanmax(response) - 1) * 100),
+                'settling_time': settling_time,
+            }
+        self.last = result
+        return [result]
+
+    def summary(self):
+        return {'measuring': self.started is not None, 'last': self.last}
+
+
+class StageWorker(threading.Thread):
+    """Runs heavy stages off the receive loop, in the order their input arrived"""
+
+    def __init__(self, index, pipeline, queue_size):
+        super().__init__(name=f'pipeline-worker-{index}', daemon=True)
+        self.pipeline = pipeline
+        self.stages = []
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def submit(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Never hold up the receive loop; the stages see a gap instead
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            for stage in self.stages:
+                self.pipeline.run_stage(stage, *item)
+
+
+class StagePipeline:
+    """Runs analysis stages on every received record.
+
+    Light stages run inline in ``feed``. Each heavy stage belongs to one of
+    ``workers`` threads, so it still sees its input in order, and is fed
+    through a bounded queue that drops rather than blocks when the worker
+    falls behind. With ``workers=0`` the heavy stages run inline as well. Events are written through ``writer`` (a BackgroundWriter)
+    as they happen, together with a summary of every stage each
+    ``summary_interval`` seconds; the summary and recent events are also
+    published to ``store`` for the dashboard.
+    """
+
+    def __init__(self, stages, writer=None, store=None, workers=2, queue_size=10000,
+                 summary_interval=1.0, recent_events=50):
+        if workers < 0:
+            raise ValueError(f"Analytics workers must be 0 or more, got {workers}")
+        self.stages = list(stages)
+        heavy = [stage for stage in self.stages if stage.heavy]
+        self.workers = [StageWorker(i, self, queue_size) for i in range(min(workers, len(heavy)))]
+        if self.workers:
+            self.inline = [stage for stage in self.stages if not stage.heavy]
+            for i, stage in enumerate(heavy):
+                self.workers[i % len(self.workers)].stages.append(stage)
+        else:
+            self.inline = list(self.stages)
+        self.writer = writer
+        self.store = store
+        self.summary_interval = summary_interval
+        self.events = deque(maxlen=recent_events)
+        self.commands = deque()
+        self._stopped = threading.Event()
+        self._publisher = threading.Thread(target=self._publish_loop, name='pipeline-summary', daemon=True)
+
+        self.records = 0
+        self.events_emitted = 0
+        self.stage_errors = 0
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self._publisher.start()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.queue.put(None)
+            worker.join()
+        self._stopped.set()
+        self._publisher.join()
+        self.publish_summary()
+
+    def on_command(self, command):
+        """Note a command sent to the drone; thread-safe"""
+        self.commands.append((time.time(), command))
+
+    def feed(self, record, timestamp):
+        # Commands are applied from the receive loop so stages see them in
+        # order with the telemetry
+        while self.commands:
+            command_time, command = self.commands.popleft()
+            for stage in self.inline:
+                self.run_stage(stage, 'command', command_time, command)
+            for worker in self.workers:
+                worker.submit(('command', command_time, command))
+        self.records += 1
+        for stage in self.inline:
+            self.run_stage(stage, 'record', timestamp, record)
+        for worker in self.workers:
+            worker.submit(('record', timestamp, record))
+
+    def run_stage(self, stage, kind, timestamp, payload):
+        try:
+            if kind == 'record':
+                events = stage.process(timestamp, payload)
+            else:
+                events = stage.on_command(timestamp, payload)
+        except Exception as e:
+            self.stage_errors += 1
+            logger.error(f"Analysis stage {stage.name} failed: {e}")
+            return
+        for event in events or ():
+            self.emit(stage, timestamp, event)
+
+    def emit(self, stage, timestamp, event):
+        event = dict(event, type='event', stage=stage.name, time=timestamp)
+        self.events_emitted += 1
+        self.events.append(event)
+        if self.writer is not None:
+            self.writer.submit(event, timestamp)
+
+    def summary(self):
+        return {stage.name: stage.summary() for stage in self.stages}
+
+    def stats(self):
+        return {
+            'records': self.records,
+            'events': self.events_emitted,
+            'stage_errors': self.stage_errors,
+            'dropped': sum(worker.dropped for worker in self.workers),
+            'queued': sum(worker.queue.qsize() for worker in self.workers),
+        }
+
+    def publish_summary(self):
+        now = time.time()
+        summary = self.summary()
+        if self.writer is not None:
+            self.writer.submit({'type': 'summary', 'stages': summary}, now)
+        if self.store is not None:
+            self.store.publish({'created': now, 'stages': summary, 'events': list(self.events),
+                                'stats': self.stats()})
+
+    def _publish_loop(self):
+        while not self._stopped.wait(self.summary_interval):
+            try:
+                self.publish_summary()
+            except Exception as e:
+                logger.error(f"Error publishing analytics summary: {e}")
+
+
+def default_stages(options):
+    """The standard stage set, configured from config['analytics']"""
+    return [
+        RollingStats(window=options.get('window', 200)),
+        SaturationDetector(limit=options.get('saturation_limit', 100.0),
+                           windup_time=options.get('windup_time', 0.5),
+                           window=options.get('window', 200)),
+        OscillationDetector(size=options.get('fft_size', 128),
+                            threshold=options.get('oscillation_threshold', 5.0)),
+        StepResponse(window=options.get('step_window', 2.0)),
+    ]
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from background_writer import BackgroundWriter
+from metrics import NULL_HISTOGRAM, REGISTRY
+
+
+class RecordingSink:
+    """Sink that remembers what was flushed, optionally blocking until released"""
+
+    def __init__(self, blocked=False):
+        self.pending = []
+        self.batches = []
+        self.fsyncs = 0
+        self.closed = False
+        self.release = threading.Event()
+        if not blocked:
+            self.release.set()
+
+    def append(self, record, timestamp):
+        self.release.wait()
+        self.pending.append(record)
+        return 10
+
+    def flush(self):
+        self.batches.append(self.pending)
+        self.pending = []
+
+    def fsync(self):
+        self.fsyncs += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_records_queued_together_are_flushed_as_one_batch():
+    sink = RecordingSink(blocked=True)
+    writer = BackgroundWriter(sink, batch_size=100, batch_interval=0.0, fsync='batch')
+    writer.start()
+    writer.submit({'seq': 0}, time.time())
+    # While the first record is being written the next 250 pile up
+    time.sleep(0.05)
+    for i in range(1, 251):
+        writer.submit({'seq': i}, time.time())
+    sink.release.set()
+    writer.stop()
+    assert [len(batch) for batch in sink.batches] == [1, 100, 100, 50]
+    assert [record['seq'] for batch in sink.batches for record in batch] == list(range(251))
+    stats = writer.stats()
+    assert (stats['records_written'], stats['batches_written'], stats['bytes_written']) == (251, 4, 2510)
+    assert stats['fsyncs'] == sink.fsyncs == 4
+
+
+def test_full_queue_drops_instead_of_blocking():
+    sink = RecordingSink(blocked=True)
+    writer = BackgroundWriter(sink, queue_size=5)
+    writer.start()
+    writer.submit({'seq': 0}, time.time())
+    time.sleep(0.05)
+    started = time.monotonic()
+    accepted = [writer.submit({'seq': i}, time.time()) for i in range(1, 11)]
+    assert time.monotonic() - started < 0.5
+    assert accepted == [True] * 5 + [False] * 5
+    assert writer.stats()['overflows'] == 5
+    sink.release.set()
+    writer.stop()
+    assert writer.stats()['records_written'] == 6
+
+
+def test_stop_writes_everything_queued_and_closes_the_sink():
+    sink = RecordingSink()
+    writer = BackgroundWriter(sink, batch_interval=10.0, fsync='none')
+    writer.start()
+    for i in range(20):
+        writer.submit({'seq': i}, time.time())
+    writer.stop()
+    assert not writer.is_alive()
+    assert sum(len(batch) for batch in sink.batches) == 20
+    assert sink.closed and sink.fsyncs == 0
+
+
+def test_write_error_is_counted_and_the_writer_goes_on():
+    class FailingSink(RecordingSink):
+        def append(self, record, timestamp):
+            if record.get('bad'):
+                raise OSError('disk full')
+            return super().append(record, timestamp)
+
+    sink = FailingSink()
+    writer = BackgroundWriter(sink, batch_interval=0.0)
+    writer.start()
+    writer.submit({'bad': True}, time.time())
+    time.sleep(0.05)
+    writer.submit({'seq': 1}, time.time())
+    writer.stop()
+    assert writer.stats()['write_errors'] == 1
+    assert sink.batches[-1] == [{'seq': 1}]
+
+
+def test_latency_histogram_only_with_a_metric_name(monkeypatch):
+    monkeypatch.setattr(REGISTRY, 'enabled', True)
+    monkeypatch.setattr(REGISTRY, '_metrics', {})
+    unnamed = BackgroundWriter(RecordingSink())
+    writer = BackgroundWriter(RecordingSink(), latency_metric='test_persist_latency_seconds')
+    writer.start()
+    writer.submit({'seq': 1}, time.time())
+    writer.stop()
+    assert unnamed.persist_histogram is NULL_HISTOGRAM
+    assert list(REGISTRY.snapshot()) == ['test_persist_latency_seconds']
+    assert REGISTRY.snapshot()['test_persist_latency_seconds']['count'] == 1
+
+
+def test_unknown_fsync_policy():
+    with pytest.raises(ValueError, match='fsync'):
+        BackgroundWriter(RecordingSink(), fsync='always')
@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+from cli import StartupTimings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_recorder_imports_stay_light():
+    # Run in a fresh interpreter, pytest itself may already have loaded these
+    code = ("import sys, cli, main; "
+            "print([m for m in ('dash', 'numpy', 'pandas', 'plotly', 'watchdog') if m in sys.modules])")
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == '[]'
+
+
+def test_timings_are_appended_as_json_lines(tmp_path):
+    timings = StartupTimings(started=0.0)
+    timings.load('json')
+    timings.mark('receiving', at=0.25)
+    path = str(tmp_path / 'startup.jsonl')
+    timings.log(path)
+    timings.log(path)
+    with open(path) as f:
+        reports = [json.loads(line) for line in f]
+    assert len(reports) == 2
+    assert reports[0]['marks_ms'] == {'receiving': 250.0}
+    assert 'json' in reports[0]['imports_ms']
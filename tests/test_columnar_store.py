@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+
+from columnar_store import CHUNKS_FILE, COLUMN_SUFFIX, ColumnarReader, ColumnarWriter
+
+
+def sample(i):
+    return {'roll': float(i), 'pitch': 0.5, 'throttle': 50.0, 'yaw': -1.0, 'pid_x': i * 0.25,
+            'position': [1.0, 2.0, float(i)]}
+
+
+def write(path, start, count, **options):
+    writer = ColumnarWriter(path, **options)
+    for i in range(start, start + count):
+        writer.append(sample(i), 1000.0 + i)
+    writer.close()
+
+
+def test_round_trip_with_delta_columns(tmp_path):
+    path = str(tmp_path / 'store')
+    write(path, 0, 10, chunk_rows=4, delta_columns=('timestamp', 'pid_x'))
+    reader = ColumnarReader(path)
+    assert len(reader) == 10
+    assert list(reader.chunk_starts) == [0, 4, 8]
+    np.testing.assert_array_equal(reader.column('timestamp'), 1000.0 + np.arange(10))
+    np.testing.assert_array_equal(reader.column('pid_x', 5, 9), np.arange(5, 9) * 0.25)
+    record = reader.rows_as_records(3, 4)[0]
+    assert record['roll'] == 3.0 and record['position'] == [1.0, 2.0, 3.0]
+    # A vector the sample did not carry is left out
+    assert 'orientation' not in record
+
+
+def test_time_slice(tmp_path):
+    path = str(tmp_path / 'store')
+    write(path, 0, 10, chunk_rows=4)
+    window = ColumnarReader(path).time_slice(1002.0, 1004.0, names=['timestamp', 'roll'])
+    np.testing.assert_array_equal(window['roll'], [2.0, 3.0, 4.0])
+
+
+def test_resume_appends_to_the_store(tmp_path):
+    path = str(tmp_path / 'store')
+    write(path, 0, 6, chunk_rows=4)
+    write(path, 6, 6, chunk_rows=4)
+    reader = ColumnarReader(path)
+    assert len(reader) == 12
+    np.testing.assert_array_equal(reader.column('roll'), np.arange(12))
+
+
+def test_resume_drops_rows_without_a_chunk_entry(tmp_path):
+    path = str(tmp_path / 'store')
+    write(path, 0, 4, chunk_rows=4, delta_columns=('timestamp',))
+    # A crash after some columns of the next chunk were written, and halfway through its row count
+    with open(os.path.join(path, 'roll' + COLUMN_SUFFIX), 'ab') as f:
+        f.write(np.zeros(3, dtype='<f4').tobytes())
+    with open(os.path.join(path, 'timestamp' + COLUMN_SUFFIX), 'ab') as f:
+        f.write(np.zeros(2, dtype='<f8').tobytes())
+    with open(os.path.join(path, CHUNKS_FILE), 'ab') as f:
+        f.write(b'\x07\x00\x00\x00')
+
+    write(path, 4, 4, chunk_rows=4, delta_columns=('timestamp',))
+    reader = ColumnarReader(path)
+    assert len(reader) == 8
+    assert os.path.getsize(os.path.join(path, CHUNKS_FILE)) == 16
+    assert os.path.getsize(os.path.join(path, 'roll' + COLUMN_SUFFIX)) == 8 * 4
+    np.testing.assert_array_equal(reader.column('roll'), np.arange(8))
+    np.testing.assert_array_equal(reader.column('timestamp'), 1000.0 + np.arange(8))
+
+
+def test_unknown_fields_are_ignored(tmp_path):
+    path = str(tmp_path / 'store')
+    writer = ColumnarWriter(path)
+    writer.append({'roll': 1.0, 'battery': 12.1, 'pitch': 'n/a'}, 1000.0)
+    writer.close()
+    reader = ColumnarReader(path)
+    assert writer.unknown_fields == {'battery'}
+    assert reader.column('roll')[0] == 1.0
+    assert np.isnan(reader.column('pitch')[0])
+
+
+def test_receive_time_wins_over_the_payload_timestamp(tmp_path):
+    path = str(tmp_path / 'store')
+    writer = ColumnarWriter(path, delta_columns=('timestamp',))
+    for i in range(5):
+        writer.append({'roll': float(i), 'timestamp': 5.0 - i}, 1000.0 + i)
+    writer.close()
+    reader = ColumnarReader(path)
+    np.testing.assert_array_equal(reader.column('timestamp'), 1000.0 + np.arange(5))
+    np.testing.assert_array_equal(reader.time_slice(1001.0, 1002.0)['roll'], [1.0, 2.0])
@@ -0,0 +1,162 @@
+import asyncio
+import json
+
+import pytest
+
+import wire_protocol
+from command_channel import CommandChannel, decode_confirmation
+
+COMMAND = {'pid_values': {'P': {'roll': 1.5}}}
+
+
+class FakeTransport:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+        self.closed = False
+
+    def sendto(self, data, address=None):
+        if self.fail:
+            raise OSError('network is unreachable')
+        self.sent.append(data)
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+def open_channel(**options):
+    channel = CommandChannel(asyncio.get_running_loop(), **options)
+    transport = FakeTransport()
+    channel.connection_made(transport)
+    return channel, transport
+
+
+async def settle():
+    # send_command hands the command to the loop
+    await asyncio.sleep(0)
+
+
+def test_confirmed_command_leaves_the_in_flight_table():
+    async def run():
+        channel, transport = open_channel(retransmit_timeout=0.05)
+        channel.send_command(COMMAND)
+        await settle()
+        sent = json.loads(transport.sent[0])
+        assert sent == {**COMMAND, 'seq': 1}
+        channel.confirm({'status': 'ok', 'seq': 1}, ('127.0.0.1', 5000))
+        await asyncio.sleep(0.1)
+        return channel, transport
+
+    channel, transport = asyncio.run(run())
+    # Nothing was retransmitted after the confirmation
+    assert len(transport.sent) == 1
+    stats = channel.stats()
+    assert stats['acks'] == 1 and stats['in_flight'] == 0 and stats['retransmits'] == 0
+    assert stats['rtt_ms_p50'] is not None
+
+
+def test_unconfirmed_command_is_retransmitted_with_backoff_then_given_up():
+    async def run():
+        channel, transport = open_channel(retransmit_timeout=0.01, backoff=2.0,
+                                          max_retransmit_timeout=0.02, max_attempts=4)
+        channel.send_command(COMMAND)
+        await settle()
+        timeouts = []
+        for _ in range(3):
+            timeouts.append(channel.in_flight[1].timeout)
+            await asyncio.sleep(channel.in_flight[1].timeout + 0.01)
+        await asyncio.sleep(0.05)
+        return channel, transport, timeouts
+
+    channel, transport, timeouts = asyncio.run(run())
+    assert timeouts == [0.01, 0.02, 0.02]
+    assert len(transport.sent) == 4
+    assert len(set(transport.sent)) == 1
+    stats = channel.stats()
+    assert stats['retransmits'] == 3 and stats['timeouts'] == 1 and stats['in_flight'] == 0
+
+
+def test_retransmitted_command_is_left_out_of_the_rtt():
+    async def run():
+        channel, transport = open_channel(retransmit_timeout=0.01)
+        channel.send_command(COMMAND)
+        await asyncio.sleep(0.015)
+        channel.confirm({'status': 'ok', 'seq': 1}, None)
+        return channel
+
+    channel = asyncio.run(run())
+    assert channel.acks == 1 and channel.retransmits == 1
+    assert len(channel.rtts) == 0
+
+
+def test_new_command_supersedes_the_one_in_flight():
+    async def run():
+        channel, transport = open_channel()
+        channel.send_command(COMMAND)
+        channel.send_command({'pid_values': {'P': {'roll': 2.0}}})
+        await settle()
+        # The confirmation of the first command arrives late
+        channel.confirm({'status': 'ok', 'seq': 1}, None)
+        channel.confirm({'status': 'ok', 'seq': 2}, None)
+        channel.close()
+        return channel
+
+    channel = asyncio.run(run())
+    assert channel.superseded == 1 and channel.late_acks == 1 and channel.acks == 1
+
+
+def test_confirmation_without_seq_confirms_the_latest_command():
+    async def run():
+        channel, transport = open_channel()
+        channel.send_command(COMMAND)
+        await settle()
+        channel.confirm({'status': 'ok'}, None)
+        channel.close()
+        return channel
+
+    channel = asyncio.run(run())
+    assert channel.acks == 1 and not channel.in_flight
+
+
+def test_binary_commands_once_negotiated():
+    async def run():
+        channel, transport = open_channel()
+        channel.protocol = wire_protocol.VERSION
+        channel.send_command(COMMAND)
+        await settle()
+        channel.close()
+        return transport
+
+    transport = asyncio.run(run())
+    assert wire_protocol.decode_command(transport.sent[0]) == {**COMMAND, 'seq': 1}
+    assert transport.closed
+
+
+def test_send_error_is_retried_by_the_timer():
+    async def run():
+        channel, transport = open_channel(retransmit_timeout=0.01)
+        transport.fail = True
+        channel.send_command(COMMAND)
+        await settle()
+        transport.fail = False
+        await asyncio.sleep(0.02)
+        channel.close()
+        return channel, transport
+
+    channel, transport = asyncio.run(run())
+    assert channel.sent == 1 and len(transport.sent) == 1
+
+
+def test_decode_confirmation():
+    assert decode_confirmation(json.dumps({'status': 'ok', 'seq': 3}).encode()) == {'status': 'ok', 'seq': 3}
+    assert decode_confirmation(wire_protocol.encode_ack(4, ok=False)) == {'status': 'error', 'seq': 4}
+    # Telemetry, in either encoding, is not a confirmation
+    assert decode_confirmation(json.dumps({'roll': 1.0, 'seq': 3}).encode()) is None
+    assert decode_confirmation(wire_protocol.encode_telemetry({'roll': 1.0}, 3)) is None
+    assert decode_confirmation(b'{"status"') is None
+    assert decode_confirmation(b'["status"]') is None
+    with pytest.raises(ValueError):
+        decode_confirmation(wire_protocol.encode_ack(4) + b'\x00')
@@ -0,0 +1,60 @@
+import asyncio
+import socket
+
+import pytest
+
+from command_ipc import CommandJournal, open_command_listener, send_command
+
+
+def test_journal_tail_returns_the_last_entries(tmp_path):
+    journal = CommandJournal(str(tmp_path / 'commands.jsonl'))
+    assert journal.tail(5) == []
+    for i in range(100):
+        journal.append({'pid_values': {'P': {'roll': float(i)}}}, 1000.0 + i)
+    # Small blocks so the tail spans several reads and starts mid-line
+    entries = journal.tail(3, block_size=64)
+    assert [entry['timestamp'] for entry in entries] == [1097.0, 1098.0, 1099.0]
+    assert entries[-1]['command'] == {'pid_values': {'P': {'roll': 99.0}}}
+    assert len(journal.tail(1000)) == 100
+    assert journal.tail(0) == []
+
+
+def test_journal_skips_a_torn_line(tmp_path):
+    path = tmp_path / 'commands.jsonl'
+    journal = CommandJournal(str(path))
+    journal.append({'a': 1}, 1.0)
+    with open(path, 'a') as f:
+        f.write('{"timestamp": 2.0, "comm\n')
+    journal.append({'a': 3}, 3.0)
+    assert [entry['timestamp'] for entry in journal.tail(3)] == [1.0, 3.0]
+
+
+def test_commands_reach_the_listener(tmp_path):
+    path = str(tmp_path / 'commands.sock')
+    # A socket file left behind by a crashed recorder
+    open(path, 'w').close()
+    received = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        transport, listener = await open_command_listener(loop, received.append, path)
+        send_command({'pid_values': {'P': {'roll': 1.0}}}, path)
+        # Malformed datagrams are ignored
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'not json', path)
+        send_command({'pid_values': {'P': {'roll': 2.0}}}, path)
+        for _ in range(100):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        transport.close()
+        return listener
+
+    listener = asyncio.run(run())
+    assert [command['pid_values']['P']['roll'] for command in received] == [1.0, 2.0]
+    assert listener.received == 2
+
+
+def test_send_without_a_listener_raises(tmp_path):
+    with pytest.raises(OSError):
+        send_command({'pid_values': {}}, str(tmp_path / 'nobody.sock'))
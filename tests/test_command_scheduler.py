@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+import command_scheduler
+from command_scheduler import CommandScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(command_scheduler, 'time', clock)
+    return clock
+
+
+def requests_at(scheduler, clock, *times):
+    for t in times:
+        clock.now = t
+        scheduler.request()
+
+
+def test_delivery_waits_for_the_changes_to_go_quiet(clock):
+    scheduler = CommandScheduler(lambda changed: None, debounce=0.02, min_interval=0.05, max_latency=0.1)
+    assert scheduler._due() is None
+    requests_at(scheduler, clock, 1.0, 1.01, 1.02)
+    # Trailing edge: debounce after the last change
+    assert scheduler._due() == pytest.approx(1.04)
+
+
+def test_delivery_is_no_later_than_max_latency(clock):
+    scheduler = CommandScheduler(lambda changed: None, debounce=0.02, min_interval=0.05, max_latency=0.1)
+    requests_at(scheduler, clock, *(1.0 + i * 0.01 for i in range(20)))
+    assert scheduler._due() == pytest.approx(1.1)
+
+
+def test_deliveries_are_spaced_by_min_interval(clock):
+    scheduler = CommandScheduler(lambda changed: None, debounce=0.02, min_interval=0.05, max_latency=0.1)
+    scheduler._last_delivery = 1.0
+    requests_at(scheduler, clock, 1.001)
+    assert scheduler._due() == pytest.approx(1.05)
+
+
+def test_streaming_is_due_every_period(clock):
+    scheduler = CommandScheduler(lambda changed: None, stream_rate=20)
+    scheduler._last_delivery = 1.0
+    assert scheduler._due() == pytest.approx(1.05)
+
+
+def test_bursts_are_coalesced_into_one_delivery():
+    delivered = []
+    done = threading.Event()
+
+    def deliver(changed):
+        delivered.append(changed)
+        done.set()
+
+    scheduler = CommandScheduler(deliver, debounce=0.05, min_interval=0.05, max_latency=0.5)
+    scheduler.start()
+    for _ in range(10):
+        scheduler.request()
+    assert done.wait(2.0)
+    done.clear()
+    scheduler.request()
+    assert done.wait(2.0)
+    scheduler.stop()
+    stats = scheduler.stats()
+    assert delivered == [True, True]
+    assert (stats['requests'], stats['delivered'], stats['coalesced']) == (11, 2, 9)
+    assert 0 < stats['worst_latency_ms'] < 500
+
+
+def test_stream_repeats_the_latest_command():
+    calls = []
+    scheduler = CommandScheduler(calls.append, stream_rate=100)
+    scheduler.request()
+    scheduler.start()
+    time.sleep(0.1)
+    scheduler.stop()
+    assert calls[0] is True and calls.count(True) == 1
+    assert scheduler.stream_repeats == len(calls) - 1 >= 3
+
+
+def test_delivery_error_does_not_stop_the_scheduler():
+    calls = []
+
+    def deliver(changed):
+        calls.append(changed)
+        if len(calls) == 1:
+            raise RuntimeError('socket gone')
+
+    scheduler = CommandScheduler(deliver, debounce=0.0, min_interval=0.0)
+    scheduler.start()
+    scheduler.request()
+    time.sleep(0.05)
+    scheduler.request()
+    time.sleep(0.05)
+    scheduler.stop()
+    assert calls == [True, True]
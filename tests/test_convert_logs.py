@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+
+from convert_logs import (convert, convert_range, header_at, load_flight, plan_ranges,
+                          scan_csv_headers)
+
+
+def record(t):
+    return {'timestamp': t, 'roll': 1500.0 + t % 7, 'pid_x': t / 3,
+            'position': [t, -t, 0.5], 'orientation': [0.0, 0.0, 0.0, 1.0]}
+
+
+def write_mixed_log(path):
+    """Concatenated JSON as old recorders wrote it, then a CSV run, then JSON again"""
+    timestamps = []
+    with open(path, 'w') as f:
+        for i in range(40):
+            f.write(json.dumps(record(1000.0 + i)) + ('\n' if i % 3 else ''))
+            timestamps.append(1000.0 + i)
+        f.write('timestamp,roll,pid_x,position\n')
+        for i in range(40, 80):
+            t = 1000.0 + i
+            f.write(f'{t},{1500.0 + t % 7},{t / 3},{json.dumps([t, -t, 0.5])}\n')
+            timestamps.append(t)
+        for i in range(80, 100):
+            f.write(json.dumps(record(1000.0 + i)))
+            timestamps.append(1000.0 + i)
+    return timestamps
+
+
+def convert_in_process(path, tmp_path, chunk_bytes, block_size=1 << 20):
+    headers = scan_csv_headers(path, block_size=block_size)
+    results = []
+    for i, (start, end) in enumerate(plan_ranges(path, chunk_bytes)):
+        results.append(convert_range(path, start, end, header_at(headers, start),
+                                     str(tmp_path / f'part-{i:05d}.npz'), 'npz', block_size))
+    parts = [np.load(tmp_path / r['part']) for r in results if r['part']]
+    return results, {name: np.concatenate([part[name] for part in parts]) for name in parts[0].files}
+
+
+@pytest.mark.parametrize('chunk_bytes', [1, 7, 64, 150, 1000, 1 << 20])
+def test_chunk_boundaries_neither_drop_nor_duplicate_records(tmp_path, chunk_bytes):
+    path = str(tmp_path / 'flight.txt')
+    timestamps = write_mixed_log(path)
+    results, columns = convert_in_process(path, tmp_path, chunk_bytes, block_size=97)
+    assert list(columns['timestamp']) == timestamps
+    assert sum(r['malformed'] for r in results) == 0
+    assert sum(r['csv_records'] for r in results) == 40
+    assert sum(r['json_records'] for r in results) == 60
+    np.testing.assert_allclose(columns['position_y'], [-t for t in timestamps])
+    # Orientation only exists in the JSON records
+    assert np.isnan(columns['orientation_w'][40:80]).all()
+    assert not np.isnan(columns['orientation_w'][:40]).any()
+
+
+def test_truncated_record_is_counted_as_malformed(tmp_path):
+    # A recorder killed mid-write and restarted on a new line
+    path = tmp_path / 'flight.txt'
+    path.write_text(json.dumps(record(1000.0)) + '{"timestamp": 1001.0, "ro\n' + json.dumps(record(1002.0)))
+    results, columns = convert_in_process(str(path), tmp_path, 1 << 20)
+    assert list(columns['timestamp']) == [1000.0, 1002.0]
+    assert results[0]['malformed'] == 1
+
+
+def test_convert_writes_a_catalog(tmp_path):
+    path = str(tmp_path / 'flight.txt')
+    timestamps = write_mixed_log(path)
+    catalog, summary = convert([path], str(tmp_path / 'archive'), workers=1, chunk_bytes=500,
+                               file_format='npz')
+    entry, = catalog
+    assert entry['rows'] == summary['rows'] == len(timestamps)
+    assert len(entry['parts']) > 1
+    assert (entry['start'], entry['end']) == (timestamps[0], timestamps[-1])
+    assert list(load_flight(str(tmp_path / 'archive'), 'flight')['timestamp']) == timestamps
@@ -0,0 +1,67 @@
+import os
+
+from csv_log import CsvLogWriter, read_header, series_path
+
+
+def lines(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_first_record_fixes_the_schema(tmp_path):
+    path = str(tmp_path / 'measurements.txt')
+    writer = CsvLogWriter(path)
+    writer.append({'roll': 1.0, 'pitch': 2.0, 'position': [1, 2, 3]}, 1000.0)
+    writer.append({'roll': 3.0}, 1001.0)
+    writer.close()
+    assert lines(path) == ['timestamp,roll,pitch,position', '1000.0,1.0,2.0,[1, 2, 3]', '1001.0,3.0,,']
+    stats = writer.stats()
+    assert stats['records_with_missing_fields'] == 1 and stats['missing_fields'] == 2
+
+
+def test_new_fields_start_the_next_file(tmp_path):
+    path = str(tmp_path / 'measurements.txt')
+    writer = CsvLogWriter(path)
+    writer.append({'roll': 1.0}, 1000.0)
+    writer.append({'roll': 2.0, 'battery': 12.5}, 1001.0)
+    writer.append({'roll': 3.0}, 1002.0)
+    writer.close()
+    assert lines(path) == ['timestamp,roll', '1000.0,1.0']
+    assert series_path(path, 1) == str(tmp_path / 'measurements.1.txt')
+    assert lines(series_path(path, 1)) == ['timestamp,roll,battery', '1001.0,2.0,12.5', '1002.0,3.0,']
+    assert writer.stats()['schema_changes'] == 1 and writer.stats()['unknown_fields'] == 1
+
+
+def test_resume_appends_to_the_last_file(tmp_path):
+    path = str(tmp_path / 'measurements.txt')
+    writer = CsvLogWriter(path)
+    writer.append({'roll': 1.0}, 1000.0)
+    writer.append({'roll': 2.0, 'battery': 12.5}, 1001.0)
+    writer.close()
+    writer = CsvLogWriter(path)
+    assert writer.columns == ('roll', 'battery')
+    writer.append({'battery': 12.0, 'roll': 4.0}, 1002.0)
+    writer.close()
+    assert lines(series_path(path, 1))[-1] == '1002.0,4.0,12.0'
+    assert not os.path.exists(series_path(path, 2))
+
+
+def test_resume_after_a_broken_header_starts_a_new_file(tmp_path):
+    path = str(tmp_path / 'measurements.txt')
+    with open(path, 'w') as f:
+        # Written by an older recorder that repeated the header on every start
+        f.write('timestamp,roll,timestamp,roll\n1000.0,1.0\n')
+    assert read_header(path) is None
+    writer = CsvLogWriter(path)
+    writer.append({'roll': 2.0}, 1001.0)
+    writer.close()
+    assert lines(series_path(path, 1)) == ['timestamp,roll', '1001.0,2.0']
+    assert lines(path)[0] == 'timestamp,roll,timestamp,roll'
+
+
+def test_timestamp_field_is_not_a_column(tmp_path):
+    path = str(tmp_path / 'measurements.txt')
+    writer = CsvLogWriter(path)
+    writer.append({'timestamp': 5.0, 'roll': 1.0}, 1000.0)
+    writer.close()
+    assert read_header(path) == ['roll']
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import logging
+import socket
+import time
+
+import fleet
+
+
+def drone_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.setblocking(False)
+    return sock
+
+
+def received(sock):
+    messages = []
+    while True:
+        try:
+            messages.append(sock.recv(4096))
+        except BlockingIOError:
+            return messages
+
+
+def test_only_drones_no_worker_hears_are_subscribed(tmp_path, monkeypatch):
+    monkeypatch.setattr(fleet, 'drone_socket_path', lambda drone_id: str(tmp_path / f'{drone_id}.sock'))
+    drones = [drone_socket(), drone_socket()]
+    config = {
+        'path_to_save': 'measurements.txt',
+        'protocol': 'json',
+        'fleet': {'directory': str(tmp_path / 'fleet'), 'bind': ['127.0.0.1', 0],
+                  'drones': [{'id': f'd{i}', 'host': '127.0.0.1', 'port': sock.getsockname()[1]}
+                             for i, sock in enumerate(drones)]},
+    }
+    # d1 streams to another worker, which shares when it last heard from it
+    liveness = [0.0, time.time() + 60]
+
+    async def run():
+        recorder = await fleet.start_fleet(config, liveness=liveness)
+        await asyncio.sleep(0.1)
+        subscribed = [len(received(sock)) for sock in drones]
+        # Telemetry from d0 keeps it alive
+        recorder.handle(json.dumps({'roll': 1.0}).encode(), drones[0].getsockname(), time.time())
+        await asyncio.sleep(0.1)
+        recorder.close()
+        return subscribed
+
+    assert asyncio.run(run()) == [1, 0]
+    assert liveness[0] > time.time() - 5
+    for sock in drones:
+        sock.close()
+
+
+def test_failed_connect_is_logged(tmp_path, monkeypatch, caplog):
+    async def broken_listener(*args, **kwargs):
+        raise OSError('address in use')
+
+    monkeypatch.setattr(fleet, 'drone_socket_path', lambda drone_id: str(tmp_path / f'{drone_id}.sock'))
+    monkeypatch.setattr(fleet, 'open_command_listener', broken_listener)
+    config = {'path_to_save': 'measurements.txt',
+              'fleet': {'directory': str(tmp_path / 'fleet'), 'bind': ['127.0.0.1', 0]}}
+
+    async def run():
+        recorder = await fleet.start_fleet(config)
+        recorder.handle(json.dumps({'drone_id': 'alpha', 'roll': 1.0}).encode(), ('127.0.0.1', 9), time.time())
+        await asyncio.sleep(0.05)
+        session = recorder.sessions['alpha']
+        recorder.close()
+        return session
+
+    with caplog.at_level(logging.ERROR, logger='fleet'):
+        session = asyncio.run(run())
+    assert session.connecting.done()
+    assert 'Could not open the command channel of drone alpha: address in use' in caplog.text
@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+import live_push
+from live_push import SnapshotWatcher, event_stream
+from snapshot import SnapshotStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+        self.on_sleep = None
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        if self.on_sleep is not None:
+            self.on_sleep()
+
+
+class FakeWatcher:
+    """Hands out queued snapshots; None in the queue means the wait timed out"""
+
+    def __init__(self, queue):
+        self.queue = list(queue)
+        self.snapshot = None
+        self.subscribers = 0
+
+    def subscribe(self):
+        self.subscribers += 1
+
+    def unsubscribe(self):
+        self.subscribers -= 1
+
+    def wait(self, tick, timeout):
+        item = self.queue.pop(0)
+        if item is not None:
+            self.snapshot = item
+        return item
+
+
+def render(calls):
+    def _render(snapshot, last_tick):
+        calls.append((snapshot['tick'], last_tick))
+        return {'tick': snapshot['tick']}
+    return _render
+
+
+def frames(stream, count):
+    return [next(stream) for _ in range(count)]
+
+
+def test_frames_are_rate_limited_and_coalesced(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(live_push, 'time', clock)
+    watcher = FakeWatcher([{'tick': 1}, {'tick': 2}])
+    calls = []
+    stream = event_stream(watcher, render(calls), max_rate=20.0)
+
+    # Two more ticks arrive while the stream waits out the rate limit
+    def publish_more():
+        watcher.snapshot = {'tick': watcher.snapshot['tick'] + 2}
+    clock.on_sleep = publish_more
+
+    retry, first, second = frames(stream, 3)
+    assert retry == "retry: 1000\n\n"
+    assert first == f"id: 1\ndata: {json.dumps({'tick': 1})}\n\n"
+    assert second.startswith("id: 4\n")
+    assert calls == [(1, None), (4, 1)]
+    assert clock.sleeps == [pytest.approx(0.05)]
+    assert watcher.subscribers == 1
+    stream.close()
+    assert watcher.subscribers == 0
+
+
+def test_frames_are_not_delayed_below_the_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(live_push, 'time', clock)
+    watcher = FakeWatcher([{'tick': 1}, {'tick': 2}])
+    calls = []
+    stream = event_stream(watcher, render(calls), last_tick=0, max_rate=20.0)
+    next(stream)
+    next(stream)
+    clock.now += 1.0
+    next(stream)
+    assert calls == [(1, 0), (2, 1)]
+    assert clock.sleeps == []
+
+
+def test_idle_stream_sends_keepalives(monkeypatch):
+    monkeypatch.setattr(live_push, 'time', FakeClock())
+    watcher = FakeWatcher([None, {'tick': 7}])
+    calls = []
+    stream = event_stream(watcher, render(calls), last_tick=6)
+    assert frames(stream, 3)[1:] == [": keepalive\n\n", f"id: 7\ndata: {json.dumps({'tick': 7})}\n\n"]
+    assert calls == [(7, 6)]
+
+
+def test_watcher_wakes_on_publish(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot.json'))
+    store.local_publisher = True
+    watcher = SnapshotWatcher(store, idle_check=0.05)
+    watcher.subscribe()
+    try:
+        assert watcher.wait(None, 0.05) is None
+        store.publish({'tick': 1})
+        assert watcher.wait(None, 5) == {'tick': 1}
+        store.publish({'tick': 2})
+        assert watcher.wait(1, 5) == {'tick': 2}
+        assert watcher.wakeups == 2
+    finally:
+        watcher.unsubscribe()
@@ -0,0 +1,29 @@
+from metrics import NULL_HISTOGRAM, MetricsRegistry, histogram_quantile
+
+
+def test_histograms_are_only_allocated_when_enabled():
+    registry = MetricsRegistry()
+    assert registry.histogram('latency_seconds', "Latency") is NULL_HISTOGRAM
+    assert registry.snapshot() == {}
+    registry.enable()
+    histogram = registry.histogram('latency_seconds', "Latency", buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 1.0):
+        histogram.observe(value)
+    snapshot = registry.snapshot()['latency_seconds']
+    assert snapshot['buckets'] == {'0.01': 1, '0.1': 2, '+Inf': 1}
+    assert snapshot['count'] == 4
+    assert histogram_quantile(snapshot, 0.5) == 0.1
+    assert histogram_quantile({'count': 0, 'buckets': {}}, 0.5) is None
+
+
+def test_counters_and_callbacks_render_as_prometheus():
+    registry = MetricsRegistry()
+    packets = registry.counter('packets_total', "Packets received")
+    packets.inc()
+    packets.inc(2)
+    registry.register('queue_depth', 'gauge', "Records waiting", lambda: 7)
+    registry.register('broken', 'gauge', "Fails", lambda: 1 / 0)
+    assert registry.snapshot() == {'packets_total': 3, 'queue_depth': 7, 'broken': None}
+    text = registry.render_prometheus()
+    assert '# TYPE packets_total counter\npackets_total 3\n' in text
+    assert 'queue_depth 7\n' in text
@@ -0,0 +1,52 @@
+import json
+import os
+import tracemalloc
+
+import pytest
+
+from profiling import RuntimeProfiler, make_profiler
+
+
+def test_disabled_profiling_builds_nothing():
+    assert make_profiler('recorder', None) is None
+    assert make_profiler('recorder', {'enabled': False, 'duration': 5}) is None
+
+
+def test_output_dir_is_relative_to_the_base_dir(tmp_path):
+    profiler = make_profiler('recorder', {'enabled': True, 'output_dir': 'profiles', 'duration': 5},
+                             base_dir=str(tmp_path))
+    assert profiler.output_dir == str(tmp_path / 'profiles')
+    assert profiler.duration == 5
+    assert profiler.active is None
+
+
+def test_window_writes_its_reports(tmp_path):
+    timers = []
+    packets = iter([100, 300])
+    profiler = RuntimeProfiler('recorder', output_dir=str(tmp_path), interval=0.001, tags={'host': 'test'},
+                               counters=lambda: {'packets': next(packets)},
+                               call_later=lambda delay, callback: timers.append((delay, callback)))
+    assert profiler.start(duration=10)
+    assert not profiler.start()
+    assert profiler.status()['active']
+    delay, stop = timers[0]
+    assert delay == 10
+    report = profiler.stop()
+    assert not tracemalloc.is_tracing()
+    # The window's own timer firing later does nothing
+    stop()
+    assert profiler.windows == 1
+    assert report['host'] == 'test' and report['packets'] == 300 and report['packets_per_s'] > 0
+    assert sorted(os.path.splitext(path)[1] for path in report['files']) == ['.collapsed', '.txt']
+    assert all(os.path.exists(path) for path in report['files'])
+    with open(report['files'][0].rsplit('.', 1)[0] + '.json') as f:
+        assert json.load(f)['mode'] == 'sample'
+
+
+def test_cprofile_needs_an_event_loop(tmp_path):
+    profiler = RuntimeProfiler('dashboard', output_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        profiler.start(mode='cprofile')
+    with pytest.raises(ValueError):
+        profiler.start(mode='perf')
+    assert profiler.stop() is None
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+import query_service
+from query_service import Query, QueryService, Resampler
+from segmented_log import SegmentedLogWriter
+from telemetry_log import TelemetryLogWriter
+
+AGGREGATES = ['mean', 'std', 'min', 'max', 'count', 'sum', 'first', 'last']
+
+
+def block(timestamps, values):
+    return {'timestamp': np.asarray(timestamps, dtype=float), 'roll': np.asarray(values, dtype=float)}
+
+
+def resample(blocks, step=1.0, origin=None):
+    resampler = Resampler(['roll'], step, AGGREGATES, origin)
+    tables = [resampler.feed(b) for b in blocks] + [resampler.finish()]
+    tables = [table for table in tables if table is not None]
+    return {key: np.concatenate([table[key] for table in tables]) for key in tables[0]}
+
+
+def split(data, cuts):
+    bounds = [0] + list(cuts) + [len(data['timestamp'])]
+    return [{key: values[a:b] for key, values in data.items()} for a, b in zip(bounds, bounds[1:])]
+
+
+def test_buckets_straddling_blocks_match_a_single_pass():
+    rng = np.random.default_rng(1)
+    timestamps = 1000.3 + np.cumsum(rng.uniform(0.01, 0.2, 500))
+    values = rng.normal(size=500)
+    values[rng.integers(0, 500, 20)] = np.nan
+    data = block(timestamps, values)
+    whole = resample([data])
+    # Cuts inside buckets, on bucket edges, and an empty block
+    for cuts in ([1], [7, 7, 250], list(range(10, 500, 37)), [499]):
+        pieces = resample(split(data, cuts))
+        assert pieces.keys() == whole.keys()
+        for key in whole:
+            np.testing.assert_allclose(pieces[key], whole[key], rtol=1e-12, equal_nan=True, err_msg=key)
+
+
+def test_bucket_statistics():
+    table = resample([block([10.0, 10.5, 11.2, 13.9], [1.0, 3.0, np.nan, 5.0])])
+    # Bucket 12 has no samples and is left out
+    np.testing.assert_array_equal(table['t'], [10.0, 11.0, 13.0])
+    np.testing.assert_array_equal(table['roll_count'], [2, 0, 1])
+    np.testing.assert_array_equal(table['roll_mean'][[0, 2]], [2.0, 5.0])
+    assert np.isnan(table['roll_mean'][1])
+    np.testing.assert_array_equal(table['roll_std'][[0, 2]], [1.0, 0.0])
+    np.testing.assert_array_equal(table['roll_first'][[0, 2]], [1.0, 5.0])
+    np.testing.assert_array_equal(table['roll_last'][[0, 2]], [3.0, 5.0])
+
+
+def test_buckets_align_to_the_origin():
+    table = resample([block([10.2, 10.6, 10.9], [1.0, 2.0, 3.0])], step=0.5, origin=0.25)
+    np.testing.assert_allclose(table['t'], [9.75, 10.25, 10.75])
+    np.testing.assert_array_equal(table['roll_count'], [1, 1, 1])
+    # Without an origin buckets start at a multiple of the step
+    assert resample([block([10.7], [1.0])], step=0.5)['t'][0] == pytest.approx(10.5)
+
+
+def test_finish_without_data():
+    resampler = Resampler(['roll'], 1.0, ['mean'])
+    assert resampler.feed(block([], [])) is None
+    assert resampler.finish() is None
+
+
+def write_log(path, count=50):
+    writer = TelemetryLogWriter(path)
+    for i in range(count):
+        writer.append({'roll': float(i), 'battery': 12.0}, 1000.0 + i)
+    writer.close()
+
+
+def test_unknown_field_in_a_log_is_rejected(tmp_path):
+    path = str(tmp_path / 'log.txt')
+    write_log(path)
+    service = QueryService(path)
+    with pytest.raises(ValueError, match='Unknown field nosuch'):
+        list(service.run(Query(['nosuch'])))
+    # Fields of the log and of the telemetry schema are accepted
+    [table] = service.run(Query(['battery', 'position_x'], 1000.0, 1002.0))
+    np.testing.assert_array_equal(table['battery'], [12.0, 12.0, 12.0])
+    assert np.isnan(table['position_x']).all()
+
+
+def test_active_segment_is_read_through_its_index(tmp_path, monkeypatch):
+    path = str(tmp_path / 'measurements.txt')
+    writer = SegmentedLogWriter(path, max_seconds=10)
+    for i in range(25):
+        writer.append({'roll': float(i)}, 1000.0 + i)
+    writer.close()
+
+    def no_scan(path):
+        raise AssertionError(f"{path} was scanned without its index")
+
+    monkeypatch.setattr(query_service, 'iter_legacy_records', no_scan)
+    [table] = QueryService(path).run(Query(['roll'], 1008.0, 1022.0))
+    np.testing.assert_array_equal(table['roll'], np.arange(8, 23))
+
+
+def test_repeated_query_is_served_from_the_cache(tmp_path):
+    path = str(tmp_path / 'log.txt')
+    write_log(path)
+    service = QueryService(path)
+    query = Query(['roll'], 1000.0, 1049.0, rate=0.1, aggregates=['mean', 'max'])
+    first = list(service.run(query))
+    second = list(service.run(query))
+    assert (service.hits, service.misses) == (1, 1)
+    assert len(first) == len(second)
+    maxima = np.concatenate([table['roll_max'] for table in second])
+    np.testing.assert_array_equal(maxima, [9.0, 19.0, 29.0, 39.0, 49.0])
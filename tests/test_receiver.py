@@ -0,0 +1,55 @@
+import asyncio
+import socket
+
+from receiver import TelemetryReceiver, open_telemetry_socket
+
+
+def receive(count, handler, **options):
+    """Send ``count`` datagrams to a TelemetryReceiver and wait until they are handled"""
+    async def run():
+        loop = asyncio.get_running_loop()
+        sock = open_telemetry_socket(('127.0.0.1', 0))
+        received = []
+
+        def handle(data, addr, received_at):
+            received.append(data)
+            handler(data)
+        receiver = TelemetryReceiver(loop, sock, handle, **options)
+        receiver.start()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            for i in range(count):
+                sender.sendto(str(i).encode(), sock.getsockname())
+            for _ in range(500):
+                if len(received) == count:
+                    break
+                await asyncio.sleep(0.01)
+        first = await asyncio.wait_for(receiver.first_received, 1)
+        receiver.stop()
+        sock.close()
+        return receiver, received, first
+
+    return asyncio.run(run())
+
+
+def test_datagrams_are_handled_in_order():
+    receiver, received, first = receive(50, lambda data: None)
+    assert received == [str(i).encode() for i in range(50)]
+    assert receiver.stats()['datagrams'] == 50
+    assert first > 0
+
+
+def test_reading_pauses_while_every_batch_is_in_use():
+    # One small batch: the socket is drained four datagrams at a time
+    receiver, received, _ = receive(40, lambda data: None, batch_size=4, pool_size=1)
+    assert received == [str(i).encode() for i in range(40)]
+    assert receiver.batches >= 10
+    assert receiver.stats()['pending_batches'] == 0
+
+
+def test_handler_errors_do_not_stop_the_receiver():
+    def handler(data):
+        if int(data) % 10 == 0:
+            raise ValueError("bad sample")
+    receiver, received, _ = receive(30, handler)
+    assert len(received) == 30
+    assert receiver.handler_errors == 3
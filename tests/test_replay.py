@@ -0,0 +1,89 @@
+import asyncio
+
+from replay import FlightReplay
+from telemetry_log import TelemetryLogWriter
+
+
+def write_log(path, timestamps):
+    writer = TelemetryLogWriter(path)
+    for t in timestamps:
+        writer.append({'roll': t}, t)
+    writer.close()
+    return path
+
+
+def collect(replay_log, **options):
+    emitted = []
+    replay = FlightReplay(replay_log, lambda record, timestamp: emitted.append(timestamp), **options)
+    return replay, emitted
+
+
+def test_replays_every_record_in_order(tmp_path):
+    timestamps = [1000.0 + i * 0.01 for i in range(600)]
+    replay, emitted = collect(write_log(str(tmp_path / 'flight.txt'), timestamps), speed=None, batch=64)
+    assert replay.first_timestamp() == 1000.0
+    asyncio.run(replay.run())
+    assert emitted == timestamps
+    assert replay.finished and replay.stats()['records'] == 600
+
+
+def test_start_and_end_bound_the_replay(tmp_path):
+    timestamps = [1000.0 + i for i in range(10)]
+    replay, emitted = collect(write_log(str(tmp_path / 'flight.txt'), timestamps),
+                              speed=None, start=1003.0, end=1006.0)
+    asyncio.run(replay.run())
+    assert emitted == [1003.0, 1004.0, 1005.0, 1006.0]
+
+
+def test_long_gaps_are_skipped(tmp_path):
+    # Two stretches of 0.1 s each, with the recorder stopped for 100 s in between
+    timestamps = [1000.0 + i * 0.01 for i in range(10)] + [1100.0 + i * 0.01 for i in range(10)]
+    replay, emitted = collect(write_log(str(tmp_path / 'flight.txt'), timestamps), speed=1.0, max_gap=5.0)
+    asyncio.run(asyncio.wait_for(replay.run(), 10))
+    assert emitted == timestamps
+    assert replay.gaps_skipped == 1
+    assert replay.elapsed < 5.0
+
+
+def test_seek_restarts_from_the_target(tmp_path):
+    timestamps = [1000.0 + i for i in range(10)]
+    emitted = []
+    replay = FlightReplay(write_log(str(tmp_path / 'flight.txt'), timestamps), None, speed=None)
+
+    def emit(record, timestamp):
+        emitted.append(timestamp)
+        if timestamp == 1005.0 and replay.seeks == 0:
+            replay.seek(1002.5)
+        elif timestamp == 1004.0 and replay.seeks == 1:
+            replay.seek(1008.0)
+    replay.emit = emit
+
+    asyncio.run(replay.run())
+    assert emitted == [1000.0, 1001.0, 1002.0, 1003.0, 1004.0, 1005.0,
+                       1003.0, 1004.0, 1008.0, 1009.0]
+    assert replay.seeks == 2
+
+
+def test_pause_holds_the_replay_until_resumed(tmp_path):
+    timestamps = [1000.0 + i for i in range(10)]
+    emitted = []
+    replay = FlightReplay(write_log(str(tmp_path / 'flight.txt'), timestamps), None, speed=None)
+
+    def emit(record, timestamp):
+        emitted.append(timestamp)
+        if timestamp == 1004.0:
+            replay.pause()
+    replay.emit = emit
+
+    async def run():
+        task = asyncio.create_task(replay.run())
+        await asyncio.sleep(0.1)
+        held = list(emitted)
+        assert replay.stats()['paused']
+        replay.resume()
+        await asyncio.wait_for(task, 5)
+        return held
+
+    held = asyncio.run(run())
+    assert held == timestamps[:5]
+    assert emitted == timestamps
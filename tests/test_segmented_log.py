@@ -0,0 +1,124 @@
+import json
+import os
+import time
+
+import pytest
+
+from segmented_log import SegmentCatalog, SegmentedLogWriter, parse_condition
+from telemetry_log import TelemetryLogWriter
+
+
+def write_legacy_log(path, start, count):
+    """A log from before newline framing: concatenated JSON objects"""
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(json.dumps({'timestamp': start + i, 'throttle': 10.0 * i}))
+
+
+def seconds(records):
+    return [record['timestamp'] for record in records]
+
+
+@pytest.fixture
+def segmented(tmp_path):
+    """Two closed segments of 10 s each, 1000..1019, and an active one from 1020"""
+    path = str(tmp_path / 'measurements.txt')
+    writer = SegmentedLogWriter(path, max_seconds=10)
+    for i in range(25):
+        writer.append({'throttle': float(i), 'position': [0.0, 0.0, float(i)]}, 1000.0 + i)
+    writer.close()
+    return writer
+
+
+def test_read_range_spans_segments(segmented):
+    catalog = segmented.catalog
+    assert [entry['start'] for entry in catalog.segments()] == [1000.0, 1010.0]
+    assert seconds(catalog.read_range(1008.0, 1012.0)) == [1008.0, 1009.0, 1010.0, 1011.0, 1012.0]
+    assert seconds(catalog.read_range(1015.0)) == [float(t) for t in range(1015, 1020)]
+    assert len(list(catalog.read_range())) == 20
+    assert list(catalog.read_range(2000.0, 2001.0)) == []
+
+
+def test_find_skips_segments_by_summary(segmented):
+    catalog = segmented.catalog
+    condition = parse_condition('throttle>=15')
+    assert [entry['start'] for entry in catalog.find(conditions=[condition])] == [1010.0]
+    assert seconds(catalog.read_range(conditions=[condition])) == [float(t) for t in range(1015, 1020)]
+    assert seconds(catalog.read_range(conditions=[parse_condition('position_z<2')])) == [1000.0, 1001.0]
+
+
+def test_compacted_segment_is_read(segmented):
+    segmented.compact_after = 0
+    segmented.apply_retention(now=2000.0)
+    entries = segmented.catalog.segments()
+    assert all(entry['compressed'] and entry['segment'].endswith('.gz') for entry in entries)
+    assert seconds(segmented.catalog.read_range(1008.0, 1011.0)) == [1008.0, 1009.0, 1010.0, 1011.0]
+
+
+@pytest.mark.parametrize('with_index', [False, True])
+def test_legacy_segment_honours_the_window(tmp_path, with_index):
+    path = str(tmp_path / 'measurements.txt')
+    if with_index:
+        # A newline-framed log with its index, as written before segmentation was enabled
+        writer = TelemetryLogWriter(path)
+        for i in range(20):
+            writer.append({'throttle': 10.0 * i}, 1000.0 + i)
+        writer.close()
+    else:
+        write_legacy_log(path, 1000.0, 20)
+    writer = SegmentedLogWriter(path)
+    writer.close()
+    catalog = SegmentCatalog(writer.directory)
+    [legacy] = catalog.segments()
+    assert legacy['segment'].startswith('legacy-')
+    assert (legacy['start'], legacy['end'], legacy['count']) == (1000.0, 1019.0, 20)
+    assert seconds(catalog.read_range(1010.0, 1012.0)) == [1010.0, 1011.0, 1012.0]
+    assert seconds(catalog.read_range(1018.0)) == [1018.0, 1019.0]
+    assert len(list(catalog.read_range())) == 20
+
+
+def test_resume_continues_the_active_segment(tmp_path):
+    path = str(tmp_path / 'measurements.txt')
+    writer = SegmentedLogWriter(path, max_seconds=10)
+    for i in range(5):
+        writer.append({'throttle': float(i)}, 1000.0 + i)
+    writer.close()
+    writer = SegmentedLogWriter(path, max_seconds=10)
+    active = writer.segment
+    for i in range(5, 12):
+        writer.append({'throttle': float(i)}, 1000.0 + i)
+    writer.close()
+    # The summary of the first run's records was rebuilt, so the segment closed on time
+    [closed] = writer.catalog.segments()
+    assert closed['segment'] == active
+    assert (closed['start'], closed['end'], closed['count']) == (1000.0, 1009.0, 10)
+
+
+def test_retention_runs_at_start(tmp_path):
+    path = str(tmp_path / 'measurements.txt')
+    writer = SegmentedLogWriter(path, max_seconds=10)
+    for i in range(25):
+        writer.append({'throttle': float(i)}, 1000.0 + i)
+    writer.close()
+    # Restarted before the next rollover, with retention now configured
+    writer = SegmentedLogWriter(path, max_seconds=10, delete_after=3600)
+    writer.close()
+    assert writer.catalog.segments() == []
+    assert sorted(os.listdir(writer.directory)) == ['catalog.json', writer.segment, writer.segment + '.idx']
+
+
+def test_retention_runs_on_a_timer(tmp_path):
+    path = str(tmp_path / 'measurements.txt')
+    writer = SegmentedLogWriter(path, max_seconds=0.05, compact_after=0.2, retention_interval=0.05)
+    now = time.time()
+    writer.append({'throttle': 1.0}, now)
+    writer.append({'throttle': 2.0}, now + 0.1)
+    assert writer.rollovers == 1
+    # Too young to compact right after the rollover, compacted by the timer later
+    deadline = time.monotonic() + 5.0
+    while not all(entry['compressed'] for entry in writer.catalog.segments()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    writer.close()
+    [entry] = writer.catalog.segments()
+    assert entry['compressed']
+    assert time.time() - now >= 0.2
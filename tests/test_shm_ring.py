@@ -0,0 +1,124 @@
+import os
+import secrets
+
+import numpy as np
+import pytest
+
+from shm_ring import ShmRingReader, ShmRingTail, ShmRingWriter, _unlink, lock_path, sample_records
+
+
+@pytest.fixture
+def name():
+    name = f'test-ring-{secrets.token_hex(4)}'
+    yield name
+    _unlink(name)
+    if os.path.exists(lock_path(name)):
+        os.remove(lock_path(name))
+
+
+def write(writer, start, count):
+    for i in range(start, start + count):
+        writer.append({'roll': float(i), 'position': [0.0, 0.0, float(i)]}, 1000.0 + i)
+
+
+def test_reader_gets_new_samples_in_order(name):
+    writer = ShmRingWriter(name, capacity=16)
+    reader = ShmRingReader(name, backlog=0)
+    assert reader.read().size == 0
+    write(writer, 0, 5)
+    samples = reader.read()
+    np.testing.assert_array_equal(samples['roll'], np.arange(5))
+    np.testing.assert_array_equal(samples['sequence'], np.arange(1, 6))
+    assert reader.read().size == 0
+    records = sample_records(samples[:1])
+    assert records[0]['position'] == [0.0, 0.0, 0.0] and 'orientation' not in records[0]
+    reader.close()
+    writer.close()
+
+
+def test_overrun_samples_are_counted(name):
+    writer = ShmRingWriter(name, capacity=8)
+    reader = ShmRingReader(name, backlog=0)
+    reader.attach()
+    write(writer, 0, 20)
+    samples = reader.read()
+    # Only the newest capacity samples are still in the ring
+    np.testing.assert_array_equal(samples['roll'], np.arange(12, 20))
+    assert reader.overruns == 12 and reader.torn == 0
+    reader.close()
+    writer.close()
+
+
+def test_torn_slot_is_left_out(name):
+    writer = ShmRingWriter(name, capacity=8)
+    reader = ShmRingReader(name, backlog=0)
+    reader.attach()
+    write(writer, 0, 4)
+    # The writer is halfway through rewriting slot 2
+    writer.ring['sequence'][2] = 0
+    samples = reader.read()
+    np.testing.assert_array_equal(samples['roll'], [0.0, 1.0, 3.0])
+    assert reader.torn == 1
+    reader.close()
+    writer.close()
+
+
+def test_second_writer_is_refused(name):
+    writer = ShmRingWriter(name, capacity=8)
+    with pytest.raises(RuntimeError, match=str(os.getpid())):
+        ShmRingWriter(name, capacity=8)
+    writer.close()
+    # Released on close
+    ShmRingWriter(name, capacity=8).close()
+
+
+def test_restarted_writer_continues_the_ring(name):
+    writer = ShmRingWriter(name, capacity=8)
+    write(writer, 0, 3)
+    writer.close()
+    reader = ShmRingReader(name, backlog=0)
+    reader.attach()
+    assert reader.closed
+    writer = ShmRingWriter(name, capacity=8)
+    assert not reader.closed
+    write(writer, 3, 2)
+    np.testing.assert_array_equal(reader.read()['roll'], [3.0, 4.0])
+    reader.close()
+    writer.close()
+
+
+def test_replaced_ring_is_reattached(name):
+    writer = ShmRingWriter(name, capacity=8)
+    write(writer, 0, 3)
+    writer.close()
+    reader = ShmRingReader(name, backlog=0, check_interval=0.0)
+    reader.attach()
+    # A different capacity replaces the segment
+    writer = ShmRingWriter(name, capacity=16)
+    write(writer, 10, 2)
+    np.testing.assert_array_equal(reader.read()['roll'], [10.0, 11.0])
+    reader.close()
+    writer.close()
+
+
+def test_tail_falls_back_until_the_ring_exists(name):
+    class Fallback:
+        records = [{'roll': -1.0}]
+
+        def poll(self):
+            return list(self.records)
+
+        def latest(self):
+            return self.records[-1]
+
+    tail = ShmRingTail(name, max_records=10, fallback=Fallback())
+    assert tail.poll() == [{'roll': -1.0}]
+    writer = ShmRingWriter(name, capacity=8)
+    write(writer, 0, 2)
+    # Samples written before attaching were already read from the log
+    assert tail.poll() == []
+    write(writer, 2, 1)
+    assert [record['roll'] for record in tail.poll()] == [2.0]
+    assert [record['roll'] for record in tail.records] == [-1.0, 2.0]
+    tail.reader.close()
+    writer.close()
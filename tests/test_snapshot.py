@@ -0,0 +1,96 @@
+from snapshot import SnapshotPublisher, SnapshotStore
+
+
+class FakeReader:
+    """Stands in for TailReader, handing out queued batches of records"""
+
+    def __init__(self, batches=()):
+        self.batches = list(batches)
+        self.records = []
+
+    def poll(self):
+        if not self.batches:
+            return []
+        batch = self.batches.pop(0)
+        self.records.extend(batch)
+        return batch
+
+    def latest(self):
+        return self.records[-1] if self.records else None
+
+
+def build(latest, previous):
+    count = previous['count'] if previous else 0
+    return {'count': count + 1, 'roll': latest['roll']}
+
+
+def test_store_publishes_and_caches(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot.json'))
+    assert store.read() is None
+    store.publish({'roll': 1.0})
+    first = store.read()
+    assert first == {'roll': 1.0}
+    # Unchanged file: the parsed snapshot is reused
+    assert store.read() is first
+    other = SnapshotStore(store.path)
+    other.publish({'roll': 2.0})
+    assert store.read() == {'roll': 2.0}
+    assert store.publishes == 1
+
+
+def test_publish_once_skips_ticks_without_records(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot.json'))
+    ingested = []
+    publisher = SnapshotPublisher(store, FakeReader([[{'roll': 1.0}, {'roll': 2.0}], []]),
+                                  build, ingest=ingested.extend)
+    assert publisher.publish_once() == {'count': 1, 'roll': 2.0}
+    assert publisher.publish_once() is None
+    assert ingested == [{'roll': 1.0}, {'roll': 2.0}]
+    assert store.read() == {'count': 1, 'roll': 2.0}
+
+
+def test_only_one_publisher_leads(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    first = SnapshotPublisher(SnapshotStore(path), FakeReader(), build)
+    second = SnapshotPublisher(SnapshotStore(path), FakeReader(), build)
+    try:
+        assert first._try_lead()
+        assert first.is_leader and first.store.local_publisher
+        # flock is held per open file, so the second publisher is locked out
+        assert not second._try_lead()
+        assert not second.is_leader and not second.store.local_publisher
+    finally:
+        first._lock_file.close()
+        second._lock_file.close()
+
+
+def test_follower_takes_over_from_the_last_snapshot(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    leader = SnapshotPublisher(SnapshotStore(path), FakeReader([[{'roll': 1.0}]]), build)
+    follower = SnapshotPublisher(SnapshotStore(path), FakeReader([[{'roll': 5.0}]]), build)
+    try:
+        assert leader._try_lead()
+        leader.publish_once()
+        assert not follower._try_lead()
+        # The leader exiting releases its lock
+        leader._lock_file.close()
+        assert follower._try_lead()
+        assert follower.previous == {'count': 1, 'roll': 1.0}
+        assert follower.publish_once() == {'count': 2, 'roll': 5.0}
+    finally:
+        follower._lock_file.close()
+
+
+def test_publisher_thread_publishes_until_stopped(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshot.json'))
+    publisher = SnapshotPublisher(store, FakeReader([[{'roll': 3.0}]]), build, interval=0.01)
+    publisher.start()
+    try:
+        with store.published:
+            assert store.published.wait_for(lambda: store.publishes, timeout=5)
+    finally:
+        publisher.stop()
+        publisher.join(timeout=5)
+    assert not publisher.is_alive()
+    assert store.read() == {'count': 1, 'roll': 3.0}
+    publisher._lock_file.close()
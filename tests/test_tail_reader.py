@@ -0,0 +1,83 @@
+import json
+import os
+
+from tail_reader import TailReader
+
+
+def write(path, *records, mode='a'):
+    with open(path, mode) as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def test_poll_returns_only_new_records(tmp_path):
+    path = str(tmp_path / 'log.txt')
+    write(path, {'seq': 1}, {'seq': 2})
+    reader = TailReader(path)
+    assert [r['seq'] for r in reader.poll()] == [1, 2]
+    assert reader.poll() == []
+    write(path, {'seq': 3})
+    assert [r['seq'] for r in reader.poll()] == [3]
+    assert reader.latest() == {'seq': 3}
+
+
+def test_partial_record_waits_for_the_rest(tmp_path):
+    path = str(tmp_path / 'log.txt')
+    with open(path, 'w') as f:
+        f.write('{"seq": 1}\n{"seq": ')
+    reader = TailReader(path)
+    assert [r['seq'] for r in reader.poll()] == [1]
+    with open(path, 'a') as f:
+        f.write('2}\n')
+    assert [r['seq'] for r in reader.poll()] == [2]
+    assert reader.parse_errors == 0
+
+
+def test_attach_skips_to_the_tail_and_resyncs(tmp_path):
+    path = str(tmp_path / 'log.txt')
+    write(path, *({'seq': i, 'pad': 'x' * 40} for i in range(100)))
+    reader = TailReader(path, max_records=5, backlog_bytes=200)
+    records = reader.poll()
+    # Only whole records from the tail, starting after the cut-off one
+    assert records and records[-1]['seq'] == 99
+    assert [r['seq'] for r in records] == list(range(records[0]['seq'], 100))
+    assert reader.parse_errors == 0
+
+
+def test_truncation_clears_the_window(tmp_path):
+    path = str(tmp_path / 'log.txt')
+    write(path, {'seq': 1}, {'seq': 2})
+    reader = TailReader(path)
+    reader.poll()
+    write(path, {'seq': 10}, mode='w')
+    assert [r['seq'] for r in reader.poll()] == [10]
+    assert list(reader.records) == [{'seq': 10}]
+
+
+def test_rotation_finishes_the_old_file_first(tmp_path):
+    path = str(tmp_path / 'log.txt')
+    write(path, {'seq': 1})
+    reader = TailReader(path)
+    reader.poll()
+    # Written just before the rotation, after the last poll
+    write(path, {'seq': 2})
+    os.rename(path, str(tmp_path / 'log.1.txt'))
+    write(path, {'seq': 3})
+    assert [r['seq'] for r in reader.poll()] == [2, 3]
+    write(path, {'seq': 4})
+    assert [r['seq'] for r in reader.poll()] == [4]
+
+
+def test_missing_file_returns_nothing(tmp_path):
+    reader = TailReader(str(tmp_path / 'missing.txt'))
+    assert reader.poll() == []
+    assert reader.latest() is None
+
+
+def test_malformed_record_is_skipped(tmp_path):
+    path = str(tmp_path / 'log.txt')
+    with open(path, 'w') as f:
+        f.write('{"seq": 1}\n{"seq": oops}\n{"seq": 3}\n')
+    reader = TailReader(path)
+    assert [r['seq'] for r in reader.poll()] == [1, 3]
+    assert reader.parse_errors == 1
@@ -0,0 +1,85 @@
+import gzip
+import os
+import shutil
+
+from telemetry_log import INDEX_ENTRY, TelemetryLogReader, TelemetryLogWriter, iter_legacy_records
+
+
+def write_log(path, count=100, start=1000.0, step=0.1, index_interval=1.0):
+    writer = TelemetryLogWriter(path, index_interval=index_interval)
+    for i in range(count):
+        writer.append({'seq': i}, start + i * step)
+    writer.close()
+
+
+def test_read_range_returns_the_window(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    write_log(path)
+    records = list(TelemetryLogReader(path).read_range(1002.0, 1003.0))
+    assert [r['seq'] for r in records] == list(range(20, 31))
+    assert list(TelemetryLogReader(path).read_range(None, 1000.15))[-1]['seq'] == 1
+    assert len(list(TelemetryLogReader(path))) == 100
+
+
+def test_index_seeks_close_to_the_start_of_the_window(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    write_log(path)
+    assert os.path.getsize(path + '.idx') // INDEX_ENTRY.size == 10
+    reader = TelemetryLogReader(path)
+    offset = reader._find_offset(1005.05)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        first = f.readline()
+    # The entry at or before the window, one index interval at most
+    assert b'"seq": 50' in first
+    assert reader._find_offset(999.0) == 0
+
+
+def test_read_range_without_index_scans(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    write_log(path)
+    os.remove(path + '.idx')
+    assert [r['seq'] for r in TelemetryLogReader(path).read_range(1002.0, 1002.2)] == [20, 21, 22]
+
+
+def test_compressed_log_is_scanned(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    write_log(path)
+    with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    records = list(TelemetryLogReader(path + '.gz').read_range(1002.0, 1002.2))
+    assert [r['seq'] for r in records] == [20, 21, 22]
+
+
+def test_read_last_and_last_timestamp(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    write_log(path)
+    reader = TelemetryLogReader(path)
+    assert reader.last_timestamp(block_size=16) == 1000.0 + 99 * 0.1
+    assert [r['seq'] for r in reader.read_last(0.25)] == [97, 98, 99]
+
+
+def test_writer_resumes_index_and_legacy_logs(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    with open(path, 'w') as f:
+        f.write('{"seq": -2, "timestamp": 990.0}{"seq": -1, "timestamp": 991.0}')
+    write_log(path, count=20)
+    # A fresh line was started after the concatenated records
+    records = list(iter_legacy_records(path))
+    assert [r['seq'] for r in records] == [-2, -1] + list(range(20))
+    entries = os.path.getsize(path + '.idx') // INDEX_ENTRY.size
+    write_log(path, count=5, start=1002.0)
+    # Resuming continues after the last index entry instead of indexing every record
+    assert os.path.getsize(path + '.idx') // INDEX_ENTRY.size == entries + 1
+    assert [r['seq'] for r in TelemetryLogReader(path).read_range(1002.0, 1002.5)] == [0, 1, 2, 3, 4]
+
+
+def test_receive_time_wins_over_the_payload_timestamp(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    writer = TelemetryLogWriter(path)
+    for i in range(30):
+        # Drone clock that jumped back
+        writer.append({'seq': i, 'timestamp': 5.0 - i}, 1000.0 + i * 0.1)
+    writer.close()
+    records = list(TelemetryLogReader(path).read_range(1001.0, 1001.2))
+    assert [(r['seq'], r['timestamp']) for r in records] == [(10, 1001.0), (11, 1001.1), (12, 1001.2)]
@@ -0,0 +1,120 @@
+import math
+
+import pytest
+
+from telemetry_pipeline import (OscillationDetector, SaturationDetector, StagePipeline, StepResponse,
+                                default_stages)
+
+DT = 0.01
+
+
+class ListWriter:
+    def __init__(self):
+        self.records = []
+
+    def submit(self, record, timestamp):
+        self.records.append(record)
+
+
+def run(stage, values, channel='pid_x', start=0.0):
+    events = []
+    for i, value in enumerate(values):
+        events += stage.process(start + i * DT, {channel: value}) or []
+    return events
+
+
+def test_saturation_windup_starts_and_ends():
+    stage = SaturationDetector(channels=('pid_x',), limit=100.0, windup_time=0.5)
+    # 0.2 s free, 1 s pinned at the limit, then back off it
+    events = run(stage, [10.0] * 20 + [100.0] * 100 + [20.0] * 10)
+    assert [event['event'] for event in events] == ['windup_start', 'windup_end']
+    start, end = events
+    assert start['since'] == pytest.approx(0.2) and start['sign'] == 1
+    assert end['duration'] == pytest.approx(1.0)
+    assert stage.summary()['windups'] == 1
+
+
+def test_saturation_sign_flip_is_not_windup():
+    stage = SaturationDetector(channels=('pid_x',), limit=100.0, windup_time=0.5)
+    # Bang-bang between the limits never stays on one side for 0.5 s
+    events = run(stage, [100.0 if (i // 30) % 2 else -100.0 for i in range(300)])
+    assert events == []
+    assert stage.summary()['channels']['pid_x']['saturated_fraction'] == 1.0
+
+
+def test_oscillation_frequency_of_a_sine():
+    stage = OscillationDetector(channels=('pid_x',), size=128, threshold=5.0)
+    frequency = 5.0
+    events = run(stage, [20.0 * math.sin(2 * math.pi * frequency * i * DT) for i in range(512)])
+    [event] = events
+    assert event['event'] == 'oscillation'
+    # Within one DFT bin (1 / (size * DT) Hz)
+    resolution = 1 / (128 * DT)
+    assert abs(event['frequency_hz'] - frequency) <= resolution
+    assert abs(stage.summary()['pid_x']['frequency_hz'] - frequency) <= resolution
+    assert 10.0 < stage.summary()['pid_x']['amplitude'] <= 20.0
+
+
+def test_step_is_not_an_oscillation():
+    stage = OscillationDetector(channels=('pid_x',), size=128, threshold=5.0)
+    assert run(stage, [0.0] * 200 + [50.0] * 300) == []
+
+
+def step_response_samples():
+    """Ramp to 12 in 0.1 s, hold 12 until 0.3 s, then settle at 10"""
+    for k in range(1, 201):
+        t = k * DT
+        yield t, 12.0 * t / 0.1 if t <= 0.1 + 1e-9 else 12.0 if t <= 0.3 + 1e-9 else 10.0
+
+
+def test_step_response_rise_overshoot_and_settling():
+    stage = StepResponse(channels=('pid_x',), window=2.0)
+    for i in range(50):
+        stage.process(i * DT, {'pid_x': 0.01 if i % 2 else -0.01})
+    started = 1.0
+    assert stage.on_command(started, {'pid_values': {}}) is None
+    events = []
+    for t, value in step_response_samples():
+        events += stage.process(started + t, {'pid_x': value}) or []
+    [result] = events
+    assert result['event'] == 'step_response' and not result['interrupted']
+    channel = result['channels']['pid_x']
+    assert channel['change'] == pytest.approx(10.0, abs=1e-3)
+    # 10 % at 0.01 s (1.2), 90 % at 0.08 s (9.6)
+    assert channel['rise_time'] == pytest.approx(0.07)
+    assert channel['overshoot_pct'] == pytest.approx(20.0, abs=0.01)
+    # Last sample outside the 5 % band is at 0.30 s
+    assert channel['settling_time'] == pytest.approx(0.31)
+    assert stage.summary() == {'measuring': False, 'last': result}
+
+
+def test_new_command_interrupts_the_step_response():
+    stage = StepResponse(channels=('pid_x',), window=2.0)
+    for i in range(50):
+        stage.process(i * DT, {'pid_x': 0.0})
+    stage.on_command(1.0, {})
+    for t, value in list(step_response_samples())[:50]:
+        stage.process(1.0 + t, {'pid_x': value})
+    [result] = stage.on_command(1.6, {})
+    assert result['interrupted'] and result['duration'] == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize('workers', [0, 1, 2])
+def test_pipeline_runs_heavy_stages_with_any_worker_count(workers):
+    writer = ListWriter()
+    stages = default_stages({'fft_size': 128})
+    pipeline = StagePipeline(stages, writer, workers=workers, summary_interval=60.0)
+    assert len(pipeline.workers) == min(workers, 1)
+    pipeline.start()
+    for i in range(512):
+        pipeline.feed({'pid_x': 20.0 * math.sin(2 * math.pi * 5.0 * i * DT)}, i * DT)
+    pipeline.stop()
+    events = [record for record in writer.records if record['type'] == 'event']
+    assert [event['stage'] for event in events] == ['oscillation']
+    assert pipeline.stats()['records'] == 512 and pipeline.stats()['dropped'] == 0
+    assert writer.records[-1]['type'] == 'summary'
+
+
+def test_negative_worker_count_is_rejected():
+    with pytest.raises(ValueError, match='workers'):
+        StagePipeline(default_stages({}), workers=-1)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from timeseries_store import TimeSeriesStore, lttb
+
+
+def records(start, count, step=0.01):
+    return [{'timestamp': 1000.0 + i * step, 'roll': float(i % 100), 'pitch': -float(i)}
+            for i in range(start, start + count)]
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[500] = 10.0
+    y[750] = -5.0
+    selected = lttb(x, y, 50)
+    assert len(selected) == 50
+    assert selected[0] == 0 and selected[-1] == 999
+    assert 500 in selected and 750 in selected
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_lttb_per_column_and_short_input():
+    x = np.arange(100, dtype=float)
+    y = np.zeros((100, 2))
+    y[10, 0] = 1.0
+    y[90, 1] = 1.0
+    selected = lttb(x, y, 10)
+    assert selected.shape == (10, 2)
+    assert 10 in selected[:, 0] and 90 in selected[:, 1]
+    np.testing.assert_array_equal(lttb(x[:5], y[:5, 0], 10), np.arange(5))
+
+
+def test_query_picks_the_level_for_the_range():
+    store = TimeSeriesStore(capacity=4096, factor=16, levels=3)
+    store.extend(records(0, 4096 * 4))
+    oldest, newest = store.span(0)
+    # Raw samples when they fit
+    result, level = store.query(['roll'], newest - 0.5, newest, max_points=100)
+    assert level == 0 and len(result['roll'][0]) == 51
+    # LTTB over raw samples for a moderately larger range
+    result, level = store.query(['roll'], newest - 10.0, newest, max_points=100)
+    assert level == 0 and len(result['roll'][0]) == 100
+    # Envelopes from an aggregated level once the raw ring no longer covers the range
+    result, level = store.query(['roll', 'pitch'], None, None, max_points=100)
+    assert level == 1
+    times, values = result['pitch']
+    assert len(times) == len(values) <= 100
+    # Min/max envelopes keep the extremes of every bucket
+    assert (values.min(), values.max()) == (-(4096 * 4 - 1), 0.0)
+    assert (result['roll'][1].min(), result['roll'][1].max()) == (0.0, 99.0)
+
+
+def test_reopened_store_skips_the_replayed_backlog(tmp_path):
+    path = str(tmp_path / 'history')
+    store = TimeSeriesStore(path, capacity=4096)
+    batch = records(0, 1000)
+    store.extend(batch)
+    del store
+    store = TimeSeriesStore(path, capacity=4096)
+    # The tail reader replays its backlog after a restart
+    store.extend(batch[-200:] + records(1000, 10))
+    assert list(store.state[0]) == [1010, 1010]
+    assert store.skipped == 200
+    times = store.times[0][:1010]
+    assert np.all(np.diff(times) > 0)
+    reader = TimeSeriesStore(path, writable=False)
+    result, _ = reader.query(['pitch'], 1000.0 + 995 * 0.01, 1000.0 + 1005 * 0.01)
+    np.testing.assert_array_equal(result['pitch'][1], -np.arange(995, 1006, dtype=np.float32))
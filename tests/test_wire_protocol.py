@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import wire_protocol
+
+SAMPLE = {'roll': 1.5, 'pitch': -2.0, 'throttle': 50.0, 'yaw': 0.25, 'pid_x': 0.1, 'pid_y': 0.2, 'pid_z': 0.3,
+          'pid_yaw': 0.4, 'position': [1.0, 2.0, 3.0], 'orientation': [0.0, 0.0, 0.0, 1.0]}
+
+
+def test_telemetry_round_trip():
+    data = wire_protocol.encode_telemetry(SAMPLE, seq=7, timestamp=1000.5)
+    assert wire_protocol.message_type(data) == wire_protocol.TELEMETRY
+    assert wire_protocol.decode_telemetry(data) == {**SAMPLE, 'seq': 7, 'sent_at': 1000.5}
+
+
+def test_missing_telemetry_fields_stay_missing():
+    sample = {'roll': 1.0, 'position': [1.0, 2.0]}
+    record = wire_protocol.decode_telemetry(wire_protocol.encode_telemetry(sample, 1))
+    # A vector of the wrong length is not sent
+    assert record == {'roll': 1.0, 'seq': 1, 'sent_at': 0.0}
+
+
+def test_command_round_trip():
+    command = {'pid_values': {'P': {'roll': 1.0, 'yaw': 2.0}, 'D': {'throttle': 0.5}}}
+    data = wire_protocol.encode_command(command, seq=3)
+    assert wire_protocol.message_type(data) == wire_protocol.COMMAND
+    assert wire_protocol.decode_command(data) == {**command, 'seq': 3}
+
+
+def test_ack_and_hello_round_trip():
+    assert wire_protocol.decode_ack(wire_protocol.encode_ack(9)) == {'status': 'ok', 'seq': 9}
+    assert wire_protocol.decode_ack(wire_protocol.encode_ack(9, ok=False))['status'] == 'error'
+    hello = wire_protocol.encode_hello()
+    assert wire_protocol.message_type(hello) == wire_protocol.HELLO
+    assert wire_protocol.decode_hello(hello) == wire_protocol.VERSION
+
+
+def test_json_is_not_a_binary_message():
+    assert wire_protocol.message_type(json.dumps(SAMPLE).encode()) is None
+    assert wire_protocol.message_type(b'DT') is None
+
+
+def test_malformed_messages_are_rejected():
+    data = wire_protocol.encode_telemetry(SAMPLE)
+    ack = wire_protocol.encode_ack(1)
+    with pytest.raises(ValueError):
+        wire_protocol.decode_telemetry(data[:-1])
+    with pytest.raises(ValueError):
+        # Wrong message type
+        wire_protocol.decode_ack(ack[:3] + bytes([wire_protocol.COMMAND]) + ack[4:])
+    with pytest.raises(ValueError):
+        # Unsupported version
+        wire_protocol.decode_ack(ack[:2] + bytes([99]) + ack[3:])
+    with pytest.raises(ValueError):
+        wire_protocol.decode_hello(data[:4])
+
+
+def test_negotiate():
+    assert wire_protocol.negotiate([1, 2]) == 1
+    assert wire_protocol.negotiate([2]) is None
+    assert wire_protocol.negotiate(None) is None
+    assert wire_protocol.negotiate(5) is None
@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from columnar_store import flatten_record
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+STATE_FILE = 'state.i8'
+
+# Channels kept for history views; position and orientation are per axis
+CHANNELS = (
+    'roll', 'pitch', 'throttle', 'yaw',
+    'pid_x', 'pid_y', 'pid_z', 'pid_yaw',
+    'position_x', 'position_y', 'position_z',
+    'orientation_x', 'orientation_y', 'orientation_z', 'orientation_w',
+)
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Return the indices of the ``n_out`` points kept, one column per column of
+    ``y``; all columns are processed in the same pass over the buckets.
+    """
+    y = np.asarray(y)
+    flat = y.ndim == 1
+    if flat:
+        y = y[:, None]
+    n, width = y.shape
+    if n_out >= n or n_out < 3:
+        selected = np.repeat(np.arange(n)[:, None], width, axis=1)
+        return selected[:, 0] if flat else selected
+    # n_out - 2 buckets between the first and the last point, which are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)[:, None]
+    filled = np.nan_to_num(y)
+    next_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1]) / counts[:, 0], x[n - 1])[1:]
+    next_y = np.vstack([np.add.reduceat(filled[:n - 1], edges[:-1], axis=0) / counts, filled[n - 1:]])[1:]
+
+    selected = np.zeros((n_out, width), dtype=np.int64)
+    selected[-1] = n - 1
+    columns = np.arange(width)
+    a = selected[0]
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        xa, ya = x[a], filled[a, columns]
+        # Keep the point forming the largest triangle with the previously
+        # kept point and the average of the next bucket
+        area = np.abs((xa - next_x[i]) * (filled[start:end] - ya) - (xa - x[start:end, None]) * (next_y[i] - ya))
+        a = start + np.argmax(area, axis=0)
+        selected[i + 1] = a
+    return selected[:, 0] if flat else selected
+
+
+class TimeSeriesStore:
+    """Fixed-memory, multi-resolution history of the telemetry channels.
+
+    Level 0 is a ring of raw samples. Each further level is a ring of
+    min/max buckets aggregating ``factor`` entries of the level below, so
+    with the defaults level 1 holds 16x and level 2 256x the time span of
+    the raw ring in the same memory. ``query`` serves any time range with
+    at most ``max_points`` points per channel: raw samples when they fit,
+    LTTB-downsampled raw samples for moderately larger ranges, and min/max
+    envelopes from the coarsest needed level beyond that.
+
+    With a ``path`` the rings are memory-mapped files there, so one process
+    can write the store while others open it read-only and query it.
+    """
+
+    def __init__(self, path=None, channels=CHANNELS, capacity=65536, factor=16, levels=3, writable=True):
+        self.path = path
+        if path is not None and not writable:
+            with open(os.path.join(path, META_FILE)) as f:
+                meta = json.load(f)
+            channels, capacity, factor, levels = (
+                meta['channels'], meta['capacity'], meta['factor'], meta['levels'])
+        self.channels = list(channels)
+        self.index = {name: i for i, name in enumerate(self.channels)}
+        self.capacity = capacity
+        self.factor = factor
+        self.levels = levels
+        self.writable = writable
+
+        mode = 'r' if not writable else self._layout_mode()
+        width = len(self.channels)
+        self.state = self._array(STATE_FILE, np.int64, (levels, 2), mode)
+        self.times = [self._array(f'times{k}.f8', np.float64, (capacity,), mode) for k in range(levels)]
+        self.lo = [self._array(f'lo{k}.f4', np.float32, (capacity, width), mode) for k in range(levels)]
+        # Raw samples have no spread, so level 0 only stores one value per channel
+        self.hi = [self.lo[0]] + [self._array(f'hi{k}.f4', np.float32, (capacity, width), mode)
+                                  for k in range(1, levels)]
+        if mode == 'w+':
+            # Readers wait for meta.json, so write it once the rings exist
+            with open(os.path.join(path, META_FILE), 'w') as f:
+                json.dump(dict(self._meta(), created=time.time()), f)
+
+        self.skipped = 0
+        # Buckets being filled for each aggregated level (writer only)
+        self._acc_count = [0] * levels
+        self._acc_time = [0.0] * levels
+        self._acc_lo = [np.full(width, np.nan, dtype=np.float32) for _ in range(levels)]
+        self._acc_hi = [np.full(width, np.nan, dtype=np.float32) for _ in range(levels)]
+
+    def _meta(self):
+        return {'channels': self.channels, 'capacity': self.capacity,
+                'factor': self.factor, 'levels': self.levels}
+
+    def _layout_mode(self):
+        if self.path is None:
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        meta = self._meta()
+        try:
+            with open(os.path.join(self.path, META_FILE)) as f:
+                existing = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            existing = None
+        if existing is not None and {k: existing.get(k) for k in meta} == meta:
+            # Same layout: keep the history recorded so far
+            return 'r+'
+        logger.info(f"Starting a new telemetry history in {self.path}")
+        # Unlink rather than truncate, readers may still map the old files
+        for name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, name))
+        return 'w+'
+
+    def _array(self, name, dtype, shape, mode):
+        if self.path is None:
+            return np.full(shape, np.nan if dtype != np.int64 else 0, dtype=dtype)
+        array = np.memmap(os.path.join(self.path, name), dtype=dtype, mode=mode, shape=shape)
+        if mode == 'w+' and dtype != np.int64:
+            array.fill(np.nan)
+        return array
+
+    def row(self, record):
+        """Convert a flattened telemetry row into a channel vector"""
+        values = np.full(len(self.channels), np.nan, dtype=np.float32)
+        for name, value in record.items():
+            i = self.index.get(name)
+            if i is not None:
+                try:
+                    values[i] = value
+                except (TypeError, ValueError):
+                    pass
+        return values
+
+    def extend(self, records):
+        """Append telemetry records (dicts with a ``timestamp``).
+
+        Records no newer than the newest stored sample are skipped: a tail
+        reader replays its backlog when the dashboard restarts, and the
+        rings must stay sorted for ``_select``.
+        """
+        newest = self.span(0)[1]
+        for record in records:
+            timestamp = record.get('timestamp', time.time())
+            if newest is not None and timestamp <= newest:
+                self.skipped += 1
+                continue
+            newest = timestamp
+            self.append(timestamp, self.row(flatten_record(record, timestamp)))
+
+    def append(self, timestamp, values):
+        self._push(0, timestamp, values, values)
+
+    def _push(self, level, timestamp, lo, hi):
+        head, count = self.state[level]
+        self.times[level][head] = timestamp
+        self.lo[level][head] = lo
+        if level > 0:
+            self.hi[level][head] = hi
+        # Publish the entry only after its data is in place
+        self.state[level] = ((head + 1) % self.capacity, min(count + 1, self.capacity))
+
+        upper = level + 1
+        if upper >= self.levels:
+            return
+        if self._acc_count[upper] == 0:
+            self._acc_time[upper] = timestamp
+            self._acc_lo[upper][:] = lo
+            self._acc_hi[upper][:] = hi
+        else:
+            np.fmin(self._acc_lo[upper], lo, out=self._acc_lo[upper])
+            np.fmax(self._acc_hi[upper], hi, out=self._acc_hi[upper])
+        self._acc_count[upper] += 1
+        if self._acc_count[upper] == self.factor:
+            self._acc_count[upper] = 0
+            bucket_time = (self._acc_time[upper] + timestamp) / 2
+            self._push(upper, bucket_time, self._acc_lo[upper].copy(), self._acc_hi[upper].copy())
+
+    def _segments(self, level):
+        head, count = (int(v) for v in self.state[level])
+        if count < self.capacity:
+            return [(0, count)]
+        return [(head, self.capacity), (0, head)]
+
+    def span(self, level=None):
+        """Return (oldest, newest) timestamps held at ``level`` (default: whole store)"""
+        levels = range(self.levels) if level is None else [level]
+        oldest, newest = None, None
+        for k in levels:
+            segments = [(a, b) for a, b in self._segments(k) if b > a]
+            if not segments:
+                continue
+            first, last = self.times[k][segments[0][0]], self.times[k][segments[-1][1] - 1]
+            oldest = first if oldest is None else min(oldest, first)
+            newest = last if newest is None else max(newest, last)
+        return oldest, newest
+
+    def _select(self, level, t0, t1):
+        parts = []
+        for a, b in self._segments(level):
+            times = self.times[level][a:b]
+            i = a + int(np.searchsorted(times, t0, side='left'))
+            j = a + int(np.searchsorted(times, t1, side='right'))
+            if j > i:
+                parts.append((i, j))
+        if not parts:
+            return np.empty(0), np.empty((0, len(self.channels))), np.empty((0, len(self.channels)))
+        times = np.concatenate([self.times[level][i:j] for i, j in parts])
+        lo = np.concatenate([self.lo[level][i:j] for i, j in parts])
+        hi = np.concatenate([self.hi[level][i:j] for i, j in parts])
+        return times, lo, hi
+
+    def query(self, channels, t0=None, t1=None, max_points=1000, lttb_factor=20):
+        """Return ({channel: (times, values)}, level) for the range t0..t1"""
+        oldest, newest = self.span()
+        if oldest is None:
+            return {name: (np.empty(0), np.empty(0)) for name in channels}, 0
+        t0 = oldest if t0 is None else t0
+        t1 = newest if t1 is None else t1
+        columns = [self.index[name] for name in channels]
+
+        for level in range(self.levels):
+            # A level that never wrapped still holds everything since the start
+            level_oldest, _ = self.span(level)
+            covers = self.state[level][1] < self.capacity or (level_oldest is not None and level_oldest <= t0)
+            is_last = level == self.levels - 1
+            if not covers and not is_last:
+                continue
+            times, lo, hi = self._select(level, t0, t1)
+            if level == 0:
+                if len(times) <= max_points:
+                    return {name: (times, lo[:, c]) for name, c in zip(channels, columns)}, 0
+                if len(times) <= max_points * lttb_factor:
+                    selected = lttb(times, lo[:, columns], max_points)
+                    return {name: (times[selected[:, j]], lo[selected[:, j], c])
+                            for j, (name, c) in enumerate(zip(channels, columns))}, 0
+                if not is_last:
+                    continue
+            return self._envelope(times, lo, hi, channels, columns, max_points), level
+
+    def _envelope(self, times, lo, hi, channels, columns, max_points):
+        """Draw each bucket as a vertical min-max segment, merging buckets to fit ``max_points``"""
+        buckets = max(1, max_points // 2)
+        if len(times) > buckets:
+            starts = np.linspace(0, len(times), buckets, endpoint=False).astype(np.int64)
+            times = times[starts]
+            lo = np.fmin.reduceat(lo, starts, axis=0)
+            hi = np.fmax.reduceat(hi, starts, axis=0)
+        envelope_times = np.repeat(times, 2)
+        result = {}
+        for name, c in zip(channels, columns):
+            values = np.empty(2 * len(times), dtype=lo.dtype)
+            values[0::2] = lo[:, c]
+            values[1::2] = hi[:, c]
+            result[name] = (envelope_times, values)
+        return result
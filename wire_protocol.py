@@ -0,0 +1,145 @@
+"""Binary encoding of telemetry, PID commands and confirmations.
+
+Every message starts with a fixed header: magic ``DT``, protocol version,
+message type, sequence number and a float64 timestamp. The body layout is
+fixed per message type and version. A JSON datagram always starts with
+``{``, so both encodings can share a socket and be told apart by the first
+bytes.
+
+The encoding is negotiated: the recorder lists the versions it supports in
+its JSON subscribe message, and a drone that speaks one of them answers
+with a HELLO message carrying the chosen version. Firmware that does not
+know the protocol ignores the extra key and keeps sending JSON, so
+commands stay JSON as well.
+"""
+import math
+import struct
+
+MAGIC = b'DT'
+VERSION = 1
+# Versions this code can decode, offered in the subscribe message
+SUPPORTED_VERSIONS = (1,)
+
+# Message types
+HELLO = 1
+TELEMETRY = 2
+COMMAND = 3
+ACK = 4
+
+# magic, version, message type, sequence number, timestamp
+HEADER = struct.Struct('<2sBBId')
+HEADER_FIELDS = 5
+
+TELEMETRY_FIELDS = ('roll', 'pitch', 'throttle', 'yaw', 'pid_x', 'pid_y', 'pid_z', 'pid_yaw')
+TELEMETRY_VECTORS = (('position', 3), ('orientation', 4))
+TELEMETRY_BODY = struct.Struct('<' + 'd' * (len(TELEMETRY_FIELDS) + sum(n for _, n in TELEMETRY_VECTORS)))
+TELEMETRY_MESSAGE = struct.Struct(HEADER.format + TELEMETRY_BODY.format[1:])
+
+PID_TERMS = ('P', 'I', 'D')
+PID_AXES = ('roll', 'pitch', 'throttle', 'yaw')
+COMMAND_MESSAGE = struct.Struct(HEADER.format + 'd' * (len(PID_TERMS) * len(PID_AXES)))
+
+# Status byte of an ACK: 0 is ok
+ACK_MESSAGE = struct.Struct(HEADER.format + 'B')
+HELLO_MESSAGE = HEADER
+
+NAN = float('nan')
+
+
+def message_type(data):
+    """Return the type of a binary message, or None for anything else (e.g. JSON)"""
+    if len(data) < HEADER.size or data[:2] != MAGIC:
+        return None
+    return data[3]
+
+
+def negotiate(offered):
+    """Pick the highest version both sides support, or None to stay on JSON"""
+    try:
+        common = set(offered or ()) & set(SUPPORTED_VERSIONS)
+    except TypeError:
+        return None
+    return max(common) if common else None
+
+
+def _check_header(data, expected_type, message):
+    if len(data) != message.size:
+        raise ValueError(f"Expected a {message.size} byte message, got {len(data)} bytes")
+    magic, version, msg_type, seq, timestamp = HEADER.unpack_from(data)
+    if magic != MAGIC or version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported protocol version {version}")
+    if msg_type != expected_type:
+        raise ValueError(f"Expected message type {expected_type}, got {msg_type}")
+    return seq, timestamp
+
+
+def encode_hello(version=VERSION, timestamp=0.0):
+    return HELLO_MESSAGE.pack(MAGIC, version, HELLO, 0, timestamp)
+
+
+def decode_hello(data):
+    """Return the version a HELLO message agrees on"""
+    if len(data) < HEADER.size or data[:2] != MAGIC or data[3] != HELLO:
+        raise ValueError("Not a HELLO message")
+    return data[2]
+
+
+def encode_telemetry(sample, seq=0, timestamp=0.0):
+    """Pack a telemetry dict; fields it does not have are sent as NaN"""
+    values = [sample.get(name, NAN) for name in TELEMETRY_FIELDS]
+    for name, size in TELEMETRY_VECTORS:
+        vector = sample.get(name)
+        values.extend(vector if vector is not None and len(vector) == size else (NAN,) * size)
+    return TELEMETRY_MESSAGE.pack(MAGIC, VERSION, TELEMETRY, seq, timestamp, *values)
+
+
+def decode_telemetry(data):
+    """Unpack a telemetry message into the dict the JSON firmware sends.
+
+    The header's sequence number and send time become ``seq`` and
+    ``sent_at``, the same tags the simulator adds to JSON telemetry.
+    """
+    seq, timestamp = _check_header(data, TELEMETRY, TELEMETRY_MESSAGE)
+    values = TELEMETRY_MESSAGE.unpack(data)[HEADER_FIELDS:]
+    # NaN marks a field the sender did not have (NaN != NaN)
+    record = {name: value for name, value in zip(TELEMETRY_FIELDS, values) if value == value}
+    i = len(TELEMETRY_FIELDS)
+    for name, size in TELEMETRY_VECTORS:
+        vector = values[i:i + size]
+        if all(v == v for v in vector):
+            record[name] = list(vector)
+        i += size
+    record['seq'] = seq
+    record['sent_at'] = timestamp
+    return record
+
+
+def encode_command(command, seq=0, timestamp=0.0):
+    """Pack a command dict as built by main.build_command; missing gains are sent as NaN"""
+    pid_values = command.get('pid_values', {})
+    values = [pid_values.get(term, {}).get(axis, NAN) for term in PID_TERMS for axis in PID_AXES]
+    return COMMAND_MESSAGE.pack(MAGIC, VERSION, COMMAND, seq, timestamp, *values)
+
+
+def decode_command(data):
+    """Unpack a command into ``{"pid_values": ..., "seq": seq}``, leaving out NaN gains"""
+    seq, _ = _check_header(data, COMMAND, COMMAND_MESSAGE)
+    values = iter(COMMAND_MESSAGE.unpack(data)[HEADER_FIELDS:])
+    pid_values = {}
+    for term in PID_TERMS:
+        for axis in PID_AXES:
+            value = next(values)
+            if not math.isnan(value):
+                pid_values.setdefault(term, {})[axis] = value
+    return {'pid_values': pid_values, 'seq': seq}
+
+
+def encode_ack(seq, ok=True, timestamp=0.0):
+    return ACK_MESSAGE.pack(MAGIC, VERSION, ACK, seq, timestamp, 0 if ok else 1)
+
+
+def decode_ack(data):
+    """Unpack a confirmation into the dict the JSON firmware sends"""
+    seq, _ = _check_header(data, ACK, ACK_MESSAGE)
+    status = ACK_MESSAGE.unpack(data)[HEADER_FIELDS]
+    return {'status': 'ok' if status == 0 else 'error', 'seq': seq}